@@ -63,7 +63,11 @@ class ExtendedSearch(object):
 
     def getFilmData(self, searchId):
         data = self._getModelById(self.searchId);
-        return self.database.extendedSearch(data)
+        rs = self.database.extendedSearch(data)
+        # without the first film of the next page
+        if data.getMaxResults() > 0:
+            rs = rs[:data.getMaxResults()]
+        return rs
 
     def show(self):
         """ populate UI with extended search elements """
@@ -75,9 +79,19 @@ class ExtendedSearch(object):
             self.plugin.setViewId(self.plugin.resolveViewId('MAIN'))
         elif self.action == "RUN":
             data = self._getModelById(self.searchId);
+            cursor = self.plugin.get_arg('cursor', None)
+            if cursor is None:
+                # usage count for the cache warm-up after updates
+                data.runs += 1
+                self._saveModel(data)
             # self.database.extendedSearchQuery(data, FilmUI(self.plugin))
             ui = FilmlistUi.FilmlistUi(self.plugin)
-            ui.generate(self.database.extendedSearch(data))
+            ui.generate(
+                self.database.extendedSearch(data, cursor),
+                {'mode': 'extendedSearchScreen', 'extendedSearchAction': 'RUN', 'searchId': self.searchId},
+                cursor,
+                data.getMaxResults()
+            )
 
         elif self.action == "NEW":
             (txt, confirm) = self.notifier.get_entered_text(heading=30419)
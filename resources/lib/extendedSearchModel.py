@@ -35,6 +35,9 @@ class ExtendedSearchModel(object):
         self.setMaxResults(self.settings.getMaxResults())
         self.recentOnly = 0
         self.when = self.id
+        self.runs = 0
+        # position of the requested page, not persisted
+        self.cursor = None
         #
         #
         """
@@ -55,6 +58,7 @@ class ExtendedSearchModel(object):
                     "exactMatchForShow" : 0
                     "recentOnly" : 0
                     "when" : 1312312
+                    "runs" : 0
                 }
             ]
         """
@@ -120,6 +124,9 @@ class ExtendedSearchModel(object):
     def isExactMatchForShow(self):
         return self.exactMatchForShow == 1
 
+    def getCursor(self):
+        return self.cursor
+
     def isRecentOnly(self):
         return self.recentOnly == 1
 
@@ -166,6 +173,11 @@ class ExtendedSearchModel(object):
     def getExactMatchForShowAsString(self):
         return str(self.exactMatchForShow)
 
+    def getCursorAsString(self):
+        if self.cursor is None:
+            return ''
+        return '{}:{}:{}'.format(self.cursor[0], self.cursor[1], self.cursor[2])
+
     def getRecentOnlyAsString(self):
         return str(self.recentOnly)
 
@@ -243,6 +255,9 @@ class ExtendedSearchModel(object):
     def setRecentOnly(self, pValue):
         self.recentOnly = 1 if self.convertToBoolean(pValue) else 0
 
+    def setCursor(self, pValue):
+        self.cursor = parseCursor(pValue)
+
     def setWhen(self, pValue):
         self.when = pValue
 
@@ -313,12 +328,25 @@ class ExtendedSearchModel(object):
         return sql
 
     #
-    def generateMaxRows(self):
+    def generateMaxRows(self, pOffset=False):
         sql = ""
         if (self.getMaxResults() > 0):
-            sql += 'LIMIT ' + self.getMaxResultsAsString()
+            # one more row tells whether there is a next page
+            sql += 'LIMIT %d' % (self.getMaxResults() + 1)
+            if pOffset and self.cursor is not None:
+                sql += ' OFFSET %d' % self.cursor[2]
         return sql
 
+    #
+    def generateCursor(self):
+        # keyset condition for the order by aired, idhash
+        sql = ""
+        params = []
+        if self.cursor is not None:
+            sql = "( aired <= ? AND ( aired < ? OR lower(hex(idhash)) < ? ) )"
+            params.extend([self.cursor[0], self.cursor[0], self.cursor[1]])
+        return (sql, params)
+
     #
     #
     #
@@ -378,6 +406,48 @@ class ExtendedSearchModel(object):
             sql += ')'
         return (sql, params)
 
+    #
+    def getFulltextTerms(self):
+        """ (column, term) pairs of the show, title and description search """
+        terms = []
+        if (len(self.getShow()) > 0 and not(self.isExactMatchForShow())):
+            terms.extend(('showname', conditionString) for conditionString in self.getShow())
+        terms.extend(('title', conditionString) for conditionString in self.getTitle())
+        terms.extend(('description', conditionString) for conditionString in self.getDescription())
+        return terms
+
+    #
+    def getFulltextExcludeTerms(self):
+        """ (column, term) pairs of the excluded titles and shows """
+        terms = []
+        for conditionString in self.getExcludeTitle():
+            terms.append(('title', conditionString))
+            terms.append(('showname', conditionString))
+        return terms
+
+    #
+    def generateFulltextMatch(self):
+        """
+        FTS5 query replacing `generateShowTitleDescription`. Every term
+        is a phrase matching word prefixes. Returns None if a term has
+        no searchable characters.
+        """
+        return self._generateFulltextQuery(self.getFulltextTerms())
+
+    #
+    def generateFulltextExclude(self):
+        """ FTS5 query replacing `generateExclude` """
+        return self._generateFulltextQuery(self.getFulltextExcludeTerms())
+
+    #
+    def _generateFulltextQuery(self, terms):
+        query = []
+        for (column, conditionString) in terms:
+            if not any(c.isalnum() for c in conditionString):
+                return None
+            query.append('%s : "%s"*' % (column, conditionString.replace('"', '""')))
+        return ' OR '.join(query)
+
     #
     def generateShow(self):
         sql = ""
@@ -399,7 +469,8 @@ class ExtendedSearchModel(object):
             sql += '( showId in ('
             for conditionString in self.getShowId():
                 sql += '?,'
-                params.append(conditionString)
+                # the showid is stored as the integer of its hex digits
+                params.append(int(conditionString, 16))
             sql = sql[0:-1]
             sql += '))'
         return (sql, params)
@@ -409,7 +480,7 @@ class ExtendedSearchModel(object):
         sql = ""
         params = []
         if (len(self.getShowStartLetter()) > 0):
-            sql += "( CASE WHEN UPPER(SUBSTR(showname,1,1)) between 'A' and 'Z' THEN UPPER(SUBSTR(showname,1,1)) WHEN SUBSTR(showname,1,1) between '0' and '9' THEN '0' ELSE '#' END in ("
+            sql += "( letter in ("
             for conditionString in self.getShowStartLetter():
                 sql += '?,'
                 params.append(conditionString)
@@ -434,7 +505,8 @@ class ExtendedSearchModel(object):
             'F' + self.getIgnoreTrailerAsString() + \
             'M' + self.getMaxResultsAsString() + \
             'N' + self.getExactMatchForShowAsString() + \
-            'R' + self.getRecentOnlyAsString()
+            'R' + self.getRecentOnlyAsString() + \
+            'P' + self.getCursorAsString()
 
     #
     def toDict(self):
@@ -452,7 +524,8 @@ class ExtendedSearchModel(object):
             "maxResults" : self.maxResults,
             "exactMatchForShow" : self.exactMatchForShow,
             "recentOnly" : self.recentOnly,
-            "when" : self.when
+            "when" : self.when,
+            "runs" : self.runs
             }
 
     def fromDict(self, aObject):
@@ -470,4 +543,32 @@ class ExtendedSearchModel(object):
         self.exactMatchForShow = aObject["exactMatchForShow"]
         self.recentOnly = aObject["recentOnly"]
         self.when = aObject["when"]
+        self.runs = aObject.get("runs", 0)
         return self
+
+
+def parseCursor(pValue):
+    """
+    Position of a page in a film list from its string form
+    "aired:idhash:offset" or None for the first page
+    """
+    if not pValue:
+        return None
+    (aired, idhash, offset) = pValue.split(':')
+    return (int(aired), idhash, int(offset))
+
+
+def getNextCursor(pCursor, pLastRow, pPageSize):
+    """
+    String form of the position after the last film of a page
+
+    Args:
+        pCursor(str): position of the page or None
+
+        pLastRow(list): last film of the page
+
+        pPageSize(int): films per page
+    """
+    cursor = parseCursor(pCursor)
+    offset = (cursor[2] if cursor is not None else 0) + pPageSize
+    return '{}:{}:{}'.format(pLastRow[6] or 0, pLastRow[0], offset)
@@ -6,6 +6,8 @@ Copyright 2017-2019, Leo Moll and Dominik Schlösser
 SPDX-License-Identifier: MIT
 """
 
+import resources.lib.mvutils as mvutils
+
 
 class Film(object):
     """ The film model class """
@@ -33,8 +35,9 @@ class Film(object):
         self.aired = pAired
         self.url_sub = pSub
         self.url_video = pVideo
-        self.url_video_sd = pVideo_sd
-        self.url_video_hd = pVideo_hd
+        # the database keeps these urls relative to the video url
+        self.url_video_sd = mvutils.make_url(pVideo, pVideo_sd)
+        self.url_video_hd = mvutils.make_url(pVideo, pVideo_hd)
 
     def get_as_dict(self):
         """ Returns the values as a map """
@@ -105,6 +105,38 @@ class UpdateApp():
             action='store',
             help='insert/update batch size'
         )
+        sqliteopts.add_argument(
+            '-s', '--stream',
+            default=False,
+            action='store_true',
+            help='decompress and import the update while downloading'
+        )
+        sqliteopts.add_argument(
+            '-w', '--workers',
+            default=0,
+            type=int,
+            action='store',
+            help='number of processes decoding the update (0 = no parallel decoding)'
+        )
+        sqliteopts.add_argument(
+            '--segments',
+            default=1,
+            type=int,
+            action='store',
+            help='number of parallel requests downloading the update'
+        )
+        sqliteopts.add_argument(
+            '--shadow',
+            default=False,
+            action='store_true',
+            help='import full updates into a new table and swap it in when complete'
+        )
+        sqliteopts.add_argument(
+            '--fulltext',
+            default=False,
+            action='store_true',
+            help='maintain a full-text index for the searches'
+        )
         sqliteopts.add_argument(
             '-p', '--path',
             dest='path',
@@ -152,6 +184,51 @@ class UpdateApp():
             action='store',
             help='insert/update batch size'
         )
+        mysqlopts.add_argument(
+            '-s', '--stream',
+            default=False,
+            action='store_true',
+            help='decompress and import the update while downloading'
+        )
+        mysqlopts.add_argument(
+            '-w', '--workers',
+            default=0,
+            type=int,
+            action='store',
+            help='number of processes decoding the update (0 = no parallel decoding)'
+        )
+        mysqlopts.add_argument(
+            '--segments',
+            default=1,
+            type=int,
+            action='store',
+            help='number of parallel requests downloading the update'
+        )
+        mysqlopts.add_argument(
+            '--shadow',
+            default=False,
+            action='store_true',
+            help='import full updates into a new table and swap it in when complete'
+        )
+        mysqlopts.add_argument(
+            '--fulltext',
+            default=False,
+            action='store_true',
+            help='maintain a full-text index for the searches'
+        )
+        mysqlopts.add_argument(
+            '--cext',
+            default=False,
+            action='store_true',
+            help='use the C extension of the MySQL connector if available'
+        )
+        mysqlopts.add_argument(
+            '--nobulk',
+            dest='bulk',
+            default=True,
+            action='store_false',
+            help='import without LOAD DATA LOCAL INFILE and staging table'
+        )
         mysqlopts.add_argument(
             '-H', '--host',
             dest='host',
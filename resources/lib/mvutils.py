@@ -23,10 +23,8 @@ from functools import reduce
 try:
     # Python 3.x
     from urllib.parse import urlencode
-    from urllib.request import urlopen
 except ImportError:
     from urllib import urlencode
-    from urllib2 import urlopen
 
 from contextlib import closing
 from resources.lib.exceptions import ExitRequested
@@ -230,6 +228,23 @@ def make_duration(val):
     return int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
 
 
+def make_url(url_video, val):
+    """
+    Expands the compact "<prefixlen>|<suffix>" url notation
+    of the Filmliste relative to the video url. Other values
+    are returned unchanged.
+
+    Args:
+        url_video(str): the full video url
+
+        val(str): the compact or full url
+    """
+    parts = val.split('|') if val else []
+    if len(parts) == 2 and parts[0].isdigit():
+        return url_video[:int(parts[0])] + parts[1]
+    return val
+
+
 def cleanup_filename(val):
     """
     Strips strange characters from a string in order
@@ -267,7 +282,7 @@ def url_retrieve(url, filename, reporthook, chunk_size=65536, aborthook=None):
             each block read thereafter. If specified the operation will be
             aborted if the hook function returns `True`
     """
-    with closing(urlopen(url, timeout=10)) as src, closing(open(filename, 'wb')) as dst:
+    with closing(_urlopen(url, timeout=10)) as src, closing(open(filename, 'wb')) as dst:
         _chunked_url_copier(src, dst, reporthook, chunk_size, aborthook)
 
 
@@ -295,7 +310,7 @@ def url_retrieve_vfs(url, filename, reporthook, chunk_size=65536, aborthook=None
             each block read thereafter. If specified the operation will be
             aborted if the hook function returns `True`
     """
-    with closing(urlopen(url, timeout=10)) as src, closing(xbmcvfs.File(filename, 'wb')) as dst:
+    with closing(_urlopen(url, timeout=10)) as src, closing(xbmcvfs.File(filename, 'wb')) as dst:
         _chunked_url_copier(src, dst, reporthook, chunk_size, aborthook)
 
 
@@ -311,6 +326,18 @@ def build_url(query):
     return sys.argv[0] + '?' + urlencode(utfEnsuredParams)
 
 
+def _urlopen(url, timeout):
+    # urllib.request is imported on demand since it loads the whole
+    # http and email stack which no plugin click without download needs
+    # pylint: disable=import-outside-toplevel
+    try:
+        # Python 3.x
+        from urllib.request import urlopen
+    except ImportError:
+        from urllib2 import urlopen
+    return urlopen(url, timeout=timeout)
+
+
 def _chunked_url_copier(src, dst, reporthook, chunk_size, aborthook):
     aborthook = aborthook if aborthook is not None else lambda: False
     total_size = int(
@@ -21,21 +21,15 @@ import xbmcplugin
 
 from resources.lib.kodi.kodiaddon import KodiPlugin
 
-from resources.lib.storeMySql import StoreMySQL
-from resources.lib.storeSqlite import StoreSQLite
-from resources.lib.notifierKodi import NotifierKodi
-from resources.lib.downloader import Downloader
-from resources.lib.searches import RecentSearches
-from resources.lib.extendedSearch import ExtendedSearch
-import resources.lib.extendedSearchModel as ExtendedSearchModel
-import resources.lib.ui.livestreamUi as LivestreamUi
-import resources.lib.ui.channelUi as ChannelUi
-import resources.lib.ui.showUi as ShowUi
-import resources.lib.ui.letterUi as LetterUi
-import resources.lib.ui.filmlistUi as FilmlistUi
+from resources.lib.storeRemote import StoreRemote
 
 import resources.lib.appContext as appContext
 
+# The modules of the stores, the user interfaces, the searches and the
+# downloader are imported by the modes using them. Every click starts
+# the plugin from scratch and the main menu needs none of them.
+# pylint: disable=import-outside-toplevel
+
 # -- Classes ------------------------------------------------
 
 
@@ -49,10 +43,10 @@ class MediathekViewPlugin(KodiPlugin):
         self.logger = appContext.MVLOGGER.get_new_logger('MediathekViewPlugin')
         if self.settings.getDatabaseType() == 0:
             self.logger.debug('Database driver: Internal (sqlite)')
-            self.database = StoreSQLite()
+            self.database = StoreRemote(self._createStore)
         elif self.settings.getDatabaseType() == 1:
             self.logger.debug('Database driver: External (mysql)')
-            self.database = StoreMySQL()
+            self.database = StoreRemote(self._createStore)
         else:
             self.logger.warn('Unknown Database driver selected')
             self.database = None
@@ -60,6 +54,14 @@ class MediathekViewPlugin(KodiPlugin):
         self.migrateExtendedSearch()
         # self.database = Store()
 
+    def _createStore(self):
+        """ Creates the local store if the query server cannot answer """
+        if self.settings.getDatabaseType() == 0:
+            from resources.lib.storeSqlite import StoreSQLite
+            return StoreSQLite()
+        from resources.lib.storeMySql import StoreMySQL
+        return StoreMySQL()
+
     def show_main_menu(self):
         """ Creates the main menu of the plugin """
         xbmcplugin.setContent(self.addon_handle, '')
@@ -136,33 +138,50 @@ class MediathekViewPlugin(KodiPlugin):
         elif mode == 'newsearch':
             self.new_search()
         elif mode == 'research':
+            import resources.lib.ui.filmlistUi as FilmlistUi
+            from resources.lib.searches import RecentSearches
             search = self.get_arg('search', '')
+            cursor = self.get_arg('cursor', None)
             ui = FilmlistUi.FilmlistUi(self)
-            ui.generate(self.database.getQuickSearch(search))
+            ui.generate(
+                self.database.getQuickSearch(search, cursor),
+                {'mode': 'research', 'search': search, 'doNotSave': 'true'},
+                cursor
+            )
             if self.get_arg('doNotSave', 'false') == 'false':
                 RecentSearches(self).load().add(search).save()
             #
         elif mode == 'delsearch':
+            from resources.lib.searches import RecentSearches
             search = self.get_arg('search', '')
             RecentSearches(self).load().delete(search).save().populate()
             self.run_builtin('Container.Refresh')
             self.setViewId(self.resolveViewId('MAIN'))
             #
         elif mode == 'extendedSearchScreen':
+            from resources.lib.extendedSearch import ExtendedSearch
             ExtendedSearch(self, self.database, self.get_arg('extendedSearchAction', None), self.get_arg('searchId', None)).show()
             #
         elif mode == 'livestreams':
+            import resources.lib.ui.livestreamUi as LivestreamUi
             ui = LivestreamUi.LivestreamUi(self)
             ui.generate(self.database.getLivestreams())
             #
         elif mode == 'recent':
+            import resources.lib.ui.filmlistUi as FilmlistUi
             channel = self.get_arg('channel', "")
             channel = "" if channel == "0" else channel
+            cursor = self.get_arg('cursor', None)
             ui = FilmlistUi.FilmlistUi(self)
-            ui.generate(self.database.getRecentFilms(channel))
+            ui.generate(
+                self.database.getRecentFilms(channel, cursor),
+                {'mode': 'recent', 'channel': channel},
+                cursor
+            )
             # self.database.get_recents(channel, FilmUI(self))
             #
         elif mode == 'recentchannels':
+            import resources.lib.ui.channelUi as ChannelUi
             #
             self.add_folder_item(
                 30906,
@@ -173,6 +192,7 @@ class MediathekViewPlugin(KodiPlugin):
             ui = ChannelUi.ChannelUi(self, 'recent')
             ui.generate(self.database.getChannelsRecent())
         elif mode == 'channels':
+            import resources.lib.ui.channelUi as ChannelUi
             #
             self.add_folder_item(
                 30906,
@@ -191,9 +211,11 @@ class MediathekViewPlugin(KodiPlugin):
             self.settings.set_update_triggered('true')
             self.notifier.show_notification(30963, 30964)
         elif mode == 'initial':
+            import resources.lib.ui.letterUi as LetterUi
             ui = LetterUi.LetterUi(self)
             ui.generate(self.database.getStartLettersOfShows())
         elif mode == 'shows':
+            import resources.lib.ui.showUi as ShowUi
             channel = self.get_arg('channel', "")
             channel = "" if channel == "0" else channel
             initial = self.get_arg('initial', "")
@@ -205,15 +227,22 @@ class MediathekViewPlugin(KodiPlugin):
             else:
                 ui.generate(self.database.getShowsByLetter(initial))
         elif mode == 'films':
+            import resources.lib.ui.filmlistUi as FilmlistUi
             show = self.get_arg('show', "")
             show = "" if show == "0" else show
             channel = self.get_arg('channel', "")
             channel = "" if channel == "0" else channel
+            cursor = self.get_arg('cursor', None)
             # self.database.get_films(show, FilmUI(self))
             ui = FilmlistUi.FilmlistUi(self, pLongTitle=False)
-            ui.generate(self.database.getFilms(channel, show))
+            ui.generate(
+                self.database.getFilms(channel, show, cursor),
+                {'mode': 'films', 'channel': channel, 'show': show},
+                cursor
+            )
             #
         elif mode == 'downloadmv':
+            from resources.lib.downloader import Downloader
             filmIdArray = self._resolveFilmIdsFromParams(
                 self.get_arg('id', None),
                 self.get_arg('search', None),
@@ -226,6 +255,7 @@ class MediathekViewPlugin(KodiPlugin):
                 Downloader(self).download_movie(id)
             #
         elif mode == 'downloadep':
+            from resources.lib.downloader import Downloader
             filmIdArray = self._resolveFilmIdsFromParams(
                 self.get_arg('id', None),
                 self.get_arg('search', None),
@@ -238,6 +268,7 @@ class MediathekViewPlugin(KodiPlugin):
                 Downloader(self).download_episode(id)
             #
         elif mode == 'playwithsrt':
+            from resources.lib.downloader import Downloader
             filmid = self.get_arg('id', "")
             Downloader(self).play_movie_with_subs(filmid)
 
@@ -276,12 +307,20 @@ class MediathekViewPlugin(KodiPlugin):
             datetime.fromtimestamp(info['lastFullUpdate']).isoformat().replace('T', ' '),
             datetime.fromtimestamp(info['lastUpdate']).isoformat().replace('T', ' ')
             )
+        cache = self.database.getCacheStatistics()
+        cacheinfo = self.language(30967) % (
+            cache['entries'],
+            cache['size'] // 1024,
+            cache['hits'],
+            cache['misses']
+            )
         #
         xbmcgui.Dialog().textviewer(
             heading,
             infostr + '\n\n' +
             totinfo + '\n\n' +
-            updinfo
+            updinfo + '\n\n' +
+            cacheinfo
         )
 
     def show_searches(self):
@@ -289,6 +328,7 @@ class MediathekViewPlugin(KodiPlugin):
         Fill the search screen with "New Search..." and the
         list of recent searches
         """
+        from resources.lib.searches import RecentSearches
         xbmcplugin.setContent(self.addon_handle, '')
         self.add_folder_item(
             30931,
@@ -304,6 +344,8 @@ class MediathekViewPlugin(KodiPlugin):
         Asks the user to enter his search terms and then
         performs the search and displays the results.
         """
+        import resources.lib.ui.filmlistUi as FilmlistUi
+        from resources.lib.searches import RecentSearches
         settingid = 'lastsearch1'
         headingid = 30901
         # are we returning from playback ?
@@ -311,7 +353,7 @@ class MediathekViewPlugin(KodiPlugin):
         if search:
             # restore previous search
             ui = FilmlistUi.FilmlistUi(self)
-            ui.generate(self.database.getQuickSearch(search))
+            ui.generate(self.database.getQuickSearch(search), {'mode': 'research', 'search': search, 'doNotSave': 'true'})
         else:
             # enter search term
             (search, confirmed) = self.notifier.get_entered_text('', headingid)
@@ -320,7 +362,7 @@ class MediathekViewPlugin(KodiPlugin):
                 #
                 ui = FilmlistUi.FilmlistUi(self)
                 rs = self.database.getQuickSearch(search)
-                ui.generate(rs)
+                ui.generate(rs, {'mode': 'research', 'search': search, 'doNotSave': 'true'})
                 if len(rs) > 0:
                     self.set_setting(settingid, search)
             else:
@@ -330,20 +372,22 @@ class MediathekViewPlugin(KodiPlugin):
                 self.end_of_directory(False, cache_to_disc=False)
 
     def _resolveFilmIdsFromParams(self, filmId, quickSearch, searchId, channelId, showId):
+        # the films of the first page
         filmIdArray = []
         if filmId is not None:
             filmIdArray.append(filmId)
         elif quickSearch is not None:
-            rs = self.database.getQuickSearch(quickSearch)
+            rs = self.database.getQuickSearch(quickSearch)[:self.settings.getMaxResults()]
             for id in rs:
                 filmIdArray.append(id[0])
         elif searchId is not None:
+            from resources.lib.extendedSearch import ExtendedSearch
             ex = ExtendedSearch(self, self.database, None, searchId)
             rs = ex.getFilmData(searchId)
             for id in rs:
                 filmIdArray.append(id[0])
         elif showId is not None:
-            rs = self.database.getFilms(channelId, showId)
+            rs = self.database.getFilms(channelId, showId)[:self.settings.getMaxResults()]
             for id in rs:
                 filmIdArray.append(id[0])
         return filmIdArray;
@@ -356,6 +400,7 @@ class MediathekViewPlugin(KodiPlugin):
         )
         self.logger.debug("migrateExtendedSearch {}", mvutils.file_exists(oldExtSearchFilename))
         if mvutils.file_exists(oldExtSearchFilename):
+            import resources.lib.extendedSearchModel as ExtendedSearchModel
             oldData = mvutils.loadJsonFile(oldExtSearchFilename)
             self.logger.debug("Found legacy ext search entries to be migrated")
             if (oldData != None):
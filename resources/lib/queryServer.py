@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+The query server module
+
+Copyright 2017-2019, Leo Moll
+SPDX-License-Identifier: MIT
+"""
+
+# pylint: disable=line-too-long
+
+import os
+import json
+import time
+import uuid
+import socket
+import struct
+import threading
+import collections
+
+import resources.lib.appContext as appContext
+import resources.lib.mvutils as mvutils
+import resources.lib.extendedSearchModel as ExtendedSearchModel
+
+# file in the data path announcing port and token of the running server
+SERVER_FILE = 'queryserver.json'
+# read only store methods answered by the server
+SERVER_METHODS = [
+    'getQuickSearch',
+    'getLivestreams',
+    'getRecentFilms',
+    'getFilms',
+    'getChannels',
+    'getChannelList',
+    'getChannelsRecent',
+    'getShowsByChannnel',
+    'getShowsByLetter',
+    'getStartLettersOfShows',
+    'extendedSearch',
+    'get_status',
+    'getCacheStatistics'
+]
+# methods returning the state of the database or the statistics
+# of the cache. Their results change without a change of settings.
+SERVER_UNCACHED_METHODS = [
+    'get_status',
+    'getCacheStatistics'
+]
+# settings the results depend on. Client and server must agree on them.
+SERVER_SETTINGS = [
+    'getDatabaseType',
+    'getDatabaseHost',
+    'getDatabasePort',
+    'getDatabaseSchema',
+    'getLastUpdate',
+    'getNoFutur',
+    'getMinLength',
+    'getMaxResults',
+    'getMaxAge',
+    'getRecentMode',
+    'getGroupShow',
+    'getBlacklist',
+    'getCaching',
+    'getDatabaseFulltext'
+]
+# number of results kept in memory
+SERVER_CACHE_ENTRIES = 50
+
+
+class QueryServer(object):
+    """
+    Answers the queries of the plugin on a localhost port. It runs in
+    a thread of the service and keeps its database connection and
+    the most recent results between the plugin calls.
+    """
+
+    def __init__(self):
+        self.logger = appContext.MVLOGGER.get_new_logger('QueryServer')
+        self.settings = appContext.MVSETTINGS
+        self.filename = os.path.join(self.settings.getDatapath(), SERVER_FILE)
+        # internals
+        self._socket = None
+        self._thread = None
+        self._running = False
+        self._token = None
+        self._database = None
+        self._fingerprint = None
+        self._cache = collections.OrderedDict()
+
+    def start(self):
+        """ Opens the port and starts the server thread """
+        try:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.bind(('127.0.0.1', 0))
+            self._socket.listen(5)
+            self._socket.settimeout(1)
+            self._token = uuid.uuid4().hex
+            if not mvutils.saveJsonFile(self.filename, {'port': self._socket.getsockname()[1], 'token': self._token}):
+                raise IOError('Cannot write ' + self.filename)
+        # pylint: disable=broad-except
+        except Exception as err:
+            self.logger.error('Failed to start query server: {}', err)
+            self._close()
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='QueryServer')
+        self._thread.daemon = True
+        self._thread.start()
+        self.logger.info('Query server listening on port {}', self._socket.getsockname()[1])
+        return True
+
+    def stop(self):
+        """ Stops the server thread and closes the port """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close()
+
+    def _close(self):
+        mvutils.file_remove(self.filename)
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _run(self):
+        while self._running:
+            try:
+                (connection, _) = self._socket.accept()
+            except socket.timeout:
+                continue
+            # pylint: disable=broad-except
+            except Exception as err:
+                self.logger.error('Query server accept failed: {}', err)
+                continue
+            try:
+                connection.settimeout(10)
+                sendMessage(connection, self._handle(receiveMessage(connection)))
+            # pylint: disable=broad-except
+            except Exception as err:
+                self.logger.error('Query server request failed: {}', err)
+            finally:
+                connection.close()
+        if self._database is not None:
+            self._database.saveCacheStatistics()
+            self._database.exit()
+            self._database = None
+
+    def _handle(self, request):
+        start = time.time()
+        if request.get('token') != self._token:
+            return {'error': 'token'}
+        method = request.get('method')
+        if method not in SERVER_METHODS:
+            return {'error': 'method'}
+        fingerprint = getSettingsFingerprint(self.settings)
+        if request.get('settings') != fingerprint:
+            return {'error': 'settings'}
+        if fingerprint != self._fingerprint:
+            # the conditions of the store are built from the settings
+            self._reset()
+            self._fingerprint = fingerprint
+        key = json.dumps([method, request.get('args', [])])
+        result = self._cache.get(key) if method not in SERVER_UNCACHED_METHODS else None
+        if result is not None:
+            # most recently used
+            del self._cache[key]
+        else:
+            try:
+                result = {'result': getattr(self._getDatabase(), method)(*decodeArgs(request.get('args', [])))}
+            # pylint: disable=broad-except
+            except Exception as err:
+                # the client repeats the query on its own connection and reports the error
+                return {'error': str(err)}
+        if method not in SERVER_UNCACHED_METHODS:
+            self._cache[key] = result
+        while len(self._cache) > SERVER_CACHE_ENTRIES:
+            self._cache.popitem(last=False)
+        self.logger.debug('{} processed: {} sec', method, time.time() - start)
+        return result
+
+    def _getDatabase(self):
+        if self._database is None:
+            # the stores are imported here to keep the module light for the client
+            # pylint: disable=import-outside-toplevel
+            from resources.lib.notifierInterface import NotifierInterface
+            if self.settings.getDatabaseType() == 0:
+                from resources.lib.storeSqlite import StoreSQLite
+                self._database = StoreSQLite()
+            else:
+                from resources.lib.storeMySql import StoreMySQL
+                self._database = StoreMySQL(pooled=True)
+            # errors are reported by the plugin
+            self._database.notifier = NotifierInterface()
+            self._database.keepCacheStatistics()
+        return self._database
+
+    def _reset(self):
+        self._cache.clear()
+        if self._database is not None:
+            self._database.saveCacheStatistics()
+            self._database.exit()
+            self._database = None
+
+
+def getSettingsFingerprint(settings):
+    """ Values of the settings the query results depend on as JSON """
+    return json.dumps([getattr(settings, name)() for name in SERVER_SETTINGS])
+
+
+def encodeArgs(args):
+    """ Converts the arguments of a store method for the transport """
+    return [{'esModel': arg.toDict()} if hasattr(arg, 'toDict') else arg for arg in args]
+
+
+def decodeArgs(args):
+    """ Restores the arguments of a store method """
+    return [ExtendedSearchModel.ExtendedSearchModel('').fromDict(arg['esModel']) if isinstance(arg, dict) and 'esModel' in arg else arg for arg in args]
+
+
+def sendMessage(connection, message):
+    """ Sends a length prefixed JSON message """
+    data = json.dumps(message).encode('utf-8')
+    connection.sendall(struct.pack('>I', len(data)) + data)
+
+
+def receiveMessage(connection):
+    """ Receives a length prefixed JSON message """
+    (length,) = struct.unpack('>I', _receive(connection, 4))
+    return json.loads(_receive(connection, length).decode('utf-8'))
+
+
+def _receive(connection, length):
+    chunks = []
+    while length > 0:
+        chunk = connection.recv(min(length, 262144))
+        if not chunk:
+            raise IOError('Connection closed')
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
@@ -14,6 +14,7 @@ from resources.lib.monitorKodi import MonitorKodi
 
 from resources.lib.notifierKodi import NotifierKodi
 from resources.lib.updater import MediathekViewUpdater
+from resources.lib.queryServer import QueryServer
 import resources.lib.appContext as appContext
 
 # -- Classes ------------------------------------------------
@@ -31,6 +32,7 @@ class MediathekViewService(KodiService):
         self.monitor = MonitorKodi()
         appContext.initMonitor(self.monitor)
         self.updater = MediathekViewUpdater()
+        self.queryServer = QueryServer()
         self._lastDatabaseType = self.settings.getDatabaseType()
 
     def __del__(self):
@@ -39,6 +41,7 @@ class MediathekViewService(KodiService):
         self.notifier = None
         self.monitor = None
         self.updater = None
+        self.queryServer = None
 
     def init(self):
         """ Initialisation of the service """
@@ -47,6 +50,9 @@ class MediathekViewService(KodiService):
     def run(self):
         """ Execution of the service """
         self.logger.debug('Service Startup...')
+        # answer the plugin queries while the service is running
+        if self.settings.getQueryServer():
+            self.queryServer.start()
         # Wait for Kodi to retrieve network
         self.monitor.wait_for_abort(self.settings.getDelayStartupSec())
         # error counter to slow down
@@ -69,7 +75,8 @@ class MediathekViewService(KodiService):
                     self._lastDatabaseType = self.settings.getDatabaseType()
                     self.updater.database.get_status()
                 if self.settings.getDatabaseUpateMode() > 0:
-                    self.updater.doUpdate()
+                    if self.updater.doUpdate():
+                        self.updater.warmupCache()
                 self.errorCount = 0
             except Exception as err:
                 self.logger.error('MediathekViewUpdater {}', err)
@@ -87,5 +94,6 @@ class MediathekViewService(KodiService):
     def exit(self):
         """ Shutdown of the service """
         self.logger.info('Exit Service')
+        self.queryServer.stop()
         self.updater.exit()
 
@@ -23,11 +23,18 @@ class SettingsCommandline(SettingsInterface):
             self.__user = args.user
             self.__password = args.password
             self.__database = args.database
+            self.__cext = args.cext
+            self.__bulk = args.bulk
         self.__updmode = 4
         self.__updinterval = args.intervall
         self.__force = args.force
         self.__full = args.full
         self.__updateBatchSize = args.updateBatchSize
+        self.__updstream = args.stream
+        self.__workers = args.workers
+        self.__segments = args.segments
+        self.__updshadow = args.shadow
+        self.__fulltext = args.fulltext
         #
         self._lastFullUpdate = 0
         self._lastUpdate = 0
@@ -75,6 +82,27 @@ class SettingsCommandline(SettingsInterface):
     def getDatabaseImportBatchSize(self):
         return self.__updateBatchSize
 
+    def getDatabaseUpdateStreaming(self):
+        return self.__updstream
+
+    def getDatabaseImportWorkers(self):
+        return self.__workers
+
+    def getDatabaseShadowImport(self):
+        return self.__updshadow
+
+    def getDatabaseDownloadSegments(self):
+        return self.__segments
+
+    def getDatabaseFulltext(self):
+        return self.__fulltext
+
+    def getDatabaseCExtension(self):
+        return self.__cext
+
+    def getDatabaseBulkLoad(self):
+        return self.__bulk
+
     # RUNTIME
     def is_user_alive(self):
         return True
@@ -87,12 +87,39 @@ class SettingsInterface(object):
     def getCaching(self):
         return True
 
+    def getCacheSize(self):
+        return 50
+
+    def getQueryServer(self):
+        return False
+
     def getDatabaseUpdateInvterval(self):
         return 3600
 
     def getDatabaseImportBatchSize(self):
         return 10000
 
+    def getDatabaseUpdateStreaming(self):
+        return False
+
+    def getDatabaseImportWorkers(self):
+        return 0
+
+    def getDatabaseShadowImport(self):
+        return False
+
+    def getDatabaseDownloadSegments(self):
+        return 1
+
+    def getDatabaseFulltext(self):
+        return False
+
+    def getDatabaseCExtension(self):
+        return False
+
+    def getDatabaseBulkLoad(self):
+        return False
+
     # Download
 
     def getDownloadPathEpisode(self):
@@ -85,6 +85,18 @@ class SettingsKodi(SettingsInterface):
     def getDatabaseImportBatchSize(self):
         return int(self._addonClass.getSetting('updateBatchSize'))
 
+    # self.updstream
+    def getDatabaseUpdateStreaming(self):
+        return self._addonClass.getSetting('updstream') == 'true'
+
+    # self.updshadow
+    def getDatabaseShadowImport(self):
+        return self._addonClass.getSetting('updshadow') == 'true'
+
+    # self.dbfulltext
+    def getDatabaseFulltext(self):
+        return self._addonClass.getSetting('dbfulltext') == 'true'
+
     # self.contentType
     def getContentType(self):
         contentType = ''
@@ -142,6 +154,14 @@ class SettingsKodi(SettingsInterface):
     def getCaching(self):
         return self._addonClass.getSetting('caching') == 'true'
 
+    # self.cachesize
+    def getCacheSize(self):
+        return int(float(self._addonClass.getSetting('cachesize')))
+
+    # self.queryserver
+    def getQueryServer(self):
+        return self._addonClass.getSetting('queryserver') == 'true'
+
     # self.updinterval
     def getDatabaseUpdateInvterval(self):
         return int(float(self._addonClass.getSetting('updinterval'))) * 3600
@@ -11,6 +11,10 @@ SPDX-License-Identifier: MIT
 import os
 import json
 import time
+import mmap
+import array
+import struct
+import hashlib
 
 import resources.lib.appContext as appContext
 
@@ -22,9 +26,40 @@ import resources.lib.mvutils as mvutils
 import resources.lib.appContext as appContext
 
 
+# every request type keeps up to CACHE_MAX_ENTRIES results in files
+# named <reqtype>-<condition hash>.cache in the cache directory. The
+# least recently used files are removed if there are more or if they
+# exceed the configured size. Hits refresh the modification time if
+# it is older than CACHE_TOUCH_INTERVAL seconds.
+CACHE_DIRECTORY = 'cache'
+CACHE_MAX_ENTRIES = 100
+CACHE_TOUCH_INTERVAL = 60
+# the hit and miss counters are kept in memory. A long running process
+# adds them to the statistics file every CACHE_STATISTICS_INTERVAL
+# seconds and when it closes the store.
+CACHE_STATISTICS = 'statistics.json'
+CACHE_STATISTICS_INTERVAL = 60
+# binary cache file layout (native byte order):
+#   header      magic, version, type, condition hash, DB lastUpdate and
+#               the sizes of the following sections
+#   ints        distinct 32 bit integers
+#   cells       one value index per cell, row by row. The values are
+#               numbered strings first, then ints, then others
+#   blob        the distinct strings as one utf-8 text separated by NUL
+#   others      all other distinct values (None, floats, strings
+#               containing NUL, ...) as JSON
+CACHE_MAGIC = b'MVC1'
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct('=4sH24s16sqIIIIII')
+# tags of the temporary value indexes while encoding
+INT_TAG = 0x80000000
+OTHER_TAG = 0xc0000000
+INDEX_MASK = 0x3fffffff
+
+
 class StoreCache(object):
     """
-    The local SQlite database class
+    The result cache of the database queries
 
     """
 
@@ -33,43 +68,102 @@ class StoreCache(object):
         self.notifier = appContext.MVNOTIFIER
         self.settings = appContext.MVSETTINGS
         # internals
+        self._directory = os.path.join(self.settings.getDatapath(), CACHE_DIRECTORY)
+        self._statistics = True
+        self._counters = {}
+        self._saveInterval = None
+        self._saved = time.time()
 
     def load_cache(self, reqtype, condition):
-        start = time.time()
         if not self.settings.getCaching():
             self.logger.debug('loading cache is disabled')
             return None
-        #
-        filename = os.path.join(self.settings.getDatapath() , reqtype + '.cache')
-        if not mvutils.file_exists(filename):
+        data = self._load(reqtype, condition)
+        if self._statistics:
+            self._count('hits' if data is not None else 'misses')
+        return data
+
+    def setStatistics(self, enabled):
+        """ Enables or disables the hit and miss counters """
+        self._statistics = enabled
+
+    def setStatisticsInterval(self, interval):
+        """
+        Saves the hit and miss counters periodically. Without an
+        interval they are kept in memory only.
+
+        Args:
+            interval(int): seconds between the saves
+        """
+        self._saveInterval = interval
+
+    def getStatistics(self):
+        """ Returns entries, size in bytes, hits and misses of the cache """
+        entries = self._entries()
+        statistics = self._loadStatistics()
+        return {
+            'entries': len(entries),
+            'size': sum(entry[1] for entry in entries),
+            'hits': statistics.get('hits', 0) + self._counters.get('hits', 0),
+            'misses': statistics.get('misses', 0) + self._counters.get('misses', 0)
+        }
+
+    def saveStatistics(self):
+        """ Adds the counters to the statistics file if they are saved """
+        self._saved = time.time()
+        if self._saveInterval is None or len(self._counters) == 0:
+            return
+        try:
+            if not mvutils.dir_exists(self._directory):
+                self._setupDirectory()
+        except OSError as err:
+            self.logger.error('Failed to create cache directory {}: {}', self._directory, err)
+            return
+        statistics = self._loadStatistics()
+        for (counter, value) in self._counters.items():
+            statistics[counter] = statistics.get(counter, 0) + value
+        if mvutils.saveJsonFile(os.path.join(self._directory, CACHE_STATISTICS), statistics):
+            self._counters = {}
+
+    def _load(self, reqtype, condition):
+        start = time.time()
+        filename = self._filename(reqtype, condition)
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            stat = None
+        if stat is None or stat.st_size < CACHE_HEADER.size:
             self.logger.debug('no cache file request "{}" and condition "{}"', reqtype, condition)
             return None
         #
         dbLastUpdate = self.settings.getLastUpdate()
         try:
-            with closing(open(filename, encoding='utf-8')) as json_file:
-                data = json.load(json_file)
-                if isinstance(data, dict):
-                    if data.get('type', '') != reqtype:
-                        self.logger.debug('no matching cache for type {} vs {}', data.get('type', ''), reqtype)
+            with closing(open(filename, 'rb')) as cache_file:
+                with closing(mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)) as buf:
+                    (magic, version, ctype, chash, ctime, rows, columns, nStrings, nInts, blobSize, othersSize) = CACHE_HEADER.unpack_from(buf, 0)
+                    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                        self.logger.debug('no cache in the current format')
                         return None
-                    if data.get('condition', '') != condition:
-                        self.logger.debug('no matching cache for condition {} vs {}', data.get('condition', ''), condition)
+                    if ctype.rstrip(b'\0') != _encode(reqtype):
+                        self.logger.debug('no matching cache for type {} vs {}', ctype.rstrip(b'\0'), reqtype)
                         return None
-                    if int(dbLastUpdate) != data.get('time', 0):
+                    if chash != _hash(condition):
+                        self.logger.debug('no matching cache for condition {}', condition)
+                        return None
+                    if int(dbLastUpdate) != ctime:
                         self.logger.debug('outdated cache')
                         return None
-                    data = data.get('data', [])
-                    if isinstance(data, list):
-                        self.logger.debug('return cache after {} sec for request "{}" and condition "{}"', (time.time() - start), reqtype, condition)
-                        return data
+                    data = self._decode(buf, rows, columns, nStrings, nInts, blobSize, othersSize)
+            # most recently used, the eviction does not need the exact time
+            if time.time() - stat.st_mtime > CACHE_TOUCH_INTERVAL:
+                os.utime(filename, None)
+            self.logger.debug('return cache after {} sec for request "{}" and condition "{}"', (time.time() - start), reqtype, condition)
+            return data
         # pylint: disable=broad-except
         except Exception as err:
             self.logger.error('Failed to load cache file {}: {}', filename, err)
             mvutils.file_remove(filename)
             raise
-        self.logger.debug('no cache found')
-        return None
 
     def save_cache(self, reqtype, condition, data):
         if not self.settings.getCaching():
@@ -85,18 +179,155 @@ class StoreCache(object):
             self.logger.debug('not a proper instance for caching')
             return None
         start = time.time()
-        filename = os.path.join(self.settings.getDatapath() , reqtype + '.cache')
+        filename = self._filename(reqtype, condition)
         dbLastUpdate = self.settings.getLastUpdate()
-        cache = {
-            "type": reqtype,
-            "time": int(dbLastUpdate),
-            "condition": condition,
-            "data": data
-        }
+        columns = len(data[0])
+        if any(len(row) != columns for row in data):
+            self.logger.debug('rows of different length cannot be cached')
+            return None
         try:
-            with closing(open(filename, 'w', encoding='utf-8')) as json_file:
-                json.dump(cache, json_file)
+            if not mvutils.dir_exists(self._directory):
+                self._setupDirectory()
+            (nStrings, ints, cells, blob, others) = self._encode(data)
+            header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, _encode(reqtype), _hash(condition), int(dbLastUpdate), len(data), columns, nStrings, len(ints), len(blob), len(others))
+            # write a new file and replace the old one since it may be mapped by a reader
+            with closing(open(filename + '.tmp', 'wb')) as cache_file:
+                cache_file.write(header)
+                for section in (ints, cells, blob, others):
+                    cache_file.write(section)
+            if not mvutils.file_rename(filename + '.tmp', filename):
+                raise IOError('Cannot replace cache file')
+            self._evict(reqtype)
         except Exception as err:
             self.logger.error('Failed to write cache file {}: {}', filename, err)
             raise
         self.logger.debug('cache saved after {} sec for request "{}" and condition "{}"', (time.time() - start), reqtype, condition)
+
+    def _filename(self, reqtype, condition):
+        return os.path.join(self._directory, reqtype + '-' + hashlib.md5(_encode(condition)).hexdigest() + '.cache')
+
+    def _setupDirectory(self):
+        os.makedirs(self._directory)
+        # remove the single result files of previous versions
+        datapath = self.settings.getDatapath()
+        for name in os.listdir(datapath):
+            if name.endswith('.cache'):
+                mvutils.file_remove(os.path.join(datapath, name))
+
+    def _entries(self):
+        # (name, size, mtime) of all cache files
+        entries = []
+        if not mvutils.dir_exists(self._directory):
+            return entries
+        for name in os.listdir(self._directory):
+            if name.endswith('.cache'):
+                try:
+                    stat = os.stat(os.path.join(self._directory, name))
+                    entries.append((name, stat.st_size, stat.st_mtime))
+                except OSError:
+                    # removed by another process
+                    pass
+        return entries
+
+    def _evict(self, reqtype):
+        # removes the least recently used files beyond the count and size limits
+        entries = sorted(self._entries(), key=lambda entry: entry[2], reverse=True)
+        budget = self.settings.getCacheSize() * 1024 * 1024
+        prefix = reqtype + '-'
+        size = 0
+        count = 0
+        for (name, entrySize, _) in entries:
+            size += entrySize
+            if name.startswith(prefix):
+                count += 1
+                if count > CACHE_MAX_ENTRIES:
+                    size -= entrySize
+                    mvutils.file_remove(os.path.join(self._directory, name))
+                    continue
+            if size > budget:
+                size -= entrySize
+                mvutils.file_remove(os.path.join(self._directory, name))
+
+    def _loadStatistics(self):
+        try:
+            return mvutils.loadJsonFile(os.path.join(self._directory, CACHE_STATISTICS))
+        # pylint: disable=broad-except
+        except Exception:
+            return {}
+
+    def _count(self, counter):
+        self._counters[counter] = self._counters.get(counter, 0) + 1
+        if self._saveInterval is not None and time.time() - self._saved >= self._saveInterval:
+            self.saveStatistics()
+
+    def _encode(self, data):
+        # builds the value tables and the cells of the rows
+        strings = {}
+        ints = {}
+        others = {}
+        cells = array.array('I')
+        for row in data:
+            for value in row:
+                if isinstance(value, STRING_TYPES) and u'\0' not in value:
+                    index = strings.get(value)
+                    if index is None:
+                        index = strings[value] = len(strings)
+                    cells.append(index)
+                elif type(value) is int and -0x80000000 <= value <= 0x7fffffff:
+                    index = ints.get(value)
+                    if index is None:
+                        index = ints[value] = len(ints)
+                    cells.append(INT_TAG | index)
+                else:
+                    key = json.dumps(value)
+                    index = others.get(key)
+                    if index is None:
+                        index = others[key] = len(others)
+                    cells.append(OTHER_TAG | index)
+        # number the ints and others after the strings
+        intBase = len(strings)
+        otherBase = len(strings) + len(ints)
+        cells = array.array('I', [cell if cell < INT_TAG else (intBase + (cell & INDEX_MASK) if cell < OTHER_TAG else otherBase + (cell & INDEX_MASK)) for cell in cells])
+        blob = u'\0'.join(_ordered(strings)).encode('utf-8')
+        othersJson = ('[' + ','.join(_ordered(others)) + ']').encode('utf-8')
+        return (len(strings), array.array('i', _ordered(ints)), cells, blob, othersJson)
+
+    def _decode(self, buf, rows, columns, nStrings, nInts, blobSize, othersSize):
+        offset = CACHE_HEADER.size
+        ints = array.array('i', buf[offset:offset + 4 * nInts]).tolist()
+        offset += 4 * nInts
+        cells = array.array('I', buf[offset:offset + 4 * rows * columns])
+        offset += 4 * rows * columns
+        text = buf[offset:offset + blobSize].decode('utf-8')
+        offset += blobSize
+        others = json.loads(buf[offset:offset + othersSize].decode('utf-8'))
+        # one list of all values addressed by the cells
+        values = text.split(u'\0') if nStrings > 0 else []
+        if len(values) != nStrings:
+            raise ValueError('Invalid string table')
+        values.extend(ints)
+        values.extend(others)
+        flat = list(map(values.__getitem__, cells))
+        return list(zip(*[iter(flat)] * columns))
+
+
+try:
+    STRING_TYPES = (str, unicode)
+except NameError:
+    STRING_TYPES = (str,)
+
+
+def _ordered(table):
+    # the keys of a value to index dict ordered by index
+    keys = [None] * len(table)
+    for (key, index) in table.items():
+        keys[index] = key
+    return keys
+
+
+def _encode(value):
+    return value.encode('utf-8') if not isinstance(value, bytes) else value
+
+
+def _hash(condition):
+    return hashlib.md5(_encode(condition)).digest()
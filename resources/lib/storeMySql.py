@@ -6,13 +6,26 @@ Copyright 2017-2019, Leo Moll and Dominik Schlösser
 """
 # pylint: disable=too-many-lines,line-too-long
 
+import io
+import os
+import re
 import time
+import hashlib
+import tempfile
 import mysql.connector
 
 import resources.lib.mvutils as mvutils
 import resources.lib.appContext as appContext
 from resources.lib.storeQuery import StoreQuery
 
+# connections opened by the pool of a long running process:
+# the updater and the query server of the service
+POOL_SIZE = 2
+
+# LOAD DATA LOCAL INFILE is disabled on the server (1148, 3948) or
+# rejected by the client (2068)
+LOCAL_INFILE_ERRORS = (1148, 2068, 3948)
+
 
 class StoreMySQL(StoreQuery):
     """
@@ -23,14 +36,133 @@ con.query('SET GLOBAL interactive_timeout=28800')
 con.query('SET GLOBAL wait_timeout=28800')
 SET SESSION MAX_EXECUTION_TIME=2000;
 SET GLOBAL MAX_EXECUTION_TIME=2000;
+
+    Args:
+        pooled(bool, optional): take the connection from a pool
+            kept by the process. Used by the service and the
+            standalone updater. Default is `False`
     """
 
-    def __init__(self):
+    def __init__(self, pooled=False):
         super(StoreMySQL, self).__init__()
         self.logger = appContext.MVLOGGER.get_new_logger('StoreMySQL')
         self.notifier = appContext.MVNOTIFIER
         self.settings = appContext.MVSETTINGS
         self.conn = None
+        self.pooled = pooled
+        # statements translated to the parameter style of the connector
+        self._statements = {}
+        # prepared cursors by statement
+        self._prepared = {}
+        # LOAD DATA LOCAL INFILE is accepted by the server, None until the first bulk import
+        self._localInfile = None
+        # QUERY SQL
+        self.sql_query_films = "SELECT LOWER(HEX(idhash)), title, showname, channel, description, duration, aired, url_sub, CONCAT(COALESCE((SELECT prefix FROM urlprefix WHERE id = film.url_prefix), ''), url_video), url_video_sd, url_video_hd FROM film"
+        self.sql_showIdHex = "LPAD(LOWER(HEX(showid)), 8, '0')"
+        # IMPORT SQL
+        self.sql_checkpointUpdate = 'UPDATE status SET checkpoint = %s'
+        self.sql_urlPrefixInsert = 'INSERT INTO urlprefix (prefix) VALUES (%s)'
+        self.sql_urlPrefixParam = '%s'
+        # new and changed films, the values not covered by the idhash are rewritten
+        self.sql_pStmtUpsert = """
+            INSERT INTO film (
+                idhash, touched, dtCreated, channel, showid, showname, title,
+                aired, duration, description,
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+            )
+            VALUES (
+                %s, 1, %s, %s, %s, %s, %s,
+                %s, %s, %s,
+                %s, %s, %s, %s, %s, %s, %s
+            )
+            ON DUPLICATE KEY UPDATE touched = touched + 1,
+                aired = VALUES(aired), duration = VALUES(duration), description = VALUES(description),
+                url_sub = VALUES(url_sub), url_video_sd = VALUES(url_video_sd), url_video_hd = VALUES(url_video_hd),
+                contenthash = VALUES(contenthash)"""
+        self.sql_pStmtInsertLoad = """
+            INSERT IGNORE INTO {} (
+                idhash, dtCreated, channel, showid, showname, title,
+                aired, duration, description,
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+            )
+            VALUES (
+                %s, %s, %s, %s, %s, %s,
+                %s, %s, %s,
+                %s, %s, %s, %s, %s, %s, %s
+            )"""
+        self.sql_pStmtInsertShadow = self.sql_pStmtInsertLoad.format('film_new')
+        # bulk import: every batch is loaded from a TSV file into a staging table and merged set-based into film
+        self.sql_createStaging = """
+            CREATE TEMPORARY TABLE IF NOT EXISTS film_import (
+                idhash         binary(16)      NOT NULL PRIMARY KEY,
+                dtCreated      integer(11)     NOT NULL,
+                channel        varchar(32)     NOT NULL,
+                showid         integer(11) unsigned NOT NULL,
+                showname       varchar(128)    NOT NULL,
+                title          varchar(128)    NOT NULL,
+                aired          integer(11)     NOT NULL,
+                duration       integer(11)     NOT NULL,
+                description    varchar(1024)   NULL,
+                url_sub        varchar(2048)   NULL,
+                url_prefix     integer(11)     NOT NULL DEFAULT 0,
+                url_video      varchar(2048)   NULL,
+                url_video_sd   varchar(2048)   NULL,
+                url_video_hd   varchar(2048)   NULL,
+                letter         char(1)         NOT NULL DEFAULT '#',
+                contenthash    char(32)        NOT NULL DEFAULT ''
+            ) ENGINE=InnoDB CHARSET=utf8mb4"""
+        # duplicates of the list are ignored like with INSERT IGNORE
+        self.sql_loadData = """
+            LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {}
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+            LINES TERMINATED BY '\\n'
+            (
+                @idhash, dtCreated, channel, showid, showname, title,
+                aired, duration, description,
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+            )
+            SET idhash = UNHEX(@idhash){}"""
+        self.sql_importTouch = "UPDATE film JOIN film_import ON film_import.idhash = film.idhash SET film.touched = film.touched + 1"
+        self.sql_importSkipUnchanged = "DELETE film_import FROM film_import JOIN film ON film.idhash = film_import.idhash AND film.contenthash = film_import.contenthash"
+        self.sql_importUpdateChanged = """
+            UPDATE film JOIN film_import ON film_import.idhash = film.idhash SET
+                film.aired = film_import.aired, film.duration = film_import.duration, film.description = film_import.description,
+                film.url_sub = film_import.url_sub, film.url_video_sd = film_import.url_video_sd, film.url_video_hd = film_import.url_video_hd,
+                film.contenthash = film_import.contenthash"""
+        self.sql_importSkipKnown = "DELETE film_import FROM film_import JOIN film ON film.idhash = film_import.idhash"
+        self.sql_importMerge = """
+            INSERT INTO film (
+                idhash, touched, dtCreated, channel, showid, showname, title,
+                aired, duration, description,
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+            )
+            SELECT
+                idhash, 1, dtCreated, channel, showid, showname, title,
+                aired, duration, description,
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+            FROM film_import"""
+        # SUMMARY SQL
+        self.sql_summaryShowInsert = "INSERT IGNORE INTO `show` (showid, channel, showname, letter, films, aired_min, aired_max) VALUES (%s, %s, %s, %s, 0, %s, %s)"
+        self.sql_summaryShowUpdate = self.sql_summaryShowUpdate.replace('?', '%s')
+        self.sql_summaryChannelInsert = "INSERT IGNORE INTO channel (channel, films, aired_min, aired_max) VALUES (%s, 0, %s, %s)"
+        self.sql_summaryChannelUpdate = self.sql_summaryChannelUpdate.replace('?', '%s')
+        # summaries of the staged films in one statement per table, the number of films is the parameter
+        self.sql_summaryShowMerge = """
+            INSERT INTO `show` (showid, channel, showname, letter, films, aired_min, aired_max)
+            SELECT showid, channel, min(showname), min(letter), {}, min(aired), max(aired) FROM film_import GROUP BY channel, showid
+            ON DUPLICATE KEY UPDATE films = films + VALUES(films),
+                aired_min = CASE WHEN aired_min > VALUES(aired_min) THEN VALUES(aired_min) ELSE aired_min END,
+                aired_max = CASE WHEN aired_max < VALUES(aired_max) THEN VALUES(aired_max) ELSE aired_max END"""
+        self.sql_summaryChannelMerge = """
+            INSERT INTO channel (channel, films, aired_min, aired_max)
+            SELECT channel, {}, min(aired), max(aired) FROM film_import GROUP BY channel
+            ON DUPLICATE KEY UPDATE films = films + VALUES(films),
+                aired_min = CASE WHEN aired_min > VALUES(aired_min) THEN VALUES(aired_min) ELSE aired_min END,
+                aired_max = CASE WHEN aired_max < VALUES(aired_max) THEN VALUES(aired_max) ELSE aired_max END"""
+        # FULLTEXT SQL
+        # one FULLTEXT index per column since MATCH needs the exact index columns
+        self.fulltextColumns = ['showname', 'title', 'description']
 
     def getConnection(self):
         if self.conn is None:
@@ -51,10 +183,16 @@ SET GLOBAL MAX_EXECUTION_TIME=2000;
                 connectargs['auth_plugin'] = 'mysql_native_password'
             else:
                 self.logger.debug('Not using auth_plugin parameter')
+            if self.settings.getDatabaseBulkLoad():
+                # the client sends only the files of the bulk import
+                if mysql.connector.__version_info__ >= (8, 0, 26):
+                    connectargs['allow_local_infile_in_path'] = tempfile.gettempdir()
+                elif mysql.connector.__version_info__ > (2, 0):
+                    connectargs['allow_local_infile'] = True
             if mysql.connector.__version_info__ > (2, 1) and mysql.connector.HAVE_CEXT:
-                connectargs['use_pure'] = True
-                self.logger.debug('Forcefully disabling C extension')
-            self.conn = mysql.connector.connect(**connectargs)
+                connectargs['use_pure'] = not self.settings.getDatabaseCExtension()
+                self.logger.debug('C extension {}', 'disabled' if connectargs['use_pure'] else 'enabled')
+            self.conn = self._connect(connectargs)
             try:
                 cursor = self.conn.cursor()
                 cursor.execute('SELECT VERSION()')
@@ -66,36 +204,403 @@ SET GLOBAL MAX_EXECUTION_TIME=2000;
                 self.logger.debug('Connected to server {}', self.settings.getDatabaseHost())
             # select database
             try:
-                self.conn.database = self.settings.getDatabaseSchema()
+                # a pooled connection does not forward attribute assignments
+                self.conn.cmd_init_db(self.settings.getDatabaseSchema())
             except Exception:
                 pass
             #
             cursor.close()
         return self.conn
 
+    def _connect(self, connectargs):
+        if not self.pooled:
+            return mysql.connector.connect(**connectargs)
+        # one pool per server and account, the settings may change while the service runs
+        key = '{}:{}:{}:{}:{}'.format(connectargs['host'], connectargs['port'], connectargs['user'], connectargs['password'], connectargs.get('use_pure'))
+        connectargs['pool_name'] = 'mediathekview-' + hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+        connectargs['pool_size'] = POOL_SIZE
+        try:
+            return mysql.connector.connect(**connectargs)
+        except mysql.connector.errors.PoolError as err:
+            self.logger.debug('Connecting without pool: {}', err)
+            del connectargs['pool_name']
+            del connectargs['pool_size']
+            return mysql.connector.connect(**connectargs)
+
+    def _translate(self, aStmt):
+        # the connector expects %s instead of ?
+        stmt = self._statements.get(aStmt)
+        if stmt is None:
+            if len(self._statements) > 500:
+                # statements with inline values would grow the cache forever
+                self._statements.clear()
+            stmt = aStmt.replace('?', '%s')
+            self._statements[aStmt] = stmt
+        return stmt
+
     def execute(self, aStmt, aParams=None):
-        aStmt = aStmt.replace('?', '%s')
-        return super(StoreMySQL, self).execute(aStmt, aParams)
+        return super(StoreMySQL, self).execute(self._translate(aStmt), aParams)
 
     def executeUpdate(self, aStmt, aParams=None):
-        aStmt = aStmt.replace('?', '%s')
-        return super(StoreMySQL, self).executeUpdate(aStmt, aParams)
+        return super(StoreMySQL, self).executeUpdate(self._translate(aStmt), aParams)
 
     def executemany(self, aStmt, aParams=None):
-        aStmt = aStmt.replace('?', '%s')
-        return super(StoreMySQL, self).executemany(aStmt, aParams)
+        return super(StoreMySQL, self).executemany(self._translate(aStmt), aParams)
+
+    def import_films(self, filmArray, checkpoint=None):
+        """
+        Imports a batch of films. Films with an unchanged content hash
+        are skipped, new and changed films are written with a single
+        upsert statement. The bulk import loads the batch into a
+        staging table and merges it set-based into the film table.
+
+        Args:
+            filmArray(list): the film records
+
+            checkpoint(dict, optional): position of a full import
+                after this batch
+
+        Returns:
+            tuple: number of inserted and updated films
+        """
+        self.logger.debug('import_films')
+        if self.settings.getDatabaseBulkLoad():
+            return self._importStaged(filmArray, checkpoint)
+        try:
+            cursor = self.getConnection().cursor()
+            cursor.execute('SELECT LOWER(HEX(idhash)), contenthash FROM film WHERE idhash IN ({})'.format(', '.join(['%s'] * len(filmArray))), [self._getHash(film[0]) for film in filmArray])
+            known = dict(cursor.fetchall())
+            films = [film for film in filmArray if known.get(film[0]) != film[15]]
+            if self._fullImport and len(films) < len(filmArray):
+                # films not marked are deleted by import_end
+                unchanged = [self._getHash(film[0]) for film in filmArray if known.get(film[0]) == film[15]]
+                cursor.execute('UPDATE film SET touched = touched + 1 WHERE idhash IN ({})'.format(', '.join(['%s'] * len(unchanged))), unchanged)
+            updateCnt = 0
+            if len(films) > 0:
+                cursor.executemany(self.sql_pStmtUpsert, self._prepareFilms(cursor, films))
+                # MySQL reports one affected row per insert and two per update
+                updateCnt = max(0, cursor.rowcount - len(films))
+                self._updateSummary(cursor, self._summarize(film for film in films if film[0] not in known))
+                # the aired range of the shows may have changed, the films are counted already
+                self._updateSummary(cursor, [show[:4] + (0,) + show[5:] for show in self._summarize(film for film in films if film[0] in known)])
+            if checkpoint is not None:
+                self._setCheckpoint(cursor, checkpoint)
+            cursor.close()
+            self.getConnection().commit()
+            return (len(films) - updateCnt, updateCnt)
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            # keep the checkpoint of the last complete batch
+            self.getConnection().rollback()
+            raise
+
+    def _importStaged(self, filmArray, checkpoint):
+        # bulk import of a batch through the staging table film_import
+        try:
+            cursor = self.getConnection().cursor()
+            cursor.execute(self.sql_createStaging)
+            cursor.execute('DELETE FROM film_import')
+            self._loadFilms(cursor, 'film_import', filmArray)
+            if self._fullImport:
+                # films not marked are deleted by import_end
+                cursor.execute(self.sql_importTouch)
+            cursor.execute(self.sql_importSkipUnchanged)
+            cursor.execute(self.sql_importUpdateChanged)
+            updateCnt = cursor.rowcount
+            if updateCnt > 0:
+                # the aired range of the shows may have changed, the films are counted already
+                cursor.execute(self.sql_summaryShowMerge.format('0'))
+                cursor.execute(self.sql_summaryChannelMerge.format('0'))
+            # keep only the new films for the merge and the summaries
+            cursor.execute(self.sql_importSkipKnown)
+            cursor.execute(self.sql_importMerge)
+            insertCnt = cursor.rowcount
+            if insertCnt > 0:
+                cursor.execute(self.sql_summaryShowMerge.format('count(*)'))
+                cursor.execute(self.sql_summaryChannelMerge.format('count(*)'))
+            if checkpoint is not None:
+                self._setCheckpoint(cursor, checkpoint)
+            cursor.close()
+            self.getConnection().commit()
+            return (insertCnt, updateCnt)
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            # keep the checkpoint of the last complete batch
+            self.getConnection().rollback()
+            raise
 
-    def getImportPreparedStmtInsert(self):
-        aStmt = super(StoreMySQL, self).getImportPreparedStmtInsert()
-        aStmt = aStmt.replace('?', '%s')
-        return aStmt
+    def _loadFilms(self, cursor, table, filmArray):
+        """
+        Writes a batch of films to a table. The films are loaded
+        from a TSV file with LOAD DATA LOCAL INFILE if the bulk
+        import is enabled and the server accepts it.
 
-    def getImportPreparedStmtUpdate(self):
-        aStmt = super(StoreMySQL, self).getImportPreparedStmtUpdate()
-        aStmt = aStmt.replace('?', '%s')
-        return aStmt
+        Args:
+            cursor: cursor of the import transaction
+
+            table(str): the target table
+
+            filmArray(list): the film records
+        """
+        films = self._prepareFilms(cursor, filmArray)
+        if self._localInfile is not False and self.settings.getDatabaseBulkLoad():
+            (handle, filename) = tempfile.mkstemp(prefix='mvimport-', suffix='.tsv')
+            try:
+                with io.open(handle, 'w', encoding='utf-8', newline='\n') as tsvFile:
+                    for (film, values) in zip(filmArray, films):
+                        # the idhash is converted by the server
+                        tsvFile.write(u'\t'.join([film[0]] + [_tsvValue(value) for value in values[1:]]) + u'\n')
+                cursor.execute(self.sql_loadData.format(table, ', touched = 1' if table == 'film_new' else ''), (filename,))
+                self._localInfile = True
+                return
+            except mysql.connector.Error as err:
+                if self._localInfile or not _isLocalInfileError(err):
+                    raise
+                self.logger.warn('LOAD DATA LOCAL INFILE not available: {}', err)
+                self._localInfile = False
+            finally:
+                os.remove(filename)
+        cursor.executemany(self.sql_pStmtInsertLoad.format(table), films)
+
+    def analyze(self):
+        """
+        Updates the index statistics used by the query planner
+        after the content of the film table changed
+        """
+        self.logger.debug('analyze')
+        try:
+            cursor = self.getConnection().cursor()
+            cursor.execute('ANALYZE TABLE film')
+            cursor.fetchall()
+            cursor.close()
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def import_shadow_begin(self):
+        """
+        Starts a full import into the shadow table `film_new`. Apart
+        from the unique idhash index the secondary indexes are added
+        by `import_shadow_end`.
+        """
+        self.logger.debug('import_shadow_begin')
+        try:
+            cursor = self.getConnection().cursor()
+            cursor.execute('DROP TABLE IF EXISTS film_new')
+            cursor.execute('CREATE TABLE film_new LIKE film')
+            for key in self._getSecondaryIndexes(cursor, 'film_new'):
+                cursor.execute('ALTER TABLE film_new DROP INDEX `{}`'.format(key))
+            self._setCheckpoint(cursor, None)
+            cursor.close()
+            self.getConnection().commit()
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def import_films_shadow(self, filmArray, checkpoint=None):
+        """
+        Imports a batch of films into the shadow table
+
+        Args:
+            filmArray(list): the film records
+
+            checkpoint(dict, optional): position of the import
+                after this batch
+
+        Returns:
+            tuple: number of inserted and updated films
+        """
+        self.logger.debug('import_films_shadow')
+        try:
+            cursor = self.getConnection().cursor()
+            self._loadFilms(cursor, 'film_new', filmArray)
+            if checkpoint is not None:
+                self._setCheckpoint(cursor, checkpoint)
+            cursor.close()
+            self.getConnection().commit()
+            return (len(filmArray), 0)
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            # keep the checkpoint of the last complete batch
+            self.getConnection().rollback()
+            raise
+
+    def import_shadow_end(self):
+        """
+        Completes the shadow import: keeps the creation date of known
+        films, adds the indexes of `film` and replaces `film` with
+        `film_new` in one atomic rename.
+
+        Returns:
+            tuple: number of inserted, updated and deleted films
+        """
+        self.logger.debug('import_shadow_end')
+        try:
+            conn = self.getConnection()
+            cursor = conn.cursor()
+            cursor.execute('UPDATE film_new JOIN film ON film.idhash = film_new.idhash SET film_new.dtCreated = film.dtCreated')
+            updateCnt = cursor.rowcount
+            cursor.execute('SELECT count(*) FROM film_new')
+            (newCnt,) = cursor.fetchone()
+            cursor.execute('SELECT count(*) FROM film')
+            (oldCnt,) = cursor.fetchone()
+            conn.commit()
+            # index definitions are taken from the current table
+            cursor.execute('SHOW CREATE TABLE film')
+            (_, ddl) = cursor.fetchone()
+            keys = self._getSecondaryIndexes(cursor, 'film')
+            indexes = [line.strip().rstrip(',') for line in ddl.splitlines() if line.strip().startswith(('KEY', 'UNIQUE KEY', 'FULLTEXT KEY'))]
+            indexes = [index for index in indexes if index.split('`')[1] in keys]
+            fulltextIndexes = [index for index in indexes if index.startswith('FULLTEXT')]
+            indexes = [index for index in indexes if not index.startswith('FULLTEXT')]
+            if len(indexes) > 0:
+                cursor.execute('ALTER TABLE film_new {}'.format(', '.join('ADD ' + index for index in indexes)))
+            # InnoDB creates only one FULLTEXT index per statement
+            for index in fulltextIndexes:
+                cursor.execute('ALTER TABLE film_new ADD {}'.format(index))
+            # the rename implicitly commits the summaries right before the swap
+            self._rebuildSummary(cursor, 'film_new')
+            self._setCheckpoint(cursor, None)
+            cursor.execute('RENAME TABLE film TO film_old, film_new TO film')
+            cursor.execute('DROP TABLE film_old')
+            cursor.execute(self.sql_urlPrefixCleanup)
+            cursor.close()
+            conn.commit()
+            self.analyze()
+            return (newCnt - updateCnt, updateCnt, oldCnt - updateCnt)
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def _checkFulltext(self):
+        rs = self.execute("SHOW INDEX FROM film WHERE Key_name = 'idx_ft_title'")
+        return len(rs) > 0
+
+    def setupFulltext(self):
+        """
+        Creates or drops the FULLTEXT indexes according to the
+        settings. InnoDB keeps them in sync with the films.
+        """
+        try:
+            exists = self._checkFulltext()
+            cursor = self.getConnection().cursor()
+            if self.settings.getDatabaseFulltext() and not exists:
+                self.logger.debug('Building full-text index')
+                start = time.time()
+                for column in self.fulltextColumns:
+                    cursor.execute('ALTER TABLE film ADD FULLTEXT INDEX idx_ft_{0} ({0})'.format(column))
+                self.logger.debug('Full-text index built in {} sec', int(time.time() - start))
+            elif not self.settings.getDatabaseFulltext() and exists:
+                self.logger.debug('Removing full-text index')
+                cursor.execute('ALTER TABLE film {}'.format(', '.join('DROP INDEX idx_ft_' + column for column in self.fulltextColumns)))
+            cursor.close()
+        except Exception as err:
+            self.logger.warn('Full-text index not available: {}', err)
+        self._fulltext = None
+
+    def generateFulltextSearch(self, esModel):
+        if not (self.settings.getDatabaseFulltext() and self.hasFulltext()):
+            return None
+        matches = self._generateMatches(esModel.getFulltextTerms())
+        if not matches:
+            return None
+        (condition, params) = matches
+        # relevance is negated to sort like the bm25 rank of sqlite
+        join = ' JOIN (SELECT id AS ftsid, -({}) AS ftsrank FROM film WHERE {}) fts ON fts.ftsid = film.id'.format(condition.replace(' OR ', ' + '), condition)
+        return (join, params + params)
+
+    def generateFulltextExclude(self, esModel):
+        if not (self.settings.getDatabaseFulltext() and self.hasFulltext()):
+            return None
+        matches = self._generateMatches(esModel.getFulltextExcludeTerms())
+        if matches is None:
+            return None
+        if matches == ():
+            return ('', [])
+        (condition, params) = matches
+        return ('( NOT ({}) )'.format(condition), params)
+
+    def _generateMatches(self, terms):
+        # one boolean mode MATCH per column, all words of a term are required prefixes
+        queries = {}
+        for (column, conditionString) in terms:
+            words = re.findall(r'\w+', conditionString, re.UNICODE)
+            if len(words) == 0:
+                return None
+            queries.setdefault(column, []).append('(' + ' '.join('+' + word + '*' for word in words) + ')')
+        if len(queries) == 0:
+            return ()
+        columns = sorted(queries.keys())
+        condition = ' OR '.join('MATCH({}) AGAINST (? IN BOOLEAN MODE)'.format(column) for column in columns)
+        return (condition, [' '.join(queries[column]) for column in columns])
+
+    def _deleteFulltext(self, cursor, condition):
+        # InnoDB maintains the FULLTEXT indexes
+        pass
+
+    def _summarize(self, films):
+        # aggregates new films per show like StoreQuery.sql_summaryNew
+        shows = {}
+        for film in films:
+            (idhash, channel, showid, showname, aired, letter) = (film[0], film[2], film[3], film[4], film[6], film[14])
+            entry = shows.get((channel, showid))
+            if entry is None:
+                shows[(channel, showid)] = [channel, showid, showname, letter, set([idhash]), aired, aired]
+            else:
+                entry[4].add(idhash)
+                entry[5] = min(entry[5], aired)
+                entry[6] = max(entry[6], aired)
+        return [(e[0], e[1], e[2], e[3], len(e[4]), e[5], e[6]) for e in shows.values()]
+
+    def _getSecondaryIndexes(self, cursor, table):
+        # all index names except the primary key and the unique idhash index
+        cursor.execute('SHOW INDEX FROM `{}`'.format(table))
+        keys = []
+        for row in cursor.fetchall():
+            if row[2] not in ('PRIMARY', 'idx_idhash') and row[2] not in keys:
+                keys.append(row[2])
+        return keys
+
+    def _getStatementCursor(self, cursor, aStmt):
+        # statements executed once per row are prepared on the server
+        prepared = self._prepared.get(aStmt)
+        if prepared is None:
+            try:
+                prepared = self.getConnection().cursor(prepared=True)
+            except Exception as err:
+                self.logger.debug('Prepared statements not available: {}', err)
+                prepared = False
+            self._prepared[aStmt] = prepared
+        return cursor if prepared is False else prepared
 
     def exit(self):
         if self.conn is not None:
+            try:
+                for prepared in self._prepared.values():
+                    if prepared is not False:
+                        prepared.close()
+            # pylint: disable=broad-except
+            except Exception as err:
+                self.logger.debug('Closing prepared statements failed: {}', err)
+            self._prepared = {}
+            # a pooled connection returns to the pool
             self.conn.close();
             self.conn = None
+
+
+def _isLocalInfileError(err):
+    # the connector reports a rejected file request without an error number
+    return err.errno in LOCAL_INFILE_ERRORS or 'LOAD DATA LOCAL INFILE file request rejected' in str(err)
+
+
+def _tsvValue(value):
+    # a field of a LOAD DATA file with the default escaping
+    if value is None:
+        return u'\\N'
+    return u'{}'.format(value).replace(u'\\', u'\\\\').replace(u'\t', u'\\t').replace(u'\n', u'\\n').replace(u'\r', u'\\r')
@@ -7,7 +7,9 @@ SPDX-License-Identifier: MIT
 """
 # pylint: disable=too-many-lines,line-too-long
 
+import re
 import resources.lib.appContext as appContext
+from resources.lib.storeQuery import DATABASE_VERSION
 
 
 class StoreMySQLSetup(object):
@@ -28,28 +30,71 @@ DROP TABLE IF EXISTS `status`;
 DROP TABLE IF EXISTS `show`;
 DROP TABLE IF EXISTS `film`;
 DROP TABLE IF EXISTS `channel`;
+DROP TABLE IF EXISTS `urlprefix`;
 -- ----------------------------
 --  Table structure for film
 -- ----------------------------
 DROP TABLE IF EXISTS film;
 CREATE TABLE film (
-    idhash         char(32)        NOT NULL,
+    id             integer(11)     NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    idhash         binary(16)      NOT NULL,
     dtCreated      integer(11)     NOT NULL,
     touched        smallint(1)     NOT NULL,
     channel        varchar(32)     NOT NULL,
-    showid         char(8)         NOT NULL,
+    showid         integer(11) unsigned NOT NULL,
     showname       varchar(128)    NOT NULL,
     title          varchar(128)    NOT NULL,
     aired          integer(11)     NOT NULL,
     duration       integer(11)     NOT NULL,
     description    varchar(1024)   NULL,
     url_sub        varchar(2048)    NULL,
+    url_prefix     integer(11)     NOT NULL DEFAULT 0,
     url_video      varchar(2048)    NULL,
     url_video_sd   varchar(2048)    NULL,
-    url_video_hd   varchar(2048)    NULL
+    url_video_hd   varchar(2048)    NULL,
+    letter         char(1)         NOT NULL DEFAULT '#',
+    contenthash    char(32)        NOT NULL DEFAULT ''
 ) ENGINE=InnoDB CHARSET=utf8mb4;
 --
-CREATE INDEX idx_idhash ON film (idhash);
+CREATE UNIQUE INDEX idx_idhash ON film (idhash);
+CREATE INDEX idx_channel_show ON film (channel, showname, showid);
+CREATE INDEX idx_channel_aired ON film (channel, aired);
+CREATE INDEX idx_showid_aired ON film (showid, aired);
+CREATE INDEX idx_showname ON film (showname);
+CREATE INDEX idx_aired ON film (aired);
+CREATE INDEX idx_dtCreated ON film (dtCreated);
+CREATE INDEX idx_letter_show ON film (letter, showname, showid, channel);
+-- ----------------------------
+--  Directories of the video urls
+-- ----------------------------
+CREATE TABLE urlprefix (
+    id             integer(11)     NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    prefix         varchar(2048)   CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL
+) ENGINE=InnoDB CHARSET=utf8mb4;
+CREATE INDEX idx_urlprefix ON urlprefix (prefix(255));
+-- ----------------------------
+--  Summary tables for show and channel
+-- ----------------------------
+DROP TABLE IF EXISTS `show`;
+CREATE TABLE `show` (
+    showid         integer(11) unsigned NOT NULL,
+    channel        varchar(32)     NOT NULL,
+    showname       varchar(128)    NOT NULL,
+    letter         char(1)         NOT NULL DEFAULT '#',
+    films          integer(11)     NOT NULL DEFAULT 0,
+    aired_min      integer(11)     NULL,
+    aired_max      integer(11)     NULL
+) ENGINE=InnoDB CHARSET=utf8mb4;
+CREATE UNIQUE INDEX idx_show_id ON `show` (channel, showid);
+CREATE INDEX idx_show_letter ON `show` (letter, showname);
+DROP TABLE IF EXISTS channel;
+CREATE TABLE channel (
+    channel        varchar(32)     NOT NULL,
+    films          integer(11)     NOT NULL DEFAULT 0,
+    aired_min      integer(11)     NULL,
+    aired_max      integer(11)     NULL
+) ENGINE=InnoDB CHARSET=utf8mb4;
+CREATE UNIQUE INDEX idx_channel ON channel (channel);
 -- ----------------------------
 --  Table structure for status
 -- ----------------------------
@@ -59,12 +104,152 @@ CREATE TABLE status (
     lastupdate      int(11)         NOT NULL,
     lastFullUpdate  int(11)         NOT NULL,
     filmupdate      int(11)         NOT NULL,
-    version         int(11)         NOT NULL
+    version         int(11)         NOT NULL,
+    checkpoint      text            NULL,
+    filmliste       text            NULL
 ) ENGINE=InnoDB;
 -- ----------------
-INSERT INTO status values ('UNINIT',0,0,0,3);
+INSERT INTO status values ('UNINIT',0,0,0,{},NULL,NULL);
 --
+""".format(DATABASE_VERSION)
+        # migration scripts from the previous schema version keyed by the target version
+        self._migrationScripts = {
+            4: """
+-- unique idhash for set-based imports
+DROP TABLE IF EXISTS film_migrate;
+CREATE TABLE film_migrate LIKE film;
+DROP INDEX idx_idhash ON film_migrate;
+CREATE UNIQUE INDEX idx_idhash ON film_migrate (idhash);
+INSERT IGNORE INTO film_migrate SELECT * FROM film;
+DROP TABLE film;
+RENAME TABLE film_migrate TO film;
+""",
+            5: """
+-- indexes for the browse queries
+CREATE INDEX idx_channel_show ON film (channel, showname, showid);
+CREATE INDEX idx_channel_aired ON film (channel, aired);
+CREATE INDEX idx_showid_aired ON film (showid, aired);
+CREATE INDEX idx_showname ON film (showname);
+CREATE INDEX idx_aired ON film (aired);
+CREATE INDEX idx_dtCreated ON film (dtCreated);
+""",
+            6: """
+-- precomputed start letter for the A-Z show browser
+ALTER TABLE film ADD COLUMN letter char(1) NOT NULL DEFAULT '#';
+UPDATE film SET letter = CASE WHEN BINARY UPPER(SUBSTR(showname,1,1)) BETWEEN 'A' AND 'Z' THEN UPPER(SUBSTR(showname,1,1)) WHEN SUBSTR(showname,1,1) BETWEEN '0' AND '9' THEN '0' ELSE '#' END;
+CREATE INDEX idx_letter_show ON film (letter, showname, showid, channel);
+""",
+            7: """
+-- summary tables for show and channel
+DROP TABLE IF EXISTS `show`;
+CREATE TABLE `show` (
+    showid         char(8)         NOT NULL,
+    channel        varchar(32)     NOT NULL,
+    showname       varchar(128)    NOT NULL,
+    letter         char(1)         NOT NULL DEFAULT '#',
+    films          integer(11)     NOT NULL DEFAULT 0,
+    aired_min      integer(11)     NULL,
+    aired_max      integer(11)     NULL
+) ENGINE=InnoDB CHARSET=utf8mb4;
+CREATE UNIQUE INDEX idx_show_id ON `show` (channel, showid);
+CREATE INDEX idx_show_letter ON `show` (letter, showname);
+DROP TABLE IF EXISTS channel;
+CREATE TABLE channel (
+    channel        varchar(32)     NOT NULL,
+    films          integer(11)     NOT NULL DEFAULT 0,
+    aired_min      integer(11)     NULL,
+    aired_max      integer(11)     NULL
+) ENGINE=InnoDB CHARSET=utf8mb4;
+CREATE UNIQUE INDEX idx_channel ON channel (channel);
+INSERT INTO `show` (showid, channel, showname, letter, films, aired_min, aired_max) SELECT showid, channel, min(showname), min(letter), count(*), min(aired), max(aired) FROM film GROUP BY channel, showid;
+INSERT INTO channel (channel, films, aired_min, aired_max) SELECT channel, sum(films), min(aired_min), max(aired_max) FROM `show` GROUP BY channel;
+""",
+            8: """
+-- content hash to skip unchanged films on import. The films
+-- without one are rewritten once by the next import.
+ALTER TABLE film ADD COLUMN contenthash char(32) NOT NULL DEFAULT '';
+""",
+            9: """
+-- position of an interrupted full import
+ALTER TABLE status ADD COLUMN checkpoint text NULL;
+""",
+            10: """
+-- id and HTTP validator of the last imported Filmliste
+ALTER TABLE status ADD COLUMN filmliste text NULL;
+""",
+            11: """
+-- the directory of the video url is kept once in urlprefix,
+-- the sd and hd urls are stored relative to the video url
+DROP TABLE IF EXISTS urlprefix;
+CREATE TABLE urlprefix (
+    id             integer(11)     NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    prefix         varchar(2048)   CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL
+) ENGINE=InnoDB CHARSET=utf8mb4;
+CREATE INDEX idx_urlprefix ON urlprefix (prefix(255));
+ALTER TABLE film ADD COLUMN url_prefix integer(11) NOT NULL DEFAULT 0 AFTER url_sub;
+INSERT INTO urlprefix (prefix) SELECT DISTINCT LEFT(COALESCE(url_video, ''), CHAR_LENGTH(COALESCE(url_video, '')) - CHAR_LENGTH(SUBSTRING_INDEX(COALESCE(url_video, ''), '/', -1))) COLLATE utf8mb4_bin FROM film;
+UPDATE film JOIN urlprefix ON urlprefix.prefix = LEFT(COALESCE(film.url_video, ''), CHAR_LENGTH(COALESCE(film.url_video, '')) - CHAR_LENGTH(SUBSTRING_INDEX(COALESCE(film.url_video, ''), '/', -1))) COLLATE utf8mb4_bin SET
+    film.url_prefix = urlprefix.id,
+    film.url_video_sd = CASE WHEN urlprefix.prefix <> '' AND LEFT(film.url_video_sd, CHAR_LENGTH(urlprefix.prefix)) COLLATE utf8mb4_bin = urlprefix.prefix THEN CONCAT(CHAR_LENGTH(urlprefix.prefix), '|', SUBSTRING(film.url_video_sd, CHAR_LENGTH(urlprefix.prefix) + 1)) ELSE film.url_video_sd END,
+    film.url_video_hd = CASE WHEN urlprefix.prefix <> '' AND LEFT(film.url_video_hd, CHAR_LENGTH(urlprefix.prefix)) COLLATE utf8mb4_bin = urlprefix.prefix THEN CONCAT(CHAR_LENGTH(urlprefix.prefix), '|', SUBSTRING(film.url_video_hd, CHAR_LENGTH(urlprefix.prefix) + 1)) ELSE film.url_video_hd END,
+    film.url_video = SUBSTRING(film.url_video, CHAR_LENGTH(urlprefix.prefix) + 1);
+""",
+            12: """
+-- integer primary key, binary idhash and integer showid
+DROP TABLE IF EXISTS film_migrate;
+CREATE TABLE film_migrate (
+    id             integer(11)     NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    idhash         binary(16)      NOT NULL,
+    dtCreated      integer(11)     NOT NULL,
+    touched        smallint(1)     NOT NULL,
+    channel        varchar(32)     NOT NULL,
+    showid         integer(11) unsigned NOT NULL,
+    showname       varchar(128)    NOT NULL,
+    title          varchar(128)    NOT NULL,
+    aired          integer(11)     NOT NULL,
+    duration       integer(11)     NOT NULL,
+    description    varchar(1024)   NULL,
+    url_sub        varchar(2048)    NULL,
+    url_prefix     integer(11)     NOT NULL DEFAULT 0,
+    url_video      varchar(2048)    NULL,
+    url_video_sd   varchar(2048)    NULL,
+    url_video_hd   varchar(2048)    NULL,
+    letter         char(1)         NOT NULL DEFAULT '#',
+    contenthash    char(32)        NOT NULL DEFAULT ''
+) ENGINE=InnoDB CHARSET=utf8mb4;
+INSERT INTO film_migrate (
+    idhash, dtCreated, touched, channel, showid, showname, title, aired, duration, description,
+    url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+)
+SELECT
+    UNHEX(idhash), dtCreated, touched, channel, COALESCE(CONV(showid, 16, 10), 0), showname, title, aired, duration, description,
+    url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+FROM film;
+DROP TABLE film;
+RENAME TABLE film_migrate TO film;
+CREATE UNIQUE INDEX idx_idhash ON film (idhash);
+CREATE INDEX idx_channel_show ON film (channel, showname, showid);
+CREATE INDEX idx_channel_aired ON film (channel, aired);
+CREATE INDEX idx_showid_aired ON film (showid, aired);
+CREATE INDEX idx_showname ON film (showname);
+CREATE INDEX idx_aired ON film (aired);
+CREATE INDEX idx_dtCreated ON film (dtCreated);
+CREATE INDEX idx_letter_show ON film (letter, showname, showid, channel);
+DROP TABLE IF EXISTS `show`;
+CREATE TABLE `show` (
+    showid         integer(11) unsigned NOT NULL,
+    channel        varchar(32)     NOT NULL,
+    showname       varchar(128)    NOT NULL,
+    letter         char(1)         NOT NULL DEFAULT '#',
+    films          integer(11)     NOT NULL DEFAULT 0,
+    aired_min      integer(11)     NULL,
+    aired_max      integer(11)     NULL
+) ENGINE=InnoDB CHARSET=utf8mb4;
+CREATE UNIQUE INDEX idx_show_id ON `show` (channel, showid);
+CREATE INDEX idx_show_letter ON `show` (letter, showname);
+INSERT INTO `show` (showid, channel, showname, letter, films, aired_min, aired_max) SELECT showid, channel, min(showname), min(letter), count(*), min(aired), max(aired) FROM film GROUP BY channel, showid;
 """
+        }
 
     def setupDatabase(self):
         self.logger.debug('Start DB setup for schema {}', self.settings.getDatabaseSchema())
@@ -98,3 +283,80 @@ INSERT INTO status values ('UNINIT',0,0,0,3);
         cursor.close()
         con.commit()
         self.logger.debug('End DB setup')
+
+    def migrateDatabase(self, fromVersion):
+        """
+        Migrates an existing database to the current schema version.
+        MySQL commits every DDL statement implicitly, so the scripts
+        run statement by statement and every completed statement is
+        recorded in the table `migration`. An interrupted migration
+        continues after the last recorded statement.
+
+        Args:
+            fromVersion(int): schema version of the existing database
+        """
+        con = self.conn.getConnection()
+        cursor = con.cursor()
+        cursor.execute('CREATE TABLE IF NOT EXISTS migration (version integer(11) NOT NULL, step integer(11) NOT NULL) ENGINE=InnoDB')
+        for version in range(int(fromVersion) + 1, DATABASE_VERSION + 1):
+            self.logger.debug('Migrate DB to version {}', version)
+            cursor.execute('SELECT step FROM migration WHERE version = %s', (version,))
+            done = set(row[0] for row in cursor.fetchall())
+            for (step, statement) in enumerate(_splitScript(self._migrationScripts[version])):
+                if step in done:
+                    continue
+                if self._isApplied(cursor, statement):
+                    # DDL committed right before an interruption
+                    self.logger.debug("Statement already applied '{}'", statement)
+                else:
+                    cursor.execute(statement)
+                    self.logger.debug("Number of rows affected by statement '{}': {}", statement, cursor.rowcount)
+                # recorded in the transaction of a DML statement
+                cursor.execute('INSERT INTO migration (version, step) VALUES (%s, %s)', (version, step))
+                con.commit()
+            cursor.execute('UPDATE status SET version = %s', (version,))
+            cursor.execute('DELETE FROM migration WHERE version = %s', (version,))
+            con.commit()
+        cursor.execute('DROP TABLE migration')
+        cursor.close()
+        self.logger.debug('End DB migration')
+
+    def _isApplied(self, cursor, statement):
+        # checks the schema for the result of a DDL statement that cannot be repeated
+        match = re.match(r'ALTER TABLE `?(\w+)`? ADD COLUMN `?(\w+)`?', statement)
+        if match:
+            return self._hasColumn(cursor, match.group(1), match.group(2))
+        match = re.match(r'CREATE (?:UNIQUE )?INDEX `?(\w+)`? ON `?(\w+)`?', statement)
+        if match:
+            return self._hasIndex(cursor, match.group(2), match.group(1))
+        match = re.match(r'DROP INDEX `?(\w+)`? ON `?(\w+)`?', statement)
+        if match:
+            return not self._hasIndex(cursor, match.group(2), match.group(1))
+        match = re.match(r'CREATE TABLE `?(\w+)`?', statement)
+        if match:
+            return self._hasTable(cursor, match.group(1))
+        match = re.match(r'DROP TABLE `?(\w+)`?;?$', statement)
+        if match:
+            return not self._hasTable(cursor, match.group(1))
+        match = re.match(r'RENAME TABLE `?(\w+)`? TO `?(\w+)`?$', statement)
+        if match:
+            return not self._hasTable(cursor, match.group(1)) and self._hasTable(cursor, match.group(2))
+        return False
+
+    def _hasTable(self, cursor, table):
+        cursor.execute('SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', (table,))
+        return len(cursor.fetchall()) > 0
+
+    def _hasColumn(self, cursor, table, column):
+        cursor.execute('SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s', (table, column))
+        return len(cursor.fetchall()) > 0
+
+    def _hasIndex(self, cursor, table, index):
+        cursor.execute('SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s', (table, index))
+        return len(cursor.fetchall()) > 0
+
+
+def _splitScript(script):
+    # the statements of a migration script without the comment lines
+    lines = [line for line in script.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in re.split(r';\s*$', '\n'.join(lines), flags=re.MULTILINE) if statement.strip()]
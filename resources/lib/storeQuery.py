@@ -8,12 +8,17 @@ SPDX-License-Identifier: MIT
 
 # pylint: disable=too-many-lines,line-too-long
 import time
+import json
+import binascii
 import resources.lib.appContext as appContext
 import resources.lib.mvutils as mvutils
-from resources.lib.storeCache import StoreCache
+from resources.lib.storeCache import StoreCache, CACHE_STATISTICS_INTERVAL
 from resources.lib.model.film import Film
 import resources.lib.extendedSearchModel as ExtendedSearchModel
 
+# version of the database schema
+DATABASE_VERSION = 12
+
 
 class StoreQuery(object):
 
@@ -22,23 +27,138 @@ class StoreQuery(object):
         self.notifier = appContext.MVNOTIFIER
         self.settings = appContext.MVSETTINGS
         self._cache = StoreCache()
-        self.sql_query_films = "SELECT idhash, title, showname, channel, description, duration, aired, url_sub, url_video, url_video_sd, url_video_hd FROM film"
-        self.sql_cond_recent = "({} > {})".format("aired" if self.settings.getRecentMode() == 0 else "dtCreated",(int(time.time())-self.settings.getMaxAge()))
-        self.sql_cond_nofuture = " AND ( aired < {} )".format(int(time.time())) if self.settings.getNoFutur() else ""
+        self._fulltext = None
+        self._fullImport = False
+        # the video url is stored without its directory, see _prepareFilms.
+        # The binary idhash is returned as hex string like in the plugin urls.
+        self.sql_query_films = "SELECT lower(hex(idhash)), title, showname, channel, description, duration, aired, url_sub, COALESCE((SELECT prefix FROM urlprefix WHERE id = film.url_prefix), '') || url_video, url_video_sd, url_video_hd FROM film"
+        # the current time is a parameter of the conditions to keep the cache keys stable
+        self.sql_cond_recent = "({} > ?)".format("aired" if self.settings.getRecentMode() == 0 else "dtCreated")
+        self.sql_cond_nofuture = " AND ( aired < ? )" if self.settings.getNoFutur() else ""
         self.sql_cond_minlength = " AND ( duration >= %d )" % (self.settings.getMinLength() * 60) if self.settings.getMinLength() > 0 else ""
+        self.sql_cond_show_nofuture = " AND ( aired_min < ? )" if self.settings.getNoFutur() else ""
+        # the integer showid as the 8 hex digits of the plugin urls
+        self.sql_showIdHex = "printf('%08x', showid)"
         # IMPORT SQL
+        self.sql_checkpointUpdate = 'UPDATE status SET checkpoint = ?'
+        self.sql_urlPrefixSelect = 'SELECT prefix, id FROM urlprefix WHERE prefix IN ({})'
+        self.sql_urlPrefixInsert = 'INSERT INTO urlprefix (prefix) VALUES (?)'
+        self.sql_urlPrefixParam = '?'
+        self.sql_urlPrefixCleanup = 'DELETE FROM urlprefix WHERE id NOT IN (SELECT url_prefix FROM film)'
+        # every batch is written to a staging table and merged set-based into film
+        self.sql_createStaging = """
+            CREATE TEMP TABLE IF NOT EXISTS film_import (
+                idhash BLOB NOT NULL,
+                dtCreated integer(11,0) NOT NULL,
+                channel TEXT(32,0) NOT NULL,
+                showid integer(11,0) NOT NULL,
+                showname TEXT(128,0) NOT NULL,
+                title TEXT(128,0) NOT NULL,
+                aired integer(11,0),
+                duration integer(11,0),
+                description TEXT(1024,0),
+                url_sub TEXT(2048,0),
+                url_prefix integer(11,0) NOT NULL DEFAULT 0,
+                url_video TEXT(2048,0),
+                url_video_sd TEXT(2048,0),
+                url_video_hd TEXT(2048,0),
+                letter TEXT(1,0) NOT NULL DEFAULT '#',
+                contenthash TEXT(32,0) NOT NULL
+            )"""
         self.sql_pStmtInsert = """
-            INSERT INTO film (
+            INSERT INTO film_import (
+                idhash, dtCreated, channel, showid, showname, title,
+                aired, duration, description,
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+            )
+            VALUES (
+                ?, ?, ?, ?, ?, ?,
+                ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?
+            )"""
+        self.sql_pStmtUpdate = """UPDATE film SET touched = touched+1 WHERE idhash IN (SELECT idhash FROM film_import)"""
+        # films with an unchanged content hash are not written at all
+        self.sql_importSkipUnchanged = """
+            DELETE FROM film_import WHERE EXISTS (
+                SELECT 1 FROM film WHERE film.idhash = film_import.idhash AND film.contenthash = film_import.contenthash
+            )"""
+        # the values not covered by the idhash of the films with a changed content hash
+        self.sql_importChanged = """
+            SELECT aired, duration, description, url_sub, url_video_sd, url_video_hd, contenthash, idhash
+            FROM film_import WHERE idhash IN (SELECT idhash FROM film)"""
+        self.sql_pStmtUpdateChanged = """
+            UPDATE film SET
+                aired = ?, duration = ?, description = ?,
+                url_sub = ?, url_video_sd = ?, url_video_hd = ?, contenthash = ?
+            WHERE idhash = ?"""
+        self.sql_pStmtMerge = """
+            INSERT OR IGNORE INTO film (
                 idhash, touched, dtCreated, channel, showid, showname, title,
                 aired, duration, description,
-                url_sub, url_video, url_video_sd, url_video_hd
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+            )
+            SELECT
+                idhash, 1, dtCreated, channel, showid, showname, title,
+                aired, duration, description,
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+            FROM film_import"""
+        # full imports into a shadow table swapped in at the end
+        self.sql_createShadow = """
+            CREATE TABLE film_new (
+                id INTEGER PRIMARY KEY,
+                idhash BLOB NOT NULL,
+                dtCreated integer(11,0) NOT NULL DEFAULT 0,
+                touched integer(1,0) NOT NULL DEFAULT 1,
+                channel TEXT(32,0) NOT NULL COLLATE NOCASE,
+                showid integer(11,0) NOT NULL,
+                showname TEXT(128,0) NOT NULL COLLATE NOCASE,
+                title TEXT(128,0) NOT NULL COLLATE NOCASE,
+                aired integer(11,0),
+                duration integer(11,0),
+                description TEXT(1024,0) COLLATE NOCASE,
+                url_sub TEXT(2048,0),
+                url_prefix integer(11,0) NOT NULL DEFAULT 0,
+                url_video TEXT(2048,0),
+                url_video_sd TEXT(2048,0),
+                url_video_hd TEXT(2048,0),
+                letter TEXT(1,0) NOT NULL DEFAULT '#',
+                contenthash TEXT(32,0) NOT NULL DEFAULT ''
+            )"""
+        self.sql_pStmtInsertShadow = """
+            INSERT INTO film_new (
+                idhash, dtCreated, channel, showid, showname, title,
+                aired, duration, description,
+                url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
             )
             VALUES (
-                ?, 1, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?,
                 ?, ?, ?,
-                ?, ?, ?, ?
+                ?, ?, ?, ?, ?, ?, ?
             )"""
-        self.sql_pStmtUpdate = """UPDATE film SET touched = touched+1 WHERE idhash = ?"""
+        self.sql_shadowDedup = "DELETE FROM film_new WHERE rowid NOT IN (SELECT min(rowid) FROM film_new GROUP BY idhash)"
+        self.sql_shadowKeepCreated = """
+            UPDATE film_new SET dtCreated = (SELECT film.dtCreated FROM film WHERE film.idhash = film_new.idhash)
+            WHERE idhash IN (SELECT idhash FROM film)"""
+        # SUMMARY SQL
+        # films per show and channel maintained by the importer for the browse queries
+        self.sql_summaryNew = "SELECT channel, showid, min(showname), min(letter), count(DISTINCT idhash), min(aired), max(aired) FROM film_import GROUP BY channel, showid"
+        self.sql_summaryShowInsert = "INSERT OR IGNORE INTO `show` (showid, channel, showname, letter, films, aired_min, aired_max) VALUES (?, ?, ?, ?, 0, ?, ?)"
+        self.sql_summaryShowUpdate = "UPDATE `show` SET films = films + ?, aired_min = CASE WHEN aired_min > ? THEN ? ELSE aired_min END, aired_max = CASE WHEN aired_max < ? THEN ? ELSE aired_max END WHERE channel = ? AND showid = ?"
+        self.sql_summaryChannelInsert = "INSERT OR IGNORE INTO channel (channel, films, aired_min, aired_max) VALUES (?, 0, ?, ?)"
+        self.sql_summaryChannelUpdate = "UPDATE channel SET films = films + ?, aired_min = CASE WHEN aired_min > ? THEN ? ELSE aired_min END, aired_max = CASE WHEN aired_max < ? THEN ? ELSE aired_max END WHERE channel = ?"
+        self.sql_summaryRebuild = [
+            "DELETE FROM `show`",
+            "INSERT INTO `show` (showid, channel, showname, letter, films, aired_min, aired_max) SELECT showid, channel, min(showname), min(letter), count(*), min(aired), max(aired) FROM {} GROUP BY channel, showid",
+            "DELETE FROM channel",
+            "INSERT INTO channel (channel, films, aired_min, aired_max) SELECT channel, sum(films), min(aired_min), max(aired_max) FROM `show` GROUP BY channel"
+        ]
+        # FULLTEXT SQL
+        # optional FTS5 index over film maintained by the importer
+        self.sql_fulltextCreate = "CREATE VIRTUAL TABLE {} USING fts5(showname, title, description, content='film', tokenize='unicode61 remove_diacritics 1')"
+        self.sql_fulltextInsert = "INSERT INTO {} (rowid, showname, title, description) SELECT rowid, showname, title, description FROM {}"
+        self.sql_fulltextDelete = "INSERT INTO film_fts (film_fts, rowid, showname, title, description) SELECT 'delete', rowid, showname, title, description FROM film"
+        self.sql_fulltextSearch = " JOIN (SELECT rowid AS ftsid, bm25(film_fts) AS ftsrank FROM film_fts WHERE film_fts MATCH ?) fts ON fts.ftsid = film.rowid"
+        self.sql_fulltextExclude = "( film.rowid NOT IN (SELECT rowid FROM film_fts WHERE film_fts MATCH ?) )"
 
     # ABSTRACT
     def getConnection(self):
@@ -104,9 +224,14 @@ class StoreQuery(object):
             return self.sql_pStmtUpdate
 
     #
-    def extendedSearch(self, esModel):
+    def extendedSearch(self, esModel, cursor=None):
+        """
+        Retrieve a page of films for an extended search. One more
+        film than the page size is returned if there is a next page.
+        """
         self.logger.debug('extendedSearch')
         #
+        esModel.setCursor(cursor)
         cached_data = self._cache.load_cache('extendedSearch', esModel.getCacheKey())
         if cached_data is not None:
             rs = cached_data;
@@ -120,14 +245,25 @@ class StoreQuery(object):
         rs = None
         params = []
         sql = self.sql_query_films
+        #
+        fulltextSearch = self.generateFulltextSearch(esModel)
+        if fulltextSearch is not None:
+            (fulltextJoin, fulltextParams) = fulltextSearch
+            sql += fulltextJoin
+            params.extend(fulltextParams)
         sql += ' WHERE (1=1)'
         #
-        (mixedSearchCondition, mixedSearchParams) = esModel.generateShowTitleDescription()
-        if (mixedSearchCondition != ''):
-            sql += ' AND ' + mixedSearchCondition
-            params.extend(mixedSearchParams)
+        if fulltextSearch is None:
+            (mixedSearchCondition, mixedSearchParams) = esModel.generateShowTitleDescription()
+            if (mixedSearchCondition != ''):
+                sql += ' AND ' + mixedSearchCondition
+                params.extend(mixedSearchParams)
         #
-        (excludeCondition, excludeParams) = esModel.generateExclude()
+        fulltextExclude = self.generateFulltextExclude(esModel)
+        if fulltextExclude is not None:
+            (excludeCondition, excludeParams) = fulltextExclude
+        else:
+            (excludeCondition, excludeParams) = esModel.generateExclude()
         if (excludeCondition != ''):
             sql += ' AND ' + excludeCondition
             params.extend(excludeParams)
@@ -168,9 +304,20 @@ class StoreQuery(object):
             sql += " AND " + recentOnlyCondition
             params.extend(recentParams)
         #
-        sql += ' ORDER BY aired DESC '
+        if fulltextSearch is not None:
+            # bm25 rank (lower is better) fading with the age of the film.
+            # The age is counted from midnight to keep the order of the pages.
+            sql += ' ORDER BY fts.ftsrank / (1 + (CASE WHEN aired < {0} THEN {0} - aired ELSE 0 END) / 31536000.0), aired DESC, idhash DESC '.format(int(time.time()) // 86400 * 86400)
+        else:
+            # pages continue after the last film of the previous page
+            (cursorCondition, cursorParams) = esModel.generateCursor()
+            if cursorCondition != '':
+                sql += ' AND ' + cursorCondition
+                params.extend(cursorParams)
+            sql += ' ORDER BY aired DESC, idhash DESC '
         #
-        maxRowsCondition = esModel.generateMaxRows()
+        # the rank has no stable key, ranked pages are counted
+        maxRowsCondition = esModel.generateMaxRows(fulltextSearch is not None)
         if (maxRowsCondition != ''):
              sql += maxRowsCondition
         #
@@ -185,7 +332,74 @@ class StoreQuery(object):
             raise
         return rs
 
-    def getQuickSearch(self, searchTerm):
+    def hasFulltext(self):
+        """ True if the full-text index exists """
+        if self._fulltext is None:
+            self._fulltext = self._checkFulltext()
+        return self._fulltext
+
+    def _checkFulltext(self):
+        rs = self.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'film_fts'")
+        return rs[0][0] > 0
+
+    def setupFulltext(self):
+        """
+        Creates or drops the full-text index according to the
+        settings. A new index is built from the current films.
+        """
+        try:
+            exists = self._checkFulltext()
+            if self.settings.getDatabaseFulltext() and not exists:
+                self.logger.debug('Building full-text index')
+                start = time.time()
+                cursor = self.getConnection().cursor()
+                cursor.execute(self.sql_fulltextCreate.format('film_fts'))
+                cursor.execute(self.sql_fulltextInsert.format('film_fts', 'film'))
+                cursor.close()
+                self.getConnection().commit()
+                self.logger.debug('Full-text index built in {} sec', int(time.time() - start))
+            elif not self.settings.getDatabaseFulltext() and exists:
+                self.logger.debug('Removing full-text index')
+                self.getConnection().cursor().execute('DROP TABLE film_fts')
+                self.getConnection().commit()
+        except Exception as err:
+            # e.g. the sqlite library was built without FTS5
+            self.logger.warn('Full-text index not available: {}', err)
+            self.getConnection().rollback()
+            # the create statement may have been committed already
+            self.getConnection().cursor().execute('DROP TABLE IF EXISTS film_fts')
+            self.getConnection().commit()
+        self._fulltext = None
+
+    def generateFulltextSearch(self, esModel):
+        """
+        Full-text replacement for the show/title/description search
+        of the model. Returns a join providing `fts.ftsrank` and its
+        parameters or None if the like based search has to be used.
+        """
+        if not (self.settings.getDatabaseFulltext() and self.hasFulltext()):
+            return None
+        query = esModel.generateFulltextMatch()
+        if not query:
+            return None
+        return (self.sql_fulltextSearch, [query])
+
+    def generateFulltextExclude(self, esModel):
+        """
+        Full-text replacement for the excluded titles of the model.
+        Returns condition and parameters or None if the like based
+        condition has to be used.
+        """
+        if not (self.settings.getDatabaseFulltext() and self.hasFulltext()):
+            return None
+        query = esModel.generateFulltextExclude()
+        if query is None:
+            return None
+        if query == '':
+            return ('', [])
+        return (self.sql_fulltextExclude, [query])
+
+    def getQuickSearch(self, searchTerm, cursor=None):
         """
         Retrieve data for quick search
         We will check for search term to be (partially) present in showname or title
@@ -194,16 +408,20 @@ class StoreQuery(object):
         ----------
         searchTerm : str, optional
             search term which is contained in showname or title
+        cursor : str, optional
+            position of the page, None for the first page
         Returns
         -------
         Array
-            Resultset of the query
+            Resultset of the query, one more row than the page
+            size if there is a next page
         """
         self.logger.debug('getQuickSearch')
         #
         esModel = ExtendedSearchModel.ExtendedSearchModel('')
         esModel.setShow(searchTerm)
         esModel.setTitle(searchTerm)
+        esModel.setCursor(cursor)
         #cacheKey = searchTerm + esModel.generateMinLength() + esModel.generateIgnoreTrailer() + esModel.generateMaxRows()
         cacheKey = esModel.getCacheKey()
         cached_data = self._cache.load_cache('quickSearch', cacheKey)
@@ -234,17 +452,21 @@ class StoreQuery(object):
         #
         return rs
 
-    def getRecentFilms(self, channelId=''):
+    def getRecentFilms(self, channelId='', cursor=None):
         """
-        Retrieve data for recent films
+        Retrieve a page of recent films. One more film than
+        the page size is returned if there is a next page.
         """
         self.logger.debug('getRecentFilms')
         #
         esModel = ExtendedSearchModel.ExtendedSearchModel('')
         esModel.setRecentOnly(1)
         esModel.setChannel(channelId)
+        esModel.setCursor(cursor)
         #
-        #cacheKey = channelId + esModel.generateMinLength() + esModel.generateIgnoreTrailer() + esModel.generateRecentCondition() + esModel.generateMaxRows()
+        return self._getRecentFilms(esModel)
+
+    def _getRecentFilms(self, esModel):
         cacheKey = esModel.getCacheKey()
         cached_data = self._cache.load_cache('recentFilms', cacheKey)
         if cached_data is not None:
@@ -252,21 +474,48 @@ class StoreQuery(object):
         else:
             rs = self.extendedSearchQuery(esModel)
             self._cache.save_cache('recentFilms', cacheKey, rs)
-        #
-        if len(rs) >= self.settings.getMaxResults():
-            self.notifier.show_limit_results(self.settings.getMaxResults())
-        #
         return rs
 
-    def getFilms(self, channel='', showIds=''):
+    def warmupCache(self, searches):
         """
-        Retrieve data for recent films
+        Caches the results of the main menu entries and of the
+        given extended searches after an update
+
+        Args:
+            searches(list): ExtendedSearchModel objects
+        """
+        if not self.settings.getCaching():
+            return
+        self.logger.debug('warmupCache')
+        start = time.time()
+        # warm-up queries are no hits or misses of the user
+        self._cache.setStatistics(False)
+        try:
+            self.getChannels()
+            self.getChannelsRecent()
+            self.getStartLettersOfShows()
+            self.getLivestreams()
+            esModel = ExtendedSearchModel.ExtendedSearchModel('')
+            esModel.setRecentOnly(1)
+            esModel.setChannel('')
+            self._getRecentFilms(esModel)
+            for esModel in searches:
+                self.extendedSearch(esModel)
+        finally:
+            self._cache.setStatistics(True)
+        self.logger.debug('warmupCache processed: {} sec', time.time() - start)
+
+    def getFilms(self, channel='', showIds='', cursor=None):
+        """
+        Retrieve a page of films of a channel or show. One more
+        film than the page size is returned if there is a next page.
         """
         self.logger.debug('getFilms')
         #
         esModel = ExtendedSearchModel.ExtendedSearchModel('')
         esModel.setChannel(channel)
         esModel.setShowId(showIds)
+        esModel.setCursor(cursor)
         #
         #cacheKey = channel + showIds + esModel.generateMinLength() + esModel.generateIgnoreTrailer() + esModel.generateRecentCondition() + esModel.generateMaxRows()
         cacheKey = esModel.getCacheKey()
@@ -277,9 +526,6 @@ class StoreQuery(object):
             rs = self.extendedSearchQuery(esModel)
             self._cache.save_cache('films', cacheKey, rs)
         #
-        if len(rs) >= self.settings.getMaxResults():
-            self.notifier.show_limit_results(self.settings.getMaxResults())
-        #
         return rs
 
     def getChannels(self):
@@ -291,7 +537,7 @@ class StoreQuery(object):
             return cached_data
         #
         try:
-            sql = "SELECT channel AS channelid, channel, 0 as count FROM film GROUP BY channel ORDER BY channel ASC"
+            sql = "SELECT channel AS channelid, channel, 0 as count FROM channel ORDER BY channel ASC"
             rs = self.execute(sql)
             self._cache.save_cache('channels', '', rs)
 
@@ -330,7 +576,8 @@ class StoreQuery(object):
             cached_data = self._cache.load_cache('channels_recent', sql)
             if cached_data is not None:
                 return cached_data
-            rs = self.execute(sql)
+            params = [int(time.time()) - self.settings.getMaxAge()] + self._getNoFutureParams()
+            rs = self.execute(sql, params)
             #
             self._cache.save_cache('channels_recent', sql, rs)
             #
@@ -346,11 +593,10 @@ class StoreQuery(object):
         self.logger.debug('getShowsByChannnel')
         #
         try:
-            sql = "SELECT showid, channel as channelId, showname, channel from film where (channel=?) "
-            # duration filter
-            sql += self.sql_cond_nofuture
-            # no future
-            sql += self.sql_cond_minlength
+            (source, conditions, params) = self._getShowSource()
+            sql = "SELECT " + self.sql_showIdHex + ", channel as channelId, showname, channel from " + source + " where (channel=?) "
+            # no future / duration filter
+            sql += conditions
             #
             sql += " GROUP BY showid, channel, showname ORDER BY showname asc"
             #
@@ -358,7 +604,7 @@ class StoreQuery(object):
             cached_data = self._cache.load_cache('showsByChannel', cacheKey)
             if cached_data is not None:
                 return cached_data
-            rs = self.execute(sql, (channelId,))
+            rs = self.execute(sql, [channelId] + params)
             #
             self._cache.save_cache('showsByChannel', cacheKey, rs)
             #
@@ -374,25 +620,24 @@ class StoreQuery(object):
         self.logger.debug('getShowsByLetter')
         #
         try:
+            (source, conditions, params) = self._getShowSource()
             if self.settings.getGroupShow():
-                sql = "SELECT GROUP_CONCAT(DISTINCT(showid)), GROUP_CONCAT(DISTINCT(channel)), showname, GROUP_CONCAT(DISTINCT(channel)) FROM film WHERE (CASE WHEN UPPER(SUBSTR(showname,1,1)) between 'A' and 'Z' THEN UPPER(SUBSTR(showname,1,1)) WHEN SUBSTR(showname,1,1) between '0' and '9' THEN '0' ELSE '#' END = ?) "
+                sql = "SELECT GROUP_CONCAT(DISTINCT(" + self.sql_showIdHex + ")), GROUP_CONCAT(DISTINCT(channel)), showname, GROUP_CONCAT(DISTINCT(channel)) FROM " + source + " WHERE (letter = ?) "
             else:
-                sql = "SELECT showid, channel as channelId, showname, channel FROM film WHERE (CASE WHEN UPPER(SUBSTR(showname,1,1)) between 'A' and 'Z' THEN UPPER(SUBSTR(showname,1,1)) WHEN SUBSTR(showname,1,1) between '0' and '9' THEN '0' ELSE '#' END = ?) "
-            # duration filter
-            sql += self.sql_cond_nofuture
-            # no future
-            sql += self.sql_cond_minlength
+                sql = "SELECT " + self.sql_showIdHex + ", channel as channelId, showname, channel FROM " + source + " WHERE (letter = ?) "
+            # no future / duration filter
+            sql += conditions
             #
             if self.settings.getGroupShow():
                 sql += " GROUP BY showname ORDER BY showname asc"
             else:
-                sql += " GROUP BY showid, channel, showname ORDER BY showname asc"
+                sql += " GROUP BY showname, showid, channel ORDER BY showname asc"
             #
             cacheKey = aLetter + sql
             cached_data = self._cache.load_cache('showsByLetter', cacheKey)
             if cached_data is not None:
                 return cached_data
-            rs = self.execute(sql, (aLetter,))
+            rs = self.execute(sql, [aLetter] + params)
             #
             self._cache.save_cache('showsByLetter', cacheKey, rs)
             #
@@ -408,21 +653,20 @@ class StoreQuery(object):
         self.logger.debug('getStartLettersOfShows')
         #
         try:
-            sql = "SELECT CASE WHEN UPPER(SUBSTR(showname,1,1)) between 'A' and 'Z' THEN UPPER(SUBSTR(showname,1,1)) WHEN SUBSTR(showname,1,1) between '0' and '9' THEN '0' ELSE '#' END, COUNT(DISTINCT(SHOWID)) FROM film where (1=1) "
+            (source, conditions, params) = self._getShowSource()
+            sql = "SELECT letter, COUNT(DISTINCT(SHOWID)) FROM " + source + " where (1=1) "
             # recent
             # sql += " AND " + self.sql_cond_recent
-            # duration filter
-            sql += self.sql_cond_nofuture
-            # no future
-            sql += self.sql_cond_minlength
+            # no future / duration filter
+            sql += conditions
             #
-            sql += " GROUP BY CASE WHEN UPPER(SUBSTR(showname,1,1)) between 'A' and 'Z' THEN UPPER(SUBSTR(showname,1,1)) WHEN SUBSTR(showname,1,1) between '0' and '9' THEN '0' ELSE '#' END"
-            sql += " ORDER BY CASE WHEN UPPER(SUBSTR(showname,1,1)) between 'A' and 'Z' THEN UPPER(SUBSTR(showname,1,1)) WHEN SUBSTR(showname,1,1) between '0' and '9' THEN '0' ELSE '#' END asc"
+            sql += " GROUP BY letter"
+            sql += " ORDER BY letter asc"
             #
             cached_data = self._cache.load_cache('letters', sql)
             if cached_data is not None:
                 return cached_data
-            rs = self.execute(sql)
+            rs = self.execute(sql, params)
             #
             self._cache.save_cache('letters', sql, rs)
             #
@@ -433,6 +677,32 @@ class StoreQuery(object):
 
         return rs
 
+    def _getShowSource(self):
+        # show queries read the show summary unless the duration filter needs the films
+        if self.settings.getMinLength() > 0:
+            return ('film', self.sql_cond_nofuture + self.sql_cond_minlength, self._getNoFutureParams())
+        return ('`show`', self.sql_cond_show_nofuture, self._getNoFutureParams())
+
+    def _getNoFutureParams(self):
+        # parameters of sql_cond_nofuture and sql_cond_show_nofuture
+        return [int(time.time())] if self.settings.getNoFutur() else []
+
+    def getCacheStatistics(self):
+        """ Returns entries, size, hits and misses of the result cache """
+        return self._cache.getStatistics()
+
+    def keepCacheStatistics(self):
+        """
+        Saves the hit and miss counters of the result cache
+        periodically. Used by the long running query server,
+        the counters of a plugin call are not saved.
+        """
+        self._cache.setStatisticsInterval(CACHE_STATISTICS_INTERVAL)
+
+    def saveCacheStatistics(self):
+        """ Saves the pending hit and miss counters of the result cache """
+        self._cache.saveStatistics()
+
     def retrieve_film_info(self, filmid):
         """
         Retrieves the spcified film information
@@ -444,14 +714,19 @@ class StoreQuery(object):
         self.logger.debug('retrieve_film_info')
         #
         try:
-            condition = "( idhash='{}' )".format(filmid)
+            idhash = self._getHash(filmid)
+        except (TypeError, ValueError):
+            self.logger.debug('Invalid film id {}', filmid)
+            return None
+        try:
             rs = self.execute(
                 self.sql_query_films +
-                ' WHERE ' +
-                condition
+                ' WHERE ( idhash = ? )',
+                (idhash,)
             )
-            film = Film()
-            for (film.filmid, film.title, film.show, film.channel, film.description, film.seconds, film.aired, film.url_sub, film.url_video, film.url_video_sd, film.url_video_hd) in rs:
+            for row in rs:
+                film = Film()
+                film.init(*row)
                 return film
         except Exception as err:
             self.logger.error('Database error: {}', err)
@@ -480,7 +755,11 @@ class StoreQuery(object):
             status['filmUpdate'] = result[0][3]
             status['version'] = result[0][4]
             #
-            result = self.execute('SELECT count(distinct(channel)),count(distinct(showid)),count(*) FROM film')
+            try:
+                result = self.execute('SELECT (SELECT count(*) FROM channel), (SELECT count(distinct(showid)) FROM `show`), (SELECT COALESCE(sum(films), 0) FROM channel)')
+            except Exception:
+                # databases before schema version 7 have no summary tables
+                result = self.execute('SELECT count(distinct(channel)),count(distinct(showid)),count(*) FROM film')
             status['chn'] = result[0][0]
             status['shw'] = result[0][1]
             status['mov'] = result[0][2]
@@ -525,7 +804,10 @@ class StoreQuery(object):
             cursor = self.getConnection().cursor()
             cursor.execute("update film set touched = 0")
             cnt = cursor.rowcount
+            self._setCheckpoint(cursor, None)
             cursor.close()
+            # the films of the list are marked until import_end
+            self._fullImport = True
             return cnt
         except Exception as err:
             self.logger.error('Database error: {}', err)
@@ -534,45 +816,334 @@ class StoreQuery(object):
 
     def import_end(self):
         self.logger.debug('import_end')
+        self._fullImport = False
         try:
             cursor = self.getConnection().cursor()
+            self._deleteFulltext(cursor, "touched = 0")
             cursor.execute("delete from film where touched = 0")
             cnt = cursor.rowcount
+            cursor.execute(self.sql_urlPrefixCleanup)
+            self._rebuildSummary(cursor)
+            self._setCheckpoint(cursor, None)
             cursor.close()
+            self.getConnection().commit()
+            self.analyze()
             return cnt
         except Exception as err:
             self.logger.error('Database error: {}', err)
             self.notifier.show_database_error(err)
             raise
 
-    def import_films(self, filmArray):
+    def import_resume(self, shadow):
+        """
+        Continues an interrupted full import. The films of the list
+        imported so far stay marked, the shadow table is kept.
+
+        Args:
+            shadow(bool): the import writes to the shadow table
+        """
+        self.logger.debug('import_resume')
+        self._fullImport = not shadow
+
+    def getImportCheckpoint(self):
+        """
+        Returns the position of an interrupted full import as saved
+        with the last imported batch or None
+        """
+        self.logger.debug('getImportCheckpoint')
+        try:
+            result = self.execute('SELECT checkpoint FROM status')
+            if len(result) == 0 or result[0][0] is None:
+                return None
+            return json.loads(result[0][0])
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def getLastFilmliste(self):
+        """
+        Returns the url, HTTP validator and id of the last
+        imported Filmliste or None
+        """
+        self.logger.debug('getLastFilmliste')
+        try:
+            result = self.execute('SELECT filmliste FROM status')
+            if len(result) == 0 or result[0][0] is None:
+                return None
+            return json.loads(result[0][0])
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def setLastFilmliste(self, filmliste):
+        """
+        Saves the url, HTTP validator and id of the imported Filmliste
+
+        Args:
+            filmliste(dict): url, validator and id of the Filmliste
+        """
+        self.logger.debug('setLastFilmliste {}', filmliste)
+        try:
+            self.executeUpdate('UPDATE status SET filmliste = ?', (json.dumps(filmliste),))
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def _setCheckpoint(self, cursor, checkpoint):
+        # saved in the transaction of the batch it belongs to
+        cursor.execute(self.sql_checkpointUpdate, (None if checkpoint is None else json.dumps(checkpoint),))
+
+    def _getHash(self, value):
+        # the binary idhash of a film for the hex string of the plugin urls
+        return binascii.unhexlify(value)
+
+    def _prepareFilms(self, cursor, filmArray):
+        """
+        Converts the idhash of the films to binary and replaces the
+        directory of the video url with its id in the urlprefix
+        table. New directories are added.
+
+        Args:
+            cursor: cursor of the import transaction
+
+            filmArray(list): the film records
+        """
+        prefixIds = {}
+        for film in filmArray:
+            prefixIds[film[10]] = None
+        prefixes = list(prefixIds.keys())
+        for index in range(0, len(prefixes), 500):
+            chunk = prefixes[index:index + 500]
+            cursor.execute(self.sql_urlPrefixSelect.format(', '.join([self.sql_urlPrefixParam] * len(chunk))), chunk)
+            prefixIds.update(cursor.fetchall())
+        for prefix in prefixes:
+            if prefixIds[prefix] is None:
+                cursor.execute(self.sql_urlPrefixInsert, (prefix,))
+                prefixIds[prefix] = cursor.lastrowid
+        return [(self._getHash(film[0]),) + film[1:10] + (prefixIds[film[10]],) + film[11:] for film in filmArray]
+
+    def _deleteFulltext(self, cursor, condition):
+        # removes films from the full-text index before they are deleted
+        if self.hasFulltext():
+            cursor.execute(self.sql_fulltextDelete + ' WHERE ' + condition)
+
+    def _updateSummary(self, cursor, shows):
+        """
+        Adds newly imported films to the show and channel summaries
+
+        Args:
+            cursor(object): cursor of the import transaction
+
+            shows(list): channel, showid, showname, letter, number
+                of films, minimum and maximum aired per show
+        """
+        channels = {}
+        for (channel, showid, showname, letter, films, airedMin, airedMax) in shows:
+            entry = channels.setdefault(channel, [0, airedMin, airedMax])
+            entry[0] += films
+            entry[1] = min(entry[1], airedMin)
+            entry[2] = max(entry[2], airedMax)
+        cursor.executemany(self.sql_summaryShowInsert, [(sid, chn, name, ltr, amin, amax) for (chn, sid, name, ltr, cnt, amin, amax) in shows])
+        self._getStatementCursor(cursor, self.sql_summaryShowUpdate).executemany(self.sql_summaryShowUpdate, [(cnt, amin, amin, amax, amax, chn, sid) for (chn, sid, name, ltr, cnt, amin, amax) in shows])
+        cursor.executemany(self.sql_summaryChannelInsert, [(chn, amin, amax) for (chn, (cnt, amin, amax)) in channels.items()])
+        self._getStatementCursor(cursor, self.sql_summaryChannelUpdate).executemany(self.sql_summaryChannelUpdate, [(cnt, amin, amin, amax, amax, chn) for (chn, (cnt, amin, amax)) in channels.items()])
+
+    def _getStatementCursor(self, cursor, aStmt):
+        # cursor for a statement of the import executed once per row
+        return cursor
+
+    def _rebuildSummary(self, cursor, filmTable='film'):
+        # recreates the show and channel summaries after films have been removed
+        for stmt in self.sql_summaryRebuild:
+            cursor.execute(stmt.format(filmTable))
+
+    def analyze(self):
+        """
+        Updates the index statistics used by the query planner
+        after the content of the film table changed
+        """
+        self.logger.debug('analyze')
+        try:
+            cursor = self.getConnection().cursor()
+            cursor.execute('PRAGMA analysis_limit = 1000')
+            cursor.execute('ANALYZE')
+            cursor.close()
+            self.getConnection().commit()
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def import_films(self, filmArray, checkpoint=None):
+        """
+        Imports a batch of films. The batch is written to a staging
+        table and merged into the film table. Films with an unchanged
+        content hash are skipped, changed films are rewritten and new
+        films are inserted with one statement.
+
+        Args:
+            filmArray(list): the film records
+
+            checkpoint(dict, optional): position of a full import
+                after this batch
+
+        Returns:
+            tuple: number of inserted and updated films
+        """
         self.logger.debug('import_films')
         #
-        pStmtInsert = self.getImportPreparedStmtInsert()
-        pStmtUpdate = self.getImportPreparedStmtUpdate()
-        #
         try:
             #
             cursor = self.getConnection().cursor()
-            #
-            insertArray = []
-            updateCnt = 0
-            insertCnt = 0
-            for f in filmArray:
-                cursor.execute(pStmtUpdate, (f[0],))
-                rs = cursor.rowcount
-                # self.logger.debug('executeUpdate rs {} for {}', rs , f[0] )
-                if rs == 0:
-                    insertArray.append(f)
-                    insertCnt += 1
-                else:
-                    updateCnt += 1
-            #
+            cursor.execute(self.sql_createStaging)
+            cursor.execute('DELETE FROM film_import')
+            cursor.executemany(self.getImportPreparedStmtInsert(), self._prepareFilms(cursor, filmArray))
+            if self._fullImport:
+                # films not marked are deleted by import_end
+                cursor.execute(self.getImportPreparedStmtUpdate())
+            cursor.execute(self.sql_importSkipUnchanged)
+            cursor.execute(self.sql_importChanged)
+            changed = cursor.fetchall()
+            updateCnt = len(changed)
+            if updateCnt > 0:
+                self._deleteFulltext(cursor, 'idhash IN (SELECT idhash FROM film_import)')
+                cursor.executemany(self.sql_pStmtUpdateChanged, changed)
+                if self.hasFulltext():
+                    cursor.execute(self.sql_fulltextInsert.format('film_fts', 'film') + ' WHERE idhash IN (SELECT idhash FROM film_import)')
+                # the aired range of the shows may have changed, the films are counted already
+                cursor.execute(self.sql_summaryNew)
+                self._updateSummary(cursor, [row[:4] + (0,) + row[5:] for row in cursor.fetchall()])
+            # keep only the new films for the merge and the summaries
+            cursor.execute('DELETE FROM film_import WHERE idhash IN (SELECT idhash FROM film)')
+            cursor.execute(self.sql_pStmtMerge)
+            insertCnt = cursor.rowcount
+            if self.hasFulltext():
+                cursor.execute(self.sql_fulltextInsert.format('film_fts', 'film') + ' WHERE idhash IN (SELECT idhash FROM film_import)')
+            cursor.execute(self.sql_summaryNew)
+            self._updateSummary(cursor, cursor.fetchall())
+            if checkpoint is not None:
+                self._setCheckpoint(cursor, checkpoint)
             cursor.close()
-            self.executemany(pStmtInsert, insertArray)
+            self.getConnection().commit()
             #
             return (insertCnt, updateCnt)
         except Exception as err:
             self.logger.error('Database error: {}', err)
             self.notifier.show_database_error(err)
+            # keep the checkpoint of the last complete batch
+            self.getConnection().rollback()
+            raise
+
+    def import_shadow_begin(self):
+        """
+        Starts a full import into the shadow table `film_new`. The
+        shadow table has no indexes until it is swapped in by
+        `import_shadow_end`. Readers keep using `film` meanwhile.
+        """
+        self.logger.debug('import_shadow_begin')
+        try:
+            cursor = self.getConnection().cursor()
+            cursor.execute('DROP TABLE IF EXISTS film_new')
+            cursor.execute(self.sql_createShadow)
+            self._setCheckpoint(cursor, None)
+            cursor.close()
+            self.getConnection().commit()
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def import_films_shadow(self, filmArray, checkpoint=None):
+        """
+        Imports a batch of films into the shadow table
+
+        Args:
+            filmArray(list): the film records
+
+            checkpoint(dict, optional): position of the import
+                after this batch
+
+        Returns:
+            tuple: number of inserted and updated films
+        """
+        self.logger.debug('import_films_shadow')
+        try:
+            cursor = self.getConnection().cursor()
+            cursor.executemany(self.sql_pStmtInsertShadow, self._prepareFilms(cursor, filmArray))
+            if checkpoint is not None:
+                self._setCheckpoint(cursor, checkpoint)
+            cursor.close()
+            self.getConnection().commit()
+            return (len(filmArray), 0)
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            # keep the checkpoint of the last complete batch
+            self.getConnection().rollback()
+            raise
+
+    def import_shadow_end(self):
+        """
+        Completes the shadow import: removes duplicates, keeps the
+        creation date of known films and replaces `film` with
+        `film_new` in one transaction. The indexes of `film` are
+        recreated on the new table.
+
+        Returns:
+            tuple: number of inserted, updated and deleted films
+        """
+        self.logger.debug('import_shadow_end')
+        try:
+            conn = self.getConnection()
+            cursor = conn.cursor()
+            cursor.execute(self.sql_shadowDedup)
+            cursor.execute(self.sql_shadowKeepCreated)
+            updateCnt = cursor.rowcount
+            cursor.execute('SELECT count(*) FROM film_new')
+            (newCnt,) = cursor.fetchone()
+            cursor.execute('SELECT count(*) FROM film')
+            (oldCnt,) = cursor.fetchone()
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'film' AND sql IS NOT NULL")
+            indexes = [row[0] for row in cursor.fetchall()]
+            fulltext = self.hasFulltext()
+            if fulltext:
+                cursor.execute('DROP TABLE IF EXISTS film_fts_new')
+                cursor.execute(self.sql_fulltextCreate.format('film_fts_new'))
+                cursor.execute(self.sql_fulltextInsert.format('film_fts_new', 'film_new'))
+            conn.commit()
+            # swap
+            cursor.execute('BEGIN')
+            cursor.execute('DROP TABLE film')
+            cursor.execute('ALTER TABLE film_new RENAME TO film')
+            for stmt in indexes:
+                cursor.execute(stmt)
+            if fulltext:
+                cursor.execute('DROP TABLE film_fts')
+                cursor.execute('ALTER TABLE film_fts_new RENAME TO film_fts')
+            self._rebuildSummary(cursor)
+            cursor.execute(self.sql_urlPrefixCleanup)
+            self._setCheckpoint(cursor, None)
+            cursor.close()
+            conn.commit()
+            self.analyze()
+            return (newCnt - updateCnt, updateCnt, oldCnt - updateCnt)
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
+            self.notifier.show_database_error(err)
+            raise
+
+    def import_shadow_cancel(self):
+        """ Removes the shadow table of a failed full import """
+        self.logger.debug('import_shadow_cancel')
+        try:
+            self.getConnection().rollback()
+            self.getConnection().cursor().execute('DROP TABLE IF EXISTS film_new')
+            self.getConnection().cursor().execute('DROP TABLE IF EXISTS film_fts_new')
+            self._setCheckpoint(self.getConnection().cursor(), None)
+            self.getConnection().commit()
+        except Exception as err:
+            self.logger.error('Database error: {}', err)
             raise
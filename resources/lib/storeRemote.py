@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+The query client module
+
+Copyright 2017-2019, Leo Moll
+SPDX-License-Identifier: MIT
+"""
+
+# pylint: disable=line-too-long
+
+import os
+import time
+import socket
+
+import resources.lib.appContext as appContext
+import resources.lib.mvutils as mvutils
+import resources.lib.queryServer as QueryServer
+
+
+class StoreRemote(object):
+    """
+    Thin client of the query server in the service. The read only
+    queries are sent to the server. Everything else and every query
+    the server cannot answer runs on a local store created on demand.
+
+    Args:
+        localStore(function): creates the local store
+    """
+
+    def __init__(self, localStore):
+        self.logger = appContext.MVLOGGER.get_new_logger('StoreRemote')
+        self.settings = appContext.MVSETTINGS
+        # internals
+        self._localStore = localStore
+        self._local = None
+        self._server = None
+
+    def __getattr__(self, name):
+        if name in QueryServer.SERVER_METHODS:
+            return lambda *args: self._call(name, args)
+        return getattr(self._getLocal(), name)
+
+    def exit(self):
+        if self._local is not None:
+            self._local.exit()
+            self._local = None
+
+    def _getLocal(self):
+        if self._local is None:
+            self._local = self._localStore()
+        return self._local
+
+    def _call(self, method, args):
+        start = time.time()
+        try:
+            response = self._request(method, args)
+        # pylint: disable=broad-except
+        except Exception as err:
+            self.logger.debug('query server not available: {}', err)
+            response = None
+        if response is None or 'error' in response:
+            if response is not None:
+                self.logger.debug('query server cannot answer {}: {}', method, response['error'])
+            # the service is not running or the server failed: query directly
+            self._server = False
+            return getattr(self._getLocal(), method)(*args)
+        result = response['result']
+        self.logger.debug('{} answered by query server after {} sec', method, time.time() - start)
+        return result
+
+    def _request(self, method, args):
+        if self._server is False:
+            return None
+        if self._server is None:
+            filename = os.path.join(self.settings.getDatapath(), QueryServer.SERVER_FILE)
+            if not mvutils.file_exists(filename):
+                self._server = False
+                return None
+            self._server = mvutils.loadJsonFile(filename)
+        connection = socket.create_connection(('127.0.0.1', self._server['port']), 1)
+        try:
+            connection.settimeout(30)
+            QueryServer.sendMessage(connection, {
+                'token': self._server['token'],
+                'method': method,
+                'args': QueryServer.encodeArgs(args),
+                'settings': QueryServer.getSettingsFingerprint(self.settings)
+            })
+            return QueryServer.receiveMessage(connection)
+        finally:
+            connection.close()
@@ -14,14 +14,33 @@ import resources.lib.mvutils as mvutils
 import resources.lib.appContext as appContext
 from resources.lib.storeQuery import StoreQuery
 
+# connection settings of the importer. WAL keeps an interrupted import
+# recoverable and lets the readers continue while it writes.
+IMPORT_PRAGMAS = [
+    'pragma synchronous=normal',
+    'pragma temp_store=memory',
+    'pragma cache_size=-65536',
+    'pragma journal_size_limit=67108864'
+]
+# connection settings of the plugin and the query server
+BROWSE_PRAGMAS = [
+    'pragma query_only=1',
+    'pragma temp_store=memory',
+    'pragma cache_size=-16384',
+    'pragma mmap_size=268435456'
+]
+
 
 class StoreSQLite(StoreQuery):
     """
     The local SQlite database class
 
+    Args:
+        importer(bool, optional): connect with the settings of the
+            importer instead of the read only browse settings
     """
 
-    def __init__(self):
+    def __init__(self, importer=False):
         super(StoreSQLite, self).__init__()
         self.logger = appContext.MVLOGGER.get_new_logger('StoreSQLite')
         self.notifier = appContext.MVNOTIFIER
@@ -29,19 +48,23 @@ class StoreSQLite(StoreQuery):
         self.databaseFilename = 'filmliste-v3.db'
         # internals
         self.conn = None
+        self.importer = importer
         self.dbfile = os.path.join(self.settings.getDatapath(), self.databaseFilename)
         self.logger.debug('StoreSQLite DBFile: {}', self.dbfile)
 
     def getConnection(self):
         if self.conn is None:
-            if (not mvutils.file_exists(self.dbfile)):
+            exists = mvutils.file_exists(self.dbfile)
+            if not exists:
                 self.settings.setDatabaseStatus('UNINIT')
                 self.logger.debug('Missing StoreSQLite DBFile: {}', self.dbfile)
             self.conn = sqlite3.connect(self.dbfile, timeout=60)
-            self.conn.execute('pragma synchronous=off')
-            self.conn.execute('pragma journal_mode=off')
-            self.conn.execute('pragma page_size=16384')
-            self.conn.execute('pragma encoding="UTF-8"')
+            for pragma in IMPORT_PRAGMAS if self.importer else BROWSE_PRAGMAS:
+                self.conn.execute(pragma)
+            if self.importer and exists:
+                # the journal mode is kept in the database file. New files
+                # get it from StoreSQLiteSetup after the page size.
+                self.conn.execute('pragma journal_mode=wal')
         return self.conn
 
     def exit(self):
@@ -51,10 +74,14 @@ class StoreSQLite(StoreQuery):
             self.conn = None
 
     def reset(self):
+        self.exit()
         mvutils.file_remove(self.dbfile)
+        removeJournal(self.dbfile)
         # last version
         mvutils.file_remove(os.path.join(self.settings.getDatapath(), 'filmliste-v2.db'))
-        self.conn = None
+
+    def _getHash(self, value):
+        return sqlite3.Binary(super(StoreSQLite, self)._getHash(value))
 
     # ABSTRACT
     def getDatabaseStatus(self):
@@ -65,3 +92,15 @@ class StoreSQLite(StoreQuery):
             'version': self.settings.getDatabaseVersion()
         }
         return updateStatus
+
+
+def removeJournal(dbfile):
+    """
+    Removes the WAL files of a database file. They must not
+    survive the database file they belong to.
+
+    Args:
+        dbfile(str): full pathname of the database file
+    """
+    mvutils.file_remove(dbfile + '-wal')
+    mvutils.file_remove(dbfile + '-shm')
@@ -8,7 +8,11 @@ SPDX-License-Identifier: MIT
 
 # pylint: disable=too-many-lines,line-too-long
 
+import sqlite3
+import binascii
+
 import resources.lib.appContext as appContext
+from resources.lib.storeQuery import DATABASE_VERSION
 
 
 class StoreSQLiteSetup(object):
@@ -16,7 +20,10 @@ class StoreSQLiteSetup(object):
     def __init__(self, dbCon):
         self.logger = appContext.MVLOGGER.get_new_logger('StoreSQLiteSetup')
         self.conn = dbCon
+        # the page size and the encoding can only be set before the first table is created
         self._setupScript = """
+PRAGMA page_size = 16384;
+PRAGMA encoding = "UTF-8";
 PRAGMA foreign_keys = false;
 
 -- ----------------------------
@@ -24,23 +31,66 @@ PRAGMA foreign_keys = false;
 -- ----------------------------
 DROP TABLE IF EXISTS "film";
 CREATE TABLE "film" (
-     "idhash" TEXT(32,0) NOT NULL,
+     "id" INTEGER PRIMARY KEY,
+     "idhash" BLOB NOT NULL,
      "dtCreated" integer(11,0) NOT NULL DEFAULT 0,
      "touched" integer(1,0) NOT NULL DEFAULT 1,
      "channel" TEXT(32,0) NOT NULL COLLATE NOCASE,
-     "showid" TEXT(8,0) NOT NULL,
+     "showid" integer(11,0) NOT NULL,
      "showname" TEXT(128,0) NOT NULL COLLATE NOCASE,
      "title" TEXT(128,0) NOT NULL COLLATE NOCASE,
      "aired" integer(11,0),
      "duration" integer(11,0),
      "description" TEXT(1024,0) COLLATE NOCASE,
      "url_sub" TEXT(2048,0),
+     "url_prefix" integer(11,0) NOT NULL DEFAULT 0,
      "url_video" TEXT(2048,0),
      "url_video_sd" TEXT(2048,0),
-     "url_video_hd" TEXT(2048,0)
+     "url_video_hd" TEXT(2048,0),
+     "letter" TEXT(1,0) NOT NULL DEFAULT '#',
+     "contenthash" TEXT(32,0) NOT NULL DEFAULT ''
+);
+-- ----------------------------
+CREATE UNIQUE INDEX idx_idhash ON film (idhash);
+CREATE INDEX idx_channel_show ON film (channel, showname, showid);
+CREATE INDEX idx_channel_aired ON film (channel, aired);
+CREATE INDEX idx_showid_aired ON film (showid, aired);
+CREATE INDEX idx_showname ON film (showname);
+CREATE INDEX idx_aired ON film (aired);
+CREATE INDEX idx_dtCreated ON film (dtCreated);
+CREATE INDEX idx_letter_show ON film (letter, showname, showid, channel);
+-- ----------------------------
+--  Directories of the video urls
+-- ----------------------------
+DROP TABLE IF EXISTS "urlprefix";
+CREATE TABLE "urlprefix" (
+     "id" INTEGER PRIMARY KEY,
+     "prefix" TEXT NOT NULL
 );
+CREATE UNIQUE INDEX idx_urlprefix ON "urlprefix" (prefix);
 -- ----------------------------
-CREATE INDEX idx_idhash ON film (idhash);
+--  Summary tables for show and channel
+-- ----------------------------
+DROP TABLE IF EXISTS "show";
+CREATE TABLE "show" (
+     "showid" integer(11,0) NOT NULL,
+     "channel" TEXT(32,0) NOT NULL COLLATE NOCASE,
+     "showname" TEXT(128,0) NOT NULL COLLATE NOCASE,
+     "letter" TEXT(1,0) NOT NULL DEFAULT '#',
+     "films" integer(11,0) NOT NULL DEFAULT 0,
+     "aired_min" integer(11,0),
+     "aired_max" integer(11,0)
+);
+CREATE UNIQUE INDEX idx_show_id ON "show" (channel, showid);
+CREATE INDEX idx_show_letter ON "show" (letter, showname);
+DROP TABLE IF EXISTS "channel";
+CREATE TABLE "channel" (
+     "channel" TEXT(32,0) NOT NULL COLLATE NOCASE,
+     "films" integer(11,0) NOT NULL DEFAULT 0,
+     "aired_min" integer(11,0),
+     "aired_max" integer(11,0)
+);
+CREATE UNIQUE INDEX idx_channel ON "channel" (channel);
 -- ----------------------------
 --  Table structure for status
 -- ----------------------------
@@ -50,13 +100,160 @@ CREATE TABLE "status" (
      "lastupdate" integer(11,0),
      "lastFullUpdate" integer(11,0),
      "filmupdate" integer(11,0),
-     "version" integer(11,0)
+     "version" integer(11,0),
+     "checkpoint" TEXT,
+     "filmliste" TEXT
 );
 
-INSERT INTO status (status, lastupdate, lastFullUpdate, filmupdate, version) values ('IDLE', 0, 0, 0, 3);
+INSERT INTO status (status, lastupdate, lastFullUpdate, filmupdate, version) values ('IDLE', 0, 0, 0, {});
 
 PRAGMA foreign_keys = true;
-        """
+PRAGMA journal_mode = WAL;
+        """.format(DATABASE_VERSION)
+        # migration scripts from the previous schema version keyed by the target version
+        self._migrationScripts = {
+            4: """
+-- unique idhash for set-based imports
+DELETE FROM film WHERE rowid NOT IN (SELECT min(rowid) FROM film GROUP BY idhash);
+DROP INDEX IF EXISTS idx_idhash;
+CREATE UNIQUE INDEX idx_idhash ON film (idhash);
+            """,
+            5: """
+-- indexes for the browse queries
+CREATE INDEX IF NOT EXISTS idx_channel_show ON film (channel, showname, showid);
+CREATE INDEX IF NOT EXISTS idx_channel_aired ON film (channel, aired);
+CREATE INDEX IF NOT EXISTS idx_showid_aired ON film (showid, aired);
+CREATE INDEX IF NOT EXISTS idx_showname ON film (showname);
+CREATE INDEX IF NOT EXISTS idx_aired ON film (aired);
+CREATE INDEX IF NOT EXISTS idx_dtCreated ON film (dtCreated);
+PRAGMA analysis_limit = 1000;
+ANALYZE;
+            """,
+            6: """
+-- precomputed start letter for the A-Z show browser
+ALTER TABLE film ADD COLUMN letter TEXT(1,0) NOT NULL DEFAULT '#';
+UPDATE film SET letter = CASE WHEN UPPER(SUBSTR(showname,1,1)) BETWEEN 'A' AND 'Z' THEN UPPER(SUBSTR(showname,1,1)) WHEN SUBSTR(showname,1,1) BETWEEN '0' AND '9' THEN '0' ELSE '#' END;
+CREATE INDEX IF NOT EXISTS idx_letter_show ON film (letter, showname, showid, channel);
+ANALYZE;
+            """,
+            7: """
+-- summary tables for show and channel
+DROP TABLE IF EXISTS "show";
+CREATE TABLE "show" (
+     "showid" TEXT(8,0) NOT NULL,
+     "channel" TEXT(32,0) NOT NULL COLLATE NOCASE,
+     "showname" TEXT(128,0) NOT NULL COLLATE NOCASE,
+     "letter" TEXT(1,0) NOT NULL DEFAULT '#',
+     "films" integer(11,0) NOT NULL DEFAULT 0,
+     "aired_min" integer(11,0),
+     "aired_max" integer(11,0)
+);
+CREATE UNIQUE INDEX idx_show_id ON "show" (channel, showid);
+CREATE INDEX idx_show_letter ON "show" (letter, showname);
+DROP TABLE IF EXISTS "channel";
+CREATE TABLE "channel" (
+     "channel" TEXT(32,0) NOT NULL COLLATE NOCASE,
+     "films" integer(11,0) NOT NULL DEFAULT 0,
+     "aired_min" integer(11,0),
+     "aired_max" integer(11,0)
+);
+CREATE UNIQUE INDEX idx_channel ON "channel" (channel);
+INSERT INTO "show" (showid, channel, showname, letter, films, aired_min, aired_max) SELECT showid, channel, min(showname), min(letter), count(*), min(aired), max(aired) FROM film GROUP BY channel, showid;
+INSERT INTO "channel" (channel, films, aired_min, aired_max) SELECT channel, sum(films), min(aired_min), max(aired_max) FROM "show" GROUP BY channel;
+            """,
+            8: """
+-- content hash to skip unchanged films on import. The films
+-- without one are rewritten once by the next import.
+ALTER TABLE film ADD COLUMN contenthash TEXT(32,0) NOT NULL DEFAULT '';
+            """,
+            9: """
+-- position of an interrupted full import
+ALTER TABLE status ADD COLUMN checkpoint TEXT;
+            """,
+            10: """
+-- id and HTTP validator of the last imported Filmliste
+ALTER TABLE status ADD COLUMN filmliste TEXT;
+            """,
+            11: """
+-- the directory of the video url is kept once in urlprefix,
+-- the sd and hd urls are stored relative to the video url
+DROP TABLE IF EXISTS "urlprefix";
+CREATE TABLE "urlprefix" (
+     "id" INTEGER PRIMARY KEY,
+     "prefix" TEXT NOT NULL
+);
+CREATE UNIQUE INDEX idx_urlprefix ON "urlprefix" (prefix);
+ALTER TABLE film ADD COLUMN url_prefix integer(11,0) NOT NULL DEFAULT 0;
+INSERT OR IGNORE INTO urlprefix (prefix) SELECT DISTINCT rtrim(COALESCE(url_video, ''), replace(COALESCE(url_video, ''), '/', '')) FROM film;
+UPDATE film SET url_prefix = (SELECT id FROM urlprefix WHERE prefix = rtrim(COALESCE(url_video, ''), replace(COALESCE(url_video, ''), '/', '')));
+DROP TABLE IF EXISTS url_migrate;
+CREATE TEMP TABLE url_migrate AS SELECT film.rowid AS filmid, urlprefix.prefix AS prefix, length(urlprefix.prefix) AS len FROM film JOIN urlprefix ON urlprefix.id = film.url_prefix WHERE urlprefix.prefix <> '';
+CREATE UNIQUE INDEX temp.idx_url_migrate ON url_migrate (filmid);
+UPDATE film SET
+     url_video_sd = (SELECT CASE WHEN substr(url_video_sd, 1, len) = prefix THEN len || '|' || substr(url_video_sd, len + 1) ELSE url_video_sd END FROM url_migrate WHERE filmid = film.rowid),
+     url_video_hd = (SELECT CASE WHEN substr(url_video_hd, 1, len) = prefix THEN len || '|' || substr(url_video_hd, len + 1) ELSE url_video_hd END FROM url_migrate WHERE filmid = film.rowid),
+     url_video = (SELECT substr(url_video, len + 1) FROM url_migrate WHERE filmid = film.rowid)
+WHERE rowid IN (SELECT filmid FROM url_migrate);
+DROP TABLE url_migrate;
+            """,
+            12: """
+-- integer primary key, binary idhash and integer showid. The film
+-- ids keep the rowids referenced by the full-text index.
+DROP TABLE IF EXISTS film_migrate;
+CREATE TABLE "film_migrate" (
+     "id" INTEGER PRIMARY KEY,
+     "idhash" BLOB NOT NULL,
+     "dtCreated" integer(11,0) NOT NULL DEFAULT 0,
+     "touched" integer(1,0) NOT NULL DEFAULT 1,
+     "channel" TEXT(32,0) NOT NULL COLLATE NOCASE,
+     "showid" integer(11,0) NOT NULL,
+     "showname" TEXT(128,0) NOT NULL COLLATE NOCASE,
+     "title" TEXT(128,0) NOT NULL COLLATE NOCASE,
+     "aired" integer(11,0),
+     "duration" integer(11,0),
+     "description" TEXT(1024,0) COLLATE NOCASE,
+     "url_sub" TEXT(2048,0),
+     "url_prefix" integer(11,0) NOT NULL DEFAULT 0,
+     "url_video" TEXT(2048,0),
+     "url_video_sd" TEXT(2048,0),
+     "url_video_hd" TEXT(2048,0),
+     "letter" TEXT(1,0) NOT NULL DEFAULT '#',
+     "contenthash" TEXT(32,0) NOT NULL DEFAULT ''
+);
+INSERT INTO film_migrate (
+     id, idhash, dtCreated, touched, channel, showid, showname, title, aired, duration, description,
+     url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+)
+SELECT
+     rowid, mv_unhex(idhash), dtCreated, touched, channel, mv_hextoint(showid), showname, title, aired, duration, description,
+     url_sub, url_prefix, url_video, url_video_sd, url_video_hd, letter, contenthash
+FROM film;
+DROP TABLE film;
+ALTER TABLE film_migrate RENAME TO film;
+CREATE UNIQUE INDEX idx_idhash ON film (idhash);
+CREATE INDEX idx_channel_show ON film (channel, showname, showid);
+CREATE INDEX idx_channel_aired ON film (channel, aired);
+CREATE INDEX idx_showid_aired ON film (showid, aired);
+CREATE INDEX idx_showname ON film (showname);
+CREATE INDEX idx_aired ON film (aired);
+CREATE INDEX idx_dtCreated ON film (dtCreated);
+CREATE INDEX idx_letter_show ON film (letter, showname, showid, channel);
+DROP TABLE IF EXISTS "show";
+CREATE TABLE "show" (
+     "showid" integer(11,0) NOT NULL,
+     "channel" TEXT(32,0) NOT NULL COLLATE NOCASE,
+     "showname" TEXT(128,0) NOT NULL COLLATE NOCASE,
+     "letter" TEXT(1,0) NOT NULL DEFAULT '#',
+     "films" integer(11,0) NOT NULL DEFAULT 0,
+     "aired_min" integer(11,0),
+     "aired_max" integer(11,0)
+);
+CREATE UNIQUE INDEX idx_show_id ON "show" (channel, showid);
+CREATE INDEX idx_show_letter ON "show" (letter, showname);
+INSERT INTO "show" (showid, channel, showname, letter, films, aired_min, aired_max) SELECT showid, channel, min(showname), min(letter), count(*), min(aired), max(aired) FROM film GROUP BY channel, showid;
+ANALYZE;
+            """
+        }
 
     def setupDatabase(self):
         self.logger.debug('Start DB setup')
@@ -64,3 +261,38 @@ PRAGMA foreign_keys = true;
         self.conn.getConnection().executescript(self._setupScript)
         self.conn.getConnection().commit()
         self.logger.debug('End DB setup')
+
+    def migrateDatabase(self, fromVersion):
+        """
+        Migrates an existing database to the current schema version
+
+        Args:
+            fromVersion(int): schema version of the existing database
+        """
+        # conversions of the hex strings of earlier versions
+        self.conn.getConnection().create_function('mv_unhex', 1, _unhex)
+        self.conn.getConnection().create_function('mv_hextoint', 1, _hexToInt)
+        for version in range(int(fromVersion) + 1, DATABASE_VERSION + 1):
+            self.logger.debug('Migrate DB to version {}', version)
+            # DDL is transactional in SQLite: a failed or interrupted step
+            # leaves the database at the previous version
+            try:
+                self.conn.getConnection().executescript(
+                    'BEGIN;\n{}\nUPDATE status SET version = {};\nCOMMIT;'.format(self._migrationScripts[version], version)
+                )
+            except Exception as err:
+                self.logger.error('Database error: {}', err)
+                self.conn.getConnection().rollback()
+                raise
+        self.logger.debug('End DB migration')
+
+
+def _unhex(value):
+    return sqlite3.Binary(binascii.unhexlify(value))
+
+
+def _hexToInt(value):
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return 0
@@ -14,8 +14,16 @@ from datetime import timedelta
 import xbmcgui
 import xbmcplugin
 import resources.lib.appContext as appContext
+import resources.lib.extendedSearchModel as ExtendedSearchModel
 from resources.lib.model.film import Film
 
+try:
+    # Python 3.x
+    from urllib.parse import quote_plus
+except ImportError:
+    # Python 2.x
+    from urllib import quote_plus
+
 
 class FilmlistUi(object):
     """
@@ -49,7 +57,22 @@ class FilmlistUi(object):
         self.tzDiff = datetime.now() - datetime.utcnow()
         self.tzBase = datetime.fromtimestamp(0)
 
-    def generate(self, databaseRs):
+    def generate(self, databaseRs, pNextPage=None, pCursor=None, pPageSize=None):
+        """
+        Adds the films to the directory
+
+        Args:
+            databaseRs(list): films of the page, one more film if
+                there is a next page
+
+            pNextPage(dict, optional): parameters of the plugin call
+                for the next page without the cursor
+
+            pCursor(str, optional): position of the current page
+
+            pPageSize(int, optional): films per page, default is
+                the maximum number of results of the settings
+        """
         #
         # 0 - idhash, 1 - title, 2 - showname, 3 - channel,
         # 4 - description, 5 - duration, 6 - aired,
@@ -57,10 +80,17 @@ class FilmlistUi(object):
         #
         self.startTime = time.time()
         #
+        pageSize = self.settings.getMaxResults() if pPageSize is None else pPageSize
+        nextCursor = None
+        if pNextPage is not None and pageSize > 0 and len(databaseRs) > pageSize:
+            databaseRs = databaseRs[:pageSize]
+            nextCursor = ExtendedSearchModel.getNextCursor(pCursor, databaseRs[-1], pageSize)
+        #
         xbmcplugin.setContent(self.handle, self.settings.getContentType())
         for method in self.sortmethods:
             xbmcplugin.addSortMethod(self.handle, method)
         #
+        self._prepare()
         aFilm = Film()
         listOfElements = []
         for element in databaseRs:
@@ -68,18 +98,22 @@ class FilmlistUi(object):
             aFilm.init(element[0], element[1], element[2], element[3], element[4], element[5],
                         element[6], element[7], element[8], element[9], element[10])
             #
-            (targetUrl, list_item) = self._generateListItem(aFilm)
+            listItem = self._generateListItem(aFilm)
+            if listItem is None:
+                continue
+            (targetUrl, list_item) = listItem
+            filmid = quote_plus(str(aFilm.filmid))
             #
-            list_item.addContextMenuItems(self._generateContextMenu(aFilm))
+            list_item.addContextMenuItems(self._generateContextMenu(aFilm, filmid))
             #
-            if self.settings.getAutoSub() and aFilm.url_sub:
-                targetUrl = self.plugin.build_url({
-                    'mode': "playwithsrt",
-                    'id': aFilm.filmid
-                })
+            if self.autoSub and aFilm.url_sub:
+                targetUrl = self.urlPlayWithSrt + filmid
             #
             listOfElements.append((targetUrl, list_item, False))
         #
+        if nextCursor is not None:
+            listOfElements.append(self._generateNextPageItem(pNextPage, nextCursor))
+        #
         xbmcplugin.addDirectoryItems(
             handle=self.handle,
             items=listOfElements,
@@ -91,10 +125,40 @@ class FilmlistUi(object):
         #
         self.logger.debug('generated: {} sec', time.time() - self.startTime)
 
+    def _prepare(self):
+        # values which are the same for every film of the list
+        self.preferHd = self.settings.getPreferHd()
+        self.userAgent = self.settings.getUserAgentString()
+        self.autoSub = self.settings.getAutoSub()
+        self.offscreen = self.plugin.get_kodi_version() > 17
+        self.airedFormat = self.plugin.language(30990)
+        self.captionPlayWithSrt = self.plugin.language(30921)
+        self.captionDownloadMovie = self.plugin.language(30922)
+        self.captionDownloadEpisode = self.plugin.language(30924)
+        # the film id is appended to the plugin urls
+        self.urlPlayWithSrt = self.plugin.build_url({'mode': "playwithsrt"}) + '&id='
+        self.urlDownloadMovie = self.plugin.build_url({'mode': "downloadmv"}) + '&id='
+        self.urlDownloadEpisode = self.plugin.build_url({'mode': "downloadep"}) + '&id='
+        self.iconPath = os.path.join(self.plugin.path, 'resources', 'icons', 'sender')
+        self.artwork = {}
+
+    def _getArtwork(self, pChannel):
+        artwork = self.artwork.get(pChannel)
+        if artwork is None:
+            icon = os.path.join(self.iconPath, pChannel.lower() + '-i.png')
+            fanart = os.path.join(self.iconPath, pChannel.lower() + '-f.png')
+            artwork = {
+                'thumb': icon,
+                'icon': icon,
+                'fanart': fanart
+            }
+            self.artwork[pChannel] = artwork
+        return artwork
+
     def _generateListItem(self, pFilm):
         #
         videohds = ""
-        if (pFilm.url_video_hd != "" and self.settings.getPreferHd()):
+        if (pFilm.url_video_hd != "" and self.preferHd):
             videourl = pFilm.url_video_hd
             videohds = " (HD)"
         elif (pFilm.url_video_sd != ""):
@@ -106,7 +170,7 @@ class FilmlistUi(object):
         if videourl == "":
             return None
 
-        videourl = videourl + self.settings.getUserAgentString()
+        videourl = videourl + self.userAgent
 
         if self.useLongTitle:
             resultingtitle = pFilm.show + ': ' + pFilm.title + videohds
@@ -124,76 +188,51 @@ class FilmlistUi(object):
             info_labels['duration'] = pFilm.seconds
 
         if pFilm.aired is not None and pFilm.aired != 0:
-            ndate = self.tzBase + timedelta(seconds=(pFilm.aired))
-            airedstring = ndate.isoformat().replace('T', ' ')
+            airedstring = (self.tzBase + timedelta(seconds=(pFilm.aired))).strftime('%Y-%m-%d %H:%M:%S')
             info_labels['date'] = airedstring[:10]
             info_labels['aired'] = airedstring[:10]
             info_labels['dateadded'] = airedstring
-            info_labels['plot'] = self.plugin.language(30990).format(airedstring) + info_labels['plot']
-
-        icon = os.path.join(
-            self.plugin.path,
-            'resources',
-            'icons',
-            'sender',
-            pFilm.channel.lower() + '-i.png'
-        )
-        fanart = os.path.join(
-            self.plugin.path,
-            'resources',
-            'icons',
-            'sender',
-            pFilm.channel.lower() + '-f.png'
-        )
+            info_labels['plot'] = self.airedFormat.format(airedstring) + info_labels['plot']
 
         #
-        if self.plugin.get_kodi_version() > 17:
+        if self.offscreen:
             listitem = xbmcgui.ListItem(label=resultingtitle, path=videourl, offscreen=True)
         else:
             listitem = xbmcgui.ListItem(label=resultingtitle, path=videourl)
         #
         listitem.setInfo(type='video', infoLabels=info_labels)
         listitem.setProperty('IsPlayable', 'true')
-        listitem.setArt({
-            'thumb': icon,
-            'icon': icon,
-            'fanart': fanart
-        })
+        listitem.setArt(self._getArtwork(pFilm.channel))
         return (videourl, listitem)
 
-    def _generateContextMenu(self, pFilm):
+    def _generateNextPageItem(self, pNextPage, pCursor):
+        params = dict(pNextPage)
+        params['cursor'] = pCursor
+        if self.plugin.get_kodi_version() > 17:
+            listitem = xbmcgui.ListItem(label=self.plugin.language(30968), offscreen=True)
+        else:
+            listitem = xbmcgui.ListItem(label=self.plugin.language(30968))
+        # stays below the films in every sort order
+        listitem.setProperty('SpecialSort', 'bottom')
+        return (self.plugin.build_url(params), listitem, True)
+
+    def _generateContextMenu(self, pFilm, pFilmId):
         contextmenu = []
 
         if pFilm.url_sub != '':
             contextmenu.append((
-                self.plugin.language(30921),
-                'PlayMedia({})'.format(
-                    self.plugin.build_url({
-                        'mode': "playwithsrt",
-                        'id': pFilm.filmid
-                    })
-                )
+                self.captionPlayWithSrt,
+                'PlayMedia(' + self.urlPlayWithSrt + pFilmId + ')'
             ))
 
         # Download movie
         contextmenu.append((
-            self.plugin.language(30922),
-            'RunPlugin({})'.format(
-                self.plugin.build_url({
-                    'mode': "downloadmv",
-                    'id': pFilm.filmid
-                })
-            )
+            self.captionDownloadMovie,
+            'RunPlugin(' + self.urlDownloadMovie + pFilmId + ')'
         ))
         # Download TV episode
         contextmenu.append((
-            self.plugin.language(30924),
-            'RunPlugin({})'.format(
-                self.plugin.build_url({
-                    'mode': "downloadep",
-                    'id': pFilm.filmid
-                })
-            )
+            self.captionDownloadEpisode,
+            'RunPlugin(' + self.urlDownloadEpisode + pFilmId + ')'
         ))
         return contextmenu
-
@@ -9,6 +9,8 @@ SPDX-License-Identifier: MIT
 # -- Imports ------------------------------------------------
 import os
 import time
+import socket
+import threading
 import subprocess
 import resources.lib.appContext as appContext
 
@@ -16,9 +18,17 @@ import resources.lib.appContext as appContext
 try:
     # Python 3.x
     from urllib.error import URLError
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+    from urllib.request import Request
+    from http.client import HTTPException
 except ImportError:
     # Python 2.x
     from urllib2 import URLError
+    from urllib2 import HTTPError
+    from urllib2 import urlopen
+    from urllib2 import Request
+    from httplib import HTTPException
 
 from contextlib import closing
 from codecs import open
@@ -29,9 +39,16 @@ import resources.lib.mvutils as mvutils
 from resources.lib.exceptions import ExitRequested
 
 # -- Unpacker support ---------------------------------------
+UPD_CAN_XZ = False
 UPD_CAN_BZ2 = False
 UPD_CAN_GZ = False
 
+try:
+    import lzma
+    UPD_CAN_XZ = True
+except ImportError:
+    pass
+
 try:
     import bz2
     UPD_CAN_BZ2 = True
@@ -40,6 +57,7 @@ except ImportError:
 
 try:
     import gzip
+    import zlib
     UPD_CAN_GZ = True
 except ImportError:
     pass
@@ -61,19 +79,37 @@ DATABASE_DBF = 'filmliste-v3.db'
 
 
 class UpdateFileDownload(object):
-    """ The database updator class """
+    """
+    The database updator class
+
+    Args:
+        lastFilmliste(dict, optional): url and HTTP validator of the
+            last imported Filmliste. A request for the same url is
+            conditional.
+    """
 
-    def __init__(self):
+    def __init__(self, lastFilmliste=None):
         self.logger = appContext.MVLOGGER.get_new_logger('UpdateFileDownload')
         self.notifier = appContext.MVNOTIFIER
         self.settings = appContext.MVSETTINGS
         self.monitor = appContext.MVMONITOR
         self.database = None
         self.use_xz = mvutils.find_xz() is not None
+        self.lastFilmliste = lastFilmliste if lastFilmliste is not None else {}
+        self.filmliste = {'url': None, 'validator': None}
+        self.modified = True
 
     def getTargetFilename(self):
         return self._filename
 
+    def getFilmliste(self):
+        """ Returns url and HTTP validator of the requested Filmliste """
+        return self.filmliste
+
+    def isModified(self):
+        """ Returns `False` if the server reported the requested Filmliste unchanged """
+        return self.modified
+
     def removeDownloads(self):
         mvutils.file_remove(self._compressedFilename)
         mvutils.file_remove(self._filename)
@@ -105,6 +141,22 @@ class UpdateFileDownload(object):
         #
         return check
 
+    def openIncrementalUpdateStream(self):
+        """
+        Opens the incremental update as a stream which is
+        decompressed while it is read
+        """
+        ext = self._getStreamExtension()
+        return self._openStream(FILMLISTE_URL + FILMLISTE_DIF + ext, ext, 0)
+
+    def openFullUpdateStream(self):
+        """
+        Opens the full update as a stream which is
+        decompressed while it is read
+        """
+        ext = self._getStreamExtension()
+        return self._openStream(FILMLISTE_URL + FILMLISTE_AKT + ext, ext, 200000000)
+
     def downloadSqliteDb(self):
         ext = self._getExtension()
         downloadUrl = DATABASE_URL + DATABASE_DBF + ext
@@ -140,6 +192,52 @@ class UpdateFileDownload(object):
             self.notifier.show_missing_extractor_error()
         return ext
 
+    def _getStreamExtension(self):
+        ext = ""
+        if UPD_CAN_XZ is True:
+            ext = '.xz'
+        elif UPD_CAN_BZ2 is True:
+            ext = '.bz2'
+        elif UPD_CAN_GZ is True:
+            ext = '.gz'
+        else:
+            self.logger.error('No suitable decompressor available for this system')
+            self.notifier.show_missing_extractor_error()
+        return ext
+
+    def _openStream(self, url, ext, minimumSize):
+        if ext == '.xz':
+            decompressor = lzma.LZMADecompressor()
+        elif ext == '.bz2':
+            decompressor = bz2.BZ2Decompressor()
+        elif ext == '.gz':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            raise Exception('No suitable decompressor available for {}'.format(url))
+        self.logger.debug('Trying to stream {}...', url)
+        request = Request(url)
+        addConditionalHeader(request, self._getValidator(url))
+        try:
+            src = urlopen(request, timeout=10)
+        except HTTPError as err:
+            if err.code == 304:
+                self.logger.info('{} not modified', url)
+                self.modified = False
+                return None
+            self.logger.error('Failure downloading {} - {}', url, err)
+            self.notifier.show_download_error(url, err)
+            raise
+        except URLError as err:
+            self.logger.error('Failure downloading {} - {}', url, err)
+            self.notifier.show_download_error(url, err)
+            raise
+        self.filmliste = {'url': url, 'validator': src.info().get('ETag') or src.info().get('Last-Modified')}
+        return UpdateFileStream(src, decompressor, minimumSize, self.monitor.abort_requested)
+
+    def _getValidator(self, url):
+        # only repeated requests of the same list are conditional
+        return self.lastFilmliste.get('validator') if self.lastFilmliste.get('url') == url else None
+
     def _download(self, url, compressedFilename, targetFilename):
         # cleanup downloads
         start = time.time()
@@ -155,12 +253,20 @@ class UpdateFileDownload(object):
             self.logger.debug('Trying to download {} from {}...',
                              os.path.basename(compressedFilename), url)
             self.notifier.update_download_progress(0, url)
-            mvutils.url_retrieve(
+            download = RangeDownload(
                 url,
                 filename=compressedFilename,
                 reporthook=self.notifier.hook_download_progress,
-                aborthook=self.monitor.abort_requested
+                aborthook=self.monitor.abort_requested,
+                segments=self.settings.getDatabaseDownloadSegments(),
+                validator=self._getValidator(url)
             )
+            if not download.download():
+                self.logger.info('{} not modified', url)
+                self.notifier.close_download_progress()
+                self.modified = False
+                return False
+            self.filmliste = {'url': url, 'validator': download.getValidator()}
             self.logger.debug('downloaded {} in {} sec', compressedFilename, (time.time() - start))
         except URLError as err:
             self.logger.error('Failure downloading {} - {}', url, err)
@@ -245,3 +351,387 @@ class UpdateFileDownload(object):
                         sourcefile, destfile, err)
             raise
         return 0
+
+
+class UpdateFileStream(object):
+    """
+    A file like object which decompresses an update file while
+    it is downloaded. Only a single compressed chunk and the
+    decompressed data requested by the reader are kept in memory.
+
+    Args:
+        src(object): the opened url
+
+        decompressor(object): a lzma, bz2 or zlib decompressor object
+
+        minimumSize(int): minimum size of the decompressed data.
+            `verify()` fails on smaller files
+
+        aborthook(function, optional): if specified the stream is
+            aborted when the hook function returns `True`
+
+        chunk_size(int, optional): number of compressed bytes read
+            from the network at once. Default is 65536
+    """
+
+    def __init__(self, src, decompressor, minimumSize=0, aborthook=None, chunk_size=65536):
+        self.src = src
+        self.decompressor = decompressor
+        self.minimumSize = minimumSize
+        self.aborthook = aborthook if aborthook is not None else lambda: False
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.eof = False
+        self.compressedBytes = 0
+        self.decompressedBytes = 0
+        self.totalSize = int(
+            src.info().get('Content-Length').strip()
+        ) if src.info() and src.info().get('Content-Length') else 0
+
+    def read(self, size=-1):
+        """ Reads up to `size` decompressed bytes """
+        self._fill(size)
+        if size < 0 or size >= len(self.buffer):
+            data = bytes(self.buffer)
+            self.buffer = bytearray()
+        else:
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+        self.decompressedBytes += len(data)
+        return data
+
+    def peek(self, size):
+        """ Returns up to `size` decompressed bytes without consuming them """
+        self._fill(size)
+        return bytes(self.buffer[:size])
+
+    def _fill(self, size):
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            if self.aborthook():
+                raise ExitRequested('Reception interrupted.')
+            chunk = self.src.read(self.chunk_size)
+            if not chunk:
+                if not self.decompressor.eof:
+                    raise Exception('Update file truncated after {} bytes'.format(self.compressedBytes))
+                self.eof = True
+                break
+            self.compressedBytes += len(chunk)
+            self.buffer += self.decompressor.decompress(chunk)
+
+    def getProgress(self):
+        """ Returns the progress in percent based on the compressed bytes read """
+        if self.totalSize == 0:
+            return 0
+        return min(100, int(self.compressedBytes * 100 / self.totalSize))
+
+    def verify(self):
+        """ Raises an exception if less than the required data was received """
+        if self.decompressedBytes < self.minimumSize:
+            raise Exception('FullUpdate file size {} smaller than allowed ({}MB)'.format(self.decompressedBytes, int(self.minimumSize / 1000000)))
+
+    def close(self):
+        self.src.close()
+
+
+class RangeDownload(object):
+    """
+    Downloads a file with HTTP range requests. The data is written
+    to `<filename>.part` and the progress of every segment is saved
+    in `<filename>.part.json`, so an interrupted download continues
+    where it stopped. Failed requests are repeated with an increasing
+    delay. The file is split into segments which are downloaded in
+    parallel if requested. Servers without range support get a
+    single request which is repeated from the start.
+
+    The downloaded size is checked against the Content-Length. The
+    ETag or Last-Modified date of the first response must match the
+    one of every range, otherwise the file changed on the server and
+    the download is discarded. Without such a validator the file is
+    downloaded with a single request.
+
+    Args:
+        url(str): the source url of the file
+
+        filename(str): the destination filename
+
+        reporthook(function, optional): called with the number of
+            blocks transferred so far, the block size in bytes and
+            the total size of the file
+
+        aborthook(function, optional): the download is aborted
+            when the hook function returns `True`
+
+        segments(int, optional): number of parallel requests.
+            Default is 1
+
+        retries(int, optional): number of consecutive failed
+            requests per segment before giving up. Default is 5
+
+        backoff(float, optional): delay in seconds before the first
+            retry. It doubles with every further failure. Default is 1
+
+        timeout(int, optional): socket timeout in seconds. Default is 10
+
+        chunk_size(int, optional): number of bytes read at once.
+            Default is 65536
+
+        validator(str, optional): ETag or Last-Modified date of a
+            previous download. Nothing is downloaded if the file is
+            unchanged.
+    """
+    # segments smaller than this are not worth a request of their own
+    MIN_SEGMENT_SIZE = 4194304
+
+    def __init__(self, url, filename, reporthook=None, aborthook=None, segments=1, retries=5, backoff=1, timeout=10, chunk_size=65536, validator=None):
+        self.logger = appContext.MVLOGGER.get_new_logger('RangeDownload')
+        self.url = url
+        self.filename = filename
+        self.partFilename = filename + '.part'
+        self.stateFilename = filename + '.part.json'
+        self.reporthook = reporthook if reporthook is not None else lambda blockcount, blocksize, totalsize: None
+        self.aborthook = aborthook if aborthook is not None else lambda: False
+        self.segments = max(1, segments)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        # internals
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        self._ranges = False
+        self._totalSize = 0
+        self._validator = None
+        self._lastValidator = validator
+        self._received = 0
+        self._state = None
+        self._discarded = False
+
+    def download(self):
+        """
+        Downloads the file. Raises `ExitRequested` if aborted by
+        the abort hook. The partial download is kept in this case
+        and after network errors.
+
+        Returns:
+            bool: `False` if the file is unchanged since the
+                download with the given validator
+        """
+        failures = 0
+        while True:
+            try:
+                if not self._probe():
+                    return False
+                break
+            except (URLError, HTTPException, socket.error) as err:
+                failures += 1
+                if failures > self.retries or self._isPermanent(err):
+                    raise
+                delay = self.backoff * 2 ** (failures - 1)
+                self.logger.warn('Request of {} failed: {} - retrying in {} sec', self.url, err, delay)
+                self._wait(delay)
+        self._restore()
+        self.reporthook(0, self.chunk_size, self._totalSize)
+        threads = []
+        for index, (start, end, done) in enumerate(self._state['segments']):
+            if not self._ranges or start + done < end:
+                thread = threading.Thread(target=self._fetch, args=(index,), name='RangeDownload-{}'.format(index))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+        # the hooks are called in this thread only
+        saved = time.time()
+        running = [thread for thread in threads if thread.is_alive()]
+        while len(running) > 0:
+            # returns after 0.25 sec or when the segment is complete
+            running[0].join(0.25)
+            running = [thread for thread in running if thread.is_alive()]
+            if self.aborthook():
+                self._stop.set()
+            self.reporthook(self._received // self.chunk_size, self.chunk_size, self._totalSize)
+            if self._ranges and time.time() - saved > 2:
+                self._save()
+                saved = time.time()
+        for thread in threads:
+            thread.join()
+        self.reporthook(self._received // self.chunk_size, self.chunk_size, self._totalSize)
+        if self._ranges:
+            self._save()
+        if self._error is not None:
+            raise self._error
+        if self._stop.is_set():
+            raise ExitRequested('Reception interrupted.')
+        self._verify()
+        mvutils.file_remove(self.filename)
+        mvutils.file_rename(self.partFilename, self.filename)
+        mvutils.file_remove(self.stateFilename)
+        return True
+
+    def getValidator(self):
+        """ Returns the ETag or Last-Modified date of the file """
+        return self._validator
+
+    def _wait(self, delay):
+        end = time.time() + delay
+        while time.time() < end:
+            if self.aborthook():
+                raise ExitRequested('Reception interrupted.')
+            time.sleep(min(0.25, max(0, end - time.time())))
+
+    def _isPermanent(self, err):
+        # client errors are not solved by repeating the request
+        return isinstance(err, HTTPError) and err.code < 500 and err.code not in (408, 429)
+
+    def _probe(self):
+        request = Request(self.url)
+        request.get_method = lambda: 'HEAD'
+        addConditionalHeader(request, self._lastValidator)
+        try:
+            response = self._open(request)
+        except HTTPError as err:
+            if err.code == 304:
+                return False
+            if err.code not in (405, 501):
+                raise
+            # no HEAD support: one plain request without resume
+            self.logger.debug('{}: HEAD not supported', self.url)
+            return True
+        with closing(response):
+            info = response.info()
+            self._totalSize = int(info.get('Content-Length', '0').strip() or 0)
+            self._validator = info.get('ETag') or info.get('Last-Modified')
+            # a range of a changed file is only detected with If-Range,
+            # which requires a strong validator
+            self._ranges = self._totalSize > 0 and info.get('Accept-Ranges', '').strip() == 'bytes' and \
+                self._validator is not None and not self._validator.startswith('W/')
+        self.logger.debug('{}: size {} validator {} ranges {}', self.url, self._totalSize, self._validator, self._ranges)
+        return True
+
+    def _restore(self):
+        if self._ranges and self._validator is not None and mvutils.file_exists(self.partFilename) and mvutils.file_exists(self.stateFilename):
+            # pylint: disable=broad-except
+            try:
+                state = mvutils.loadJsonFile(self.stateFilename)
+                if state['url'] == self.url and state['size'] == self._totalSize and state['validator'] == self._validator:
+                    self._state = state
+                    self._received = sum(done for (_, _, done) in state['segments'])
+                    self.logger.info('Resuming download of {} after {} bytes', self.url, self._received)
+                    return
+            except Exception as err:
+                self.logger.warn('Cannot read {}: {}', self.stateFilename, err)
+        segments = [[0, self._totalSize, 0]]
+        if self._ranges:
+            count = max(1, min(self.segments, self._totalSize // self.MIN_SEGMENT_SIZE))
+            size = self._totalSize // count
+            segments = [[index * size, (index + 1) * size if index < count - 1 else self._totalSize, 0] for index in range(count)]
+        self._state = {'url': self.url, 'size': self._totalSize, 'validator': self._validator, 'segments': segments}
+        self._received = 0
+        with closing(open(self.partFilename, 'wb')):
+            pass
+        if self._ranges:
+            self._save()
+        else:
+            mvutils.file_remove(self.stateFilename)
+
+    def _save(self):
+        with self._lock:
+            if self._discarded:
+                return
+            state = dict(self._state, segments=[list(segment) for segment in self._state['segments']])
+        mvutils.saveJsonFile(self.stateFilename, state)
+
+    def _discard(self):
+        with self._lock:
+            self._discarded = True
+        mvutils.file_remove(self.stateFilename)
+        mvutils.file_remove(self.partFilename)
+
+    def _fetch(self, index):
+        failures = 0
+        while not self._stop.is_set():
+            received = self._received
+            try:
+                self._fetchSegment(self._state['segments'][index])
+                return
+            except (URLError, HTTPException, socket.error, IOError) as err:
+                failures = 1 if self._received > received else failures + 1
+                if failures > self.retries or self._isPermanent(err):
+                    self.logger.error('Giving up download of {} after {} attempts: {}', self.url, failures, err)
+                    self._fail(err)
+                    return
+                delay = self.backoff * 2 ** (failures - 1)
+                self.logger.warn('Download of {} failed: {} - retrying in {} sec', self.url, err, delay)
+                self._stop.wait(delay)
+            # pylint: disable=broad-except
+            except Exception as err:
+                self._fail(err)
+                return
+
+    def _fail(self, err):
+        with self._lock:
+            if self._error is None:
+                self._error = err
+        self._stop.set()
+
+    def _fetchSegment(self, segment):
+        request = Request(self.url)
+        if self._ranges:
+            request.add_header('Range', 'bytes={}-{}'.format(segment[0] + segment[2], segment[1] - 1))
+            if self._validator is not None:
+                request.add_header('If-Range', self._validator)
+        else:
+            # without range support every attempt starts from the beginning
+            with self._lock:
+                self._received -= segment[2]
+                segment[2] = 0
+        with closing(self._open(request)) as src, closing(open(self.partFilename, 'r+b')) as dst:
+            if self._ranges and (src.getcode() != 206 or (src.info().get('ETag') or src.info().get('Last-Modified')) != self._validator):
+                self._discard()
+                raise Exception('{} changed during the download'.format(self.url))
+            dst.seek(segment[0] + segment[2])
+            if not self._ranges:
+                dst.truncate()
+            while not self._stop.is_set():
+                size = self.chunk_size if not self._ranges else min(self.chunk_size, segment[1] - segment[0] - segment[2])
+                if size == 0:
+                    return
+                chunk = src.read(size)
+                if not chunk:
+                    if self._ranges or (self._totalSize > 0 and segment[2] < self._totalSize):
+                        raise IOError('Connection closed after {} bytes'.format(segment[0] + segment[2]))
+                    return
+                dst.write(chunk)
+                with self._lock:
+                    segment[2] += len(chunk)
+                    self._received += len(chunk)
+
+    def _verify(self):
+        size = mvutils.file_size(self.partFilename)
+        if self._totalSize > 0 and size != self._totalSize:
+            self._discard()
+            raise Exception('Download of {} incomplete: {} of {} bytes'.format(self.url, size, self._totalSize))
+
+    def _open(self, request):
+        try:
+            return urlopen(request, timeout=self.timeout)
+        except socket.timeout as err:
+            # not always wrapped in an URLError
+            raise URLError(err)
+
+
+def addConditionalHeader(request, validator):
+    """
+    Makes a request conditional on a change of the resource
+
+    Args:
+        request(Request): the request
+
+        validator(str): ETag or Last-Modified date of the resource
+            as received before. Nothing is added if `None`
+    """
+    if validator is None:
+        return
+    if validator.startswith(('"', 'W/')):
+        request.add_header('If-None-Match', validator)
+    else:
+        request.add_header('If-Modified-Since', validator)
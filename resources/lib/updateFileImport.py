@@ -7,10 +7,14 @@ SPDX-License-Identifier: MIT
 """
 
 # -- Imports ------------------------------------------------
+import io
+import re
 import time
 import datetime
 import _strptime
 import hashlib
+import collections
+import multiprocessing
 import resources.lib.updateFileParser as UpdateFileParser
 import resources.lib.appContext as appContext
 
@@ -20,6 +24,7 @@ from codecs import open
 import json
 
 import resources.lib.mvutils as mvutils
+from resources.lib.exceptions import ExitRequested
 
 # -- Classes ------------------------------------------------
 # pylint: disable=bad-whitespace
@@ -34,12 +39,16 @@ class UpdateFileImport(object):
         self.settings = appContext.MVSETTINGS
         self.monitor = appContext.MVMONITOR
         self.targetFilename = targetFilename
+        self.isStream = hasattr(targetFilename, 'read')
         self.database = pDatabase
+        self.shadow = False
+        self.fullImport = False
+        self.checkpoint = None
+        self.fileHeader = None
         self.use_xz = mvutils.find_xz() is not None
         self.count = 0
         self.insertCount = 0
         self.updateCount = 0
-        self.film = {}
         self.errorCount = 0
 
 ######################################################################
@@ -51,38 +60,96 @@ class UpdateFileImport(object):
 
     def updateFull(self):
         self._update_start()
-        self.database.import_begin()
-        self._importFile(self.targetFilename)
-        self.deletedCount = self.database.import_end()
+        self.fullImport = True
+        self.shadow = self.settings.getDatabaseShadowImport()
+        self.checkpoint = self._getCheckpoint()
+        if self.checkpoint is not None:
+            self.logger.info('Resuming full import after {} records', self.checkpoint['count'])
+            self.database.import_resume(self.shadow)
+        elif self.shadow:
+            self.database.import_shadow_begin()
+        else:
+            self.database.import_begin()
+        try:
+            self._importFile(self.targetFilename)
+            if self.isStream:
+                # never delete films based on a truncated update
+                self.targetFilename.verify()
+        except ExitRequested:
+            # the shadow table is kept for resuming from the last checkpoint
+            raise
+        except Exception:
+            if self.shadow and self.checkpoint is None:
+                self.database.import_shadow_cancel()
+            # otherwise the shadow table is kept for resuming from the last checkpoint
+            raise
+        if self.shadow:
+            (self.insertCount, self.updateCount, self.deletedCount) = self.database.import_shadow_end()
+        else:
+            self.deletedCount = self.database.import_end()
         self._update_end()
 
+    def getFilmlisteId(self):
+        """ Returns the id of the Filmliste from its header or None """
+        fileHeader = self._getHeader()
+        return fileHeader[4] if len(fileHeader) > 4 else None
+
+    def _getHeader(self):
+        # the header is read ahead of the import
+        if self.fileHeader is None:
+            if self.isStream:
+                source = io.BytesIO(self.targetFilename.peek(65536))
+            elif mvutils.file_exists(self.targetFilename):
+                source = self.targetFilename
+            else:
+                return []
+            ufp = UpdateFileParser.UpdateFileParser(self.logger, 65536, source)
+            try:
+                ufp.init()
+                self.fileHeader = ufp.getHeader()
+            finally:
+                ufp.close()
+        return self.fileHeader
+
+    def _getCheckpoint(self):
+        # the checkpoint of an interrupted full import if it belongs to this file
+        checkpoint = self.database.getImportCheckpoint()
+        if checkpoint is None or self.isStream:
+            return None
+        fileHeader = self._getHeader()
+        if len(fileHeader) == 0 or checkpoint.get('filmliste') != fileHeader[0] or checkpoint.get('shadow') != self.shadow:
+            self.logger.debug('Checkpoint {} does not match the update file', checkpoint)
+            return None
+        return checkpoint
+
     def _importFile(self, targetFilename):
         #
-        if not mvutils.file_exists(targetFilename):
+        if self.isStream:
+            records = 0
+            self.logger.info('Starting import of {} compressed bytes from stream', targetFilename.totalSize)
+        elif not mvutils.file_exists(targetFilename):
             self.logger.error('File {} does not exists!', targetFilename)
             return False
-        # estimate number of records in update file
-        fileSizeInByte = mvutils.file_size(targetFilename)
-        records = int(fileSizeInByte / 600)
-        self.logger.info('Starting import of approximately {} records from {}', records, targetFilename)
+        else:
+            # estimate number of records in update file
+            fileSizeInByte = mvutils.file_size(targetFilename)
+            records = int(fileSizeInByte / 600)
+            self.logger.info('Starting import of approximately {} records from {}', records, targetFilename)
         #
         # pylint: disable=broad-except
         try:
             flsm = 0
             flts = 0
             #
-            sender = ""
-            thema = ""
             self.notifier.show_update_progress()
             #
             ufp = UpdateFileParser.UpdateFileParser(self.logger, 512000, targetFilename)
             ufp.init()
-            fileHeader = ufp.next('"X":');
+            fileHeader = ufp.getHeader()
             # META
             # {"Filmliste":["30.08.2020, 11:13","30.08.2020, 09:13","3","MSearch [Vers.: 3.1.139]","d93c9794acaf3e482d42c24e513f78a8"],"Filmliste":["Sender","Thema","Titel","Datum","Zeit","Dauer","Größe [MB]","Beschreibung","Url","Website","Url Untertitel","Url RTMP","Url Klein","Url RTMP Klein","Url HD","Url RTMP HD","DatumL","Url History","Geo","neu"]
             # this is the timestamp of this database update
-            # value = jsonDoc['Filmliste'][0]
-            value = fileHeader[15:32]
+            value = fileHeader[0] if len(fileHeader) > 0 else ''
             self.logger.debug('update date {}', value)
             try:
                 fldt = datetime.datetime.strptime(value.strip(), "%d.%m.%Y, %H:%M")
@@ -105,108 +172,61 @@ class UpdateFileImport(object):
                 pass
 
             #
-            recordArray = [];
+            sender = ""
+            thema = ""
+            if self.checkpoint is not None:
+                ufp.seek(self.checkpoint['offset'])
+                self.count = self.checkpoint['count']
+                sender = self.checkpoint['sender']
+                thema = self.checkpoint['thema']
+            if self.settings.getDatabaseImportWorkers() > 1:
+                batches = self._decodeParallel(ufp, self.settings.getDatabaseImportWorkers(), sender, thema)
+            else:
+                batches = self._decode(ufp, sender, thema)
             #
-            while (True):
-                aPart = ufp.next('"X":')
-                aPart = aPart.strip()
-                if (len(aPart) == 0):
-                    break;
-                #
-                aPart = '{"X":' + aPart
-                aPart = aPart[0:-1] + '}'
-                #
-                #self.logger.debug('PARSE {}', aPart)
-                jsonDoc = json.loads(aPart)
-                jsonDoc = jsonDoc['X']
-                self._init_record()
-                # behaviour of the update list
-                if (len(jsonDoc[0]) > 0):
-                    sender = jsonDoc[0][:32]
-                else:
-                    jsonDoc[0] = sender
-                # same for thema
-                if (len(jsonDoc[1]) > 0):
-                    thema = jsonDoc[1][:128]
-                else:
-                    jsonDoc[1] = thema
-                #
-                self.film['channel'] = sender
-                self.film['show'] = thema
-                self.film["title"] = jsonDoc[2][:128]
-                #
-                if len(jsonDoc[3]) == 10:
-                    self.film["aired"] = jsonDoc[3][6:] + '-' + jsonDoc[3][3:5] + '-' + jsonDoc[3][:2]
-                    if (len(jsonDoc[4]) == 8):
-                        self.film["aired"] = self.film["aired"] + " " + jsonDoc[4]
-                #
-                if len(jsonDoc[5]) > 0:
-                    self.film["duration"] = jsonDoc[5]
-                if len(jsonDoc[7]) > 0:
-                    self.film["description"] = jsonDoc[7][:1024]
-                self.film["url_video"] = jsonDoc[8]
-                self.film["website"] = jsonDoc[9]
-                self.film["url_sub"] = jsonDoc[10]
-                self.film["url_video_sd"] = self._make_url(jsonDoc[12])
-                self.film["url_video_hd"] = self._make_url(jsonDoc[14])
-                if len(jsonDoc[16]) > 0:
-                    self.film["airedepoch"] = int(jsonDoc[16])
-                self.film["geo"] = jsonDoc[18]
-                #
-                # check if the movie is there
-                #
-                checkString = sender + thema + self.film["title"] + self.film['url_video']
-                idhash = hashlib.md5(checkString.encode('utf-8')).hexdigest()
-                #
-                showid = hashlib.md5(thema.encode('utf-8')).hexdigest()
-                showid = showid[:8]
-                #
-                recordArray.append((
-                        idhash,
-                        int(time.time()),
-                        self.film['channel'],
-                        showid,
-                        self.film['show'],
-                        self.film["title"],
-                        self.film['airedepoch'],
-                        mvutils.make_duration(self.film['duration']),
-                        self.film['description'],
-                        self.film['url_sub'],
-                        self.film['url_video'],
-                        self.film['url_video_sd'],
-                        self.film['url_video_hd']
-                    ))
-                self.count = self.count + 1
+            for (recordArray, position, sender, thema) in batches:
+                self.count = self.count + len(recordArray)
                 # check
-                if self.count % self.settings.getDatabaseImportBatchSize() == 0:
-                    if self.monitor.abort_requested():
-                        # kodi is shutting down. Close all
-                        self._update_end()
-                        self.notifier.close_update_progress()
-                        raise Exception('User requested Abort')
-                    else:
-                        # run insert
-                        try:
-                            (ai, au) = self.database.import_films(recordArray)
-                            self.insertCount += ai
-                            self.updateCount += au
-                        except Exception as err:
-                            self.logger.error('Error in data import: {}', err)
-                            self.errorCount = self.errorCount + 1
-                        recordArray = []
-                        # update status
-                        percent = int(self.count * 100 / records)
-                        percent = percent if percent <= 100 else 100
-                        self.logger.debug('In progress (%d%%): insert:%d, update:%d' % (percent, self.insertCount, self.updateCount))
-                        self.notifier.update_update_progress(percent, self.count, self.insertCount, self.updateCount)
-            if len(recordArray) > 0:
+                if self.monitor.abort_requested():
+                    # kodi is shutting down. Close all
+                    self._update_end()
+                    self.notifier.close_update_progress()
+                    raise ExitRequested('User requested Abort')
+                # full imports of files continue after the last imported batch if interrupted
+                checkpoint = None
+                if self.fullImport and not self.isStream and len(fileHeader) > 0 and self.errorCount == 0:
+                    checkpoint = {
+                        'filmliste': fileHeader[0],
+                        'shadow': self.shadow,
+                        'offset': position,
+                        'count': self.count,
+                        'sender': sender,
+                        'thema': thema
+                    }
+                # run insert
                 try:
-                    (ai, au) = self.database.import_films(recordArray)
+                    if self.shadow:
+                        (ai, au) = self.database.import_films_shadow(recordArray, checkpoint)
+                    else:
+                        (ai, au) = self.database.import_films(recordArray, checkpoint)
                     self.insertCount += ai
                     self.updateCount += au
                 except Exception as err:
                     self.logger.error('Error in data import: {}', err)
                     self.errorCount = self.errorCount + 1
+                    if self.fullImport:
+                        # a resume retries from the last complete batch
+                        raise
+                if checkpoint is not None:
+                    self.checkpoint = checkpoint
+                # update status
+                if self.isStream:
+                    percent = targetFilename.getProgress()
+                else:
+                    percent = int(self.count * 100 / records) if records > 0 else 0
+                    percent = percent if percent <= 100 else 100
+                self.logger.debug('In progress (%d%%): insert:%d, update:%d' % (percent, self.insertCount, self.updateCount))
+                self.notifier.update_update_progress(percent, self.count, self.insertCount, self.updateCount)
             #
             ufp.close()
             self.notifier.close_update_progress()
@@ -220,6 +240,70 @@ class UpdateFileImport(object):
             self.notifier.close_update_progress()
             raise
 
+    def _decode(self, ufp, sender, thema):
+        # converts all records in this process and returns batches
+        # with the file position and the sender and thema after them
+        batchSize = self.settings.getDatabaseImportBatchSize()
+        recordArray = []
+        for jsonDoc in ufp.records():
+            # behaviour of the update list
+            if (len(jsonDoc[0]) > 0):
+                sender = jsonDoc[0][:32]
+            # same for thema
+            if (len(jsonDoc[1]) > 0):
+                thema = jsonDoc[1][:128]
+            recordArray.append(makeRecord(jsonDoc, sender, thema, int(time.time())))
+            if len(recordArray) >= batchSize:
+                yield (recordArray, self._getPosition(ufp), sender, thema)
+                recordArray = []
+        if len(recordArray) > 0:
+            yield (recordArray, self._getPosition(ufp), sender, thema)
+
+    def _decodeParallel(self, ufp, workers, sender, thema):
+        # converts chunks of records in a process pool and returns
+        # the batches in file order. The number of chunks in flight
+        # is limited to keep the memory usage bounded.
+        self.logger.debug('Decoding records with {} worker processes', workers)
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = collections.deque()
+            for args in self._chunks(ufp, sender, thema):
+                pending.append((pool.apply_async(decodeChunk, (args,)), self._getPosition(ufp)))
+                if len(pending) > workers * 2:
+                    (result, position) = pending.popleft()
+                    (recordArray, sender, thema) = result.get()
+                    yield (recordArray, position, sender, thema)
+            while len(pending) > 0:
+                (result, position) = pending.popleft()
+                (recordArray, sender, thema) = result.get()
+                yield (recordArray, position, sender, thema)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _getPosition(self, ufp):
+        # streams cannot be resumed
+        return None if self.isStream else ufp.getPosition()
+
+    def _chunks(self, ufp, sender, thema):
+        # The sender and thema of a record are empty if they are the
+        # same as in the previous record. The values in effect at the
+        # start of each chunk are taken from the record starts of the
+        # previous chunk, so the chunks can be converted independently.
+        for chunk in ufp.chunks(self.settings.getDatabaseImportBatchSize()):
+            yield (chunk, sender, thema)
+            lastSender = ""
+            lastThema = ""
+            for match in RECORD_START.finditer(chunk):
+                if len(match.group(1)) > 0:
+                    lastSender = match.group(1)
+                if len(match.group(2)) > 0:
+                    lastThema = match.group(2)
+            if len(lastSender) > 0:
+                sender = json.loads('"' + lastSender + '"')[:32]
+            if len(lastThema) > 0:
+                thema = json.loads('"' + lastThema + '"')[:128]
+
 ######################################################################
 
     def _update_start(self):
@@ -229,30 +313,124 @@ class UpdateFileImport(object):
         self.updateCount = 0
         self.deletedCount = 0
         self.startTime = time.time()
-        self.film = {}
-        self._init_record()
 
     def _update_end(self):
         self.logger.info('{} records processed in {} sec. Updated: {} Inserted: {} deleted: {}', self.count, int(time.time() - self.startTime), self.updateCount, self.insertCount, self.deletedCount)
 
-    def _init_record(self):
-        self.film["channel"] = ""
-        self.film["show"] = ""
-        self.film["title"] = ""
-        self.film["aired"] = "1980-01-01 00:00:00"
-        self.film["duration"] = "00:00:00"
-        self.film["description"] = ""
-        self.film["url_sub"] = ""
-        self.film["url_video"] = ""
-        self.film["url_video_sd"] = ""
-        self.film["url_video_hd"] = ""
-        self.film["airedepoch"] = 0
-        self.film["geo"] = ""
-
-    def _make_url(self, val):
-        parts = val.split('|')
-        if len(parts) == 2:
-            cnt = int(parts[0])
-            return self.film["url_video"][:cnt] + parts[1]
-        else:
-            return val
+
+# -- Functions ----------------------------------------------
+# start of a record with the sender and thema fields
+RECORD_START = re.compile(r'(?:^|"X":)\s*\[\s*"((?:[^"\\]|\\.)*)"\s*,\s*"((?:[^"\\]|\\.)*)"')
+
+
+def decodeChunk(args):
+    """
+    Converts a chunk of raw records into database records. Runs
+    in the worker processes of the parallel import.
+
+    Args:
+        args(tuple): raw chunk, sender and thema in effect at
+            the start of the chunk
+
+    Returns:
+        tuple: the records and the sender and thema in effect
+            at the end of the chunk
+    """
+    (chunk, sender, thema) = args
+    recordArray = []
+    for jsonDoc in UpdateFileParser.UpdateFileParser.parseChunk(chunk):
+        if (len(jsonDoc[0]) > 0):
+            sender = jsonDoc[0][:32]
+        if (len(jsonDoc[1]) > 0):
+            thema = jsonDoc[1][:128]
+        recordArray.append(makeRecord(jsonDoc, sender, thema, int(time.time())))
+    return (recordArray, sender, thema)
+
+
+def makeRecord(jsonDoc, sender, thema, dtCreated):
+    """
+    Converts a Filmliste "X" array into a database record
+
+    Args:
+        jsonDoc(list): the Filmliste record
+
+        sender(str): the channel of the record
+
+        thema(str): the show of the record
+
+        dtCreated(int): creation timestamp of the record
+    """
+    title = jsonDoc[2][:128]
+    duration = jsonDoc[5] if len(jsonDoc[5]) > 0 else "00:00:00"
+    description = jsonDoc[7][:1024]
+    url_video = jsonDoc[8]
+    airedepoch = int(jsonDoc[16]) if len(jsonDoc[16]) > 0 else 0
+    #
+    # check if the movie is there
+    #
+    checkString = sender + thema + title + url_video
+    idhash = hashlib.md5(checkString.encode('utf-8')).hexdigest()
+    #
+    showid = hashlib.md5(thema.encode('utf-8')).hexdigest()
+    showid = showid[:8]
+    #
+    seconds = mvutils.make_duration(duration)
+    letter = makeLetter(thema)
+    #
+    # detect changed films: hash over all values but the creation date
+    # with the urls expanded like in the database before they were compacted
+    #
+    contentString = '\x00'.join((
+        sender, showid, thema, title, str(airedepoch), str(seconds), description,
+        jsonDoc[10], url_video, mvutils.make_url(url_video, jsonDoc[12]), mvutils.make_url(url_video, jsonDoc[14]), letter
+    ))
+    contenthash = hashlib.md5(contentString.encode('utf-8')).hexdigest()
+    #
+    # the sd and hd urls stay relative to the video url, the directory
+    # of the video url is replaced by its id in the urlprefix table
+    (url_prefix, url_video) = splitUrl(url_video)
+    #
+    # the database keeps the showid as the integer of its hex digits
+    # and the idhash in binary, see StoreQuery._prepareFilms
+    showid = int(showid, 16)
+    #
+    return (
+        idhash,
+        dtCreated,
+        sender,
+        showid,
+        thema,
+        title,
+        airedepoch,
+        seconds,
+        description,
+        jsonDoc[10],
+        url_prefix,
+        url_video,
+        jsonDoc[12],
+        jsonDoc[14],
+        letter,
+        contenthash
+    )
+
+
+def makeLetter(showname):
+    """
+    Returns the start letter of a show for the A-Z browser:
+    the uppercase letter, '0' for digits and '#' otherwise
+    """
+    letter = showname[:1]
+    if ('a' <= letter <= 'z') or ('A' <= letter <= 'Z'):
+        return letter.upper()
+    elif '0' <= letter <= '9':
+        return '0'
+    return '#'
+
+
+def splitUrl(url):
+    """
+    Splits an url after the last slash into the directory
+    shared by many films and the file name
+    """
+    index = url.rfind('/') + 1
+    return (url[:index], url[index:])
@@ -8,51 +8,163 @@ SPDX-License-Identifier: MIT
 
 # -- Imports ------------------------------------------------
 import json
-from contextlib import closing
-from codecs import open
+import codecs
+from json.decoder import WHITESPACE
 
 
 class UpdateFileParser(object):
+    """
+    Streaming tokenizer for the Filmliste format
+
+    The Filmliste is one JSON object with two leading "Filmliste"
+    header arrays followed by one "X" array per film. The parser
+    reads the file as raw bytes in chunks, decodes every chunk once
+    and lets the JSON scanner decode each "X" array directly from
+    the buffer position. Memory usage is limited to one chunk plus
+    one record.
+
+    Args:
+        logger(LoggerInterface): the logger instance
+
+        bufferSize(int): number of bytes read per chunk
+
+        inputFilename(str|object): full pathname of the Filmliste
+            file or a file like object returning bytes
+    """
+    MARKER = '"X":'
+    HEADER = '"Filmliste":'
 
     def __init__(self, logger, bufferSize, inputFilename):
         self.logger = logger
         self.bufferSize = bufferSize
         self.filename = inputFilename
-        self.buffer = ""
+        self.filehandle = None
+        self.decoder = None
+        self.buffer = ''
         self.cPosition = 0
+        self.bPosition = 0
+        self.eof = False
+        self.header = []
+        self._jsonDecoder = json.JSONDecoder()
         # self.logger.debug('UpdateFileParser constructed' )
 
     def init(self):
-        self.filehandle = open(self.filename, 'rb', encoding="utf-8")
-        self.buffer = self.filehandle.read(self.bufferSize)
-        # self.logger.debug('UpdateFileParser init reading ' + str(len(self.buffer)) + ' bytes to buffer' )
-
-    def next(self, aWord):
-        #
-        if (self.cPosition == -1):
-            # self.logger.debug("EOF")
-            return ""
-        index = self.buffer.find(aWord, self.cPosition)
-        # print("index " + str(index))
-        if (index > -1):
-            rtBuffer = self.buffer[self.cPosition:index]
-            self.cPosition = (index + len(aWord))
-            # self.logger.debug("Found at " + str(index))
-            return rtBuffer
+        """ Opens the file and reads the Filmliste header """
+        if hasattr(self.filename, 'read'):
+            self.filehandle = self.filename
         else:
-            nbuffer = self.filehandle.read(self.bufferSize)
-            # print("filled new buffer with " + str(len(nbuffer)))
-            if (len(nbuffer) == 0):
-                rStr = self.buffer[self.cPosition:]
-                self.cPosition = -1
-                # self.logger.debug("no more buffer")
-                return rStr
-            else:
-                self.buffer = self.buffer[self.cPosition:] + nbuffer
-                self.cPosition = 0
-                # self.logger.debug("refill buffer - next iteration")
-                return self.next(aWord)
-        return ""
+            self.filehandle = open(self.filename, 'rb')
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.cPosition = 0
+        self.bPosition = 0
+        self.eof = False
+        index = self._find(0)
+        self.header = self._parseHeader(self.buffer[:index] if index > -1 else self.buffer)
+        self.cPosition = index + len(self.MARKER) if index > -1 else len(self.buffer)
+        # self.logger.debug('UpdateFileParser init header {}', self.header)
+
+    def getHeader(self):
+        """
+        Returns the first "Filmliste" header array:
+        date, date (UTC), version, crawler and list id
+        """
+        return self.header
+
+    def getPosition(self):
+        """
+        Byte offset in the file of the current position. Between the
+        records this is the start of the next record.
+        """
+        return self.bPosition + len(self.buffer[:self.cPosition].encode('utf-8'))
+
+    def seek(self, position):
+        """
+        Continues reading at a byte offset returned by `getPosition`.
+        Only for files.
+        """
+        self.filehandle.seek(position)
+        self.decoder.reset()
+        self.buffer = ''
+        self.cPosition = 0
+        self.bPosition = position
+        self.eof = False
+
+    def records(self):
+        """ Generator returning each "X" array as a list """
+        while True:
+            index = self._find(self.cPosition)
+            if index == -1 and len(self.buffer.rstrip('} \t\r\n')) <= self.cPosition:
+                return
+            start = WHITESPACE.match(self.buffer, self.cPosition).end()
+            (record, _) = self._jsonDecoder.raw_decode(self.buffer, start)
+            self.cPosition = index + len(self.MARKER) if index > -1 else len(self.buffer)
+            yield record
+
+    def chunks(self, recordCount):
+        """
+        Generator returning the raw text of up to `recordCount`
+        records per chunk. The chunks can be decoded with
+        `parseChunk`
+        """
+        while True:
+            index = self._find(self.cPosition)
+            count = 1
+            while index > -1 and count < recordCount:
+                index = self._find(index + len(self.MARKER))
+                count += 1
+            if index == -1:
+                chunk = self.buffer[self.cPosition:].rstrip('} \t\r\n')
+                self.cPosition = len(self.buffer)
+                if len(chunk) > 0:
+                    yield chunk
+                return
+            chunk = self.buffer[self.cPosition:index]
+            self.cPosition = index + len(self.MARKER)
+            yield chunk
+
+    @staticmethod
+    def parseChunk(chunk):
+        """ Generator returning each "X" array of a chunk as a list """
+        jsonDecoder = json.JSONDecoder()
+        position = 0
+        while position > -1:
+            start = WHITESPACE.match(chunk, position).end()
+            (record, _) = jsonDecoder.raw_decode(chunk, start)
+            yield record
+            position = chunk.find(UpdateFileParser.MARKER, start)
+            if position > -1:
+                position += len(UpdateFileParser.MARKER)
 
     def close(self):
-        self.filehandle.close()
+        if self.filehandle is not None:
+            self.filehandle.close()
+            self.filehandle = None
+
+    def _find(self, searchPosition):
+        # position of the next marker - refills the buffer until found or EOF
+        while True:
+            index = self.buffer.find(self.MARKER, searchPosition)
+            if index > -1 or self.eof:
+                return index
+            nbuffer = self.filehandle.read(self.bufferSize)
+            self.eof = len(nbuffer) == 0
+            # drop consumed data and continue searching where we stopped
+            searchPosition = max(0, len(self.buffer) - self.cPosition - len(self.MARKER) + 1)
+            self.bPosition += len(self.buffer[:self.cPosition].encode('utf-8'))
+            self.buffer = self.buffer[self.cPosition:] + self.decoder.decode(nbuffer, self.eof)
+            self.cPosition = 0
+
+    def _parseHeader(self, headerText):
+        # {"Filmliste":["30.08.2020, 11:13","30.08.2020, 09:13","3","MSearch [Vers.: 3.1.139]","d93c9794acaf3e482d42c24e513f78a8"],"Filmliste":[...],
+        index = headerText.find(self.HEADER)
+        if index == -1:
+            self.logger.warn('No Filmliste header found')
+            return []
+        try:
+            (header, _) = self._jsonDecoder.raw_decode(headerText, index + len(self.HEADER))
+            return header
+        # pylint: disable=broad-except
+        except Exception as err:
+            self.logger.warn('Could not parse Filmliste header: {}', err)
+            return []
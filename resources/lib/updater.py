@@ -9,11 +9,13 @@ SPDX-License-Identifier: MIT
 # -- Imports ------------------------------------------------
 import os
 import time
+import resources.lib.extendedSearchModel as ExtendedSearchModel
 from datetime import datetime
 import resources.lib.appContext as appContext
 import resources.lib.mvutils as mvutils
+from resources.lib.storeQuery import DATABASE_VERSION
 from resources.lib.storeMySql import StoreMySQL
-from resources.lib.storeSqlite import StoreSQLite
+from resources.lib.storeSqlite import StoreSQLite, removeJournal
 from resources.lib.storeSqliteSetup import StoreSQLiteSetup
 from resources.lib.storeMySqlSetup import StoreMySQLSetup
 from resources.lib.updateFileDownload import UpdateFileDownload
@@ -22,6 +24,9 @@ from resources.lib.updateFileImport import UpdateFileImport
 # -- Classes ------------------------------------------------
 # pylint: disable=bad-whitespace
 
+# number of the most used extended searches cached after an update
+WARMUP_SEARCHES = 5
+
 
 class MediathekViewUpdater(object):
     """ The database updator class """
@@ -43,10 +48,10 @@ class MediathekViewUpdater(object):
             self.exit()
         if self.settings.getDatabaseType() == 0:
             self.logger.debug('Database driver: Internal (sqlite)')
-            self.database = StoreSQLite()
+            self.database = StoreSQLite(importer=True)
         elif self.settings.getDatabaseType() == 1:
             self.logger.debug('Database driver: External (mysql)')
-            self.database = StoreMySQL()
+            self.database = StoreMySQL(pooled=True)
         else:
             self.logger.warn('Unknown Database driver selected')
             self.database = None
@@ -59,7 +64,11 @@ class MediathekViewUpdater(object):
             self.database = None
 
     def doUpdate(self):
-        """ "Disabled" / "Manual" / "On Start" / "Automatic" / "continuous" """
+        """
+        "Disabled" / "Manual" / "On Start" / "Automatic" / "continuous"
+
+        Returns `True` if the database was updated
+        """
         databaseStatus = self.database.getDatabaseStatus()
         updateConfig = self.settings.getDatabaseUpateMode()
         tsnow = int(time.time())
@@ -81,7 +90,12 @@ class MediathekViewUpdater(object):
         self.logger.debug('Update Mode "{}"', updateConfigName.get(updateConfig))
         #
         doSomething = 0
-        if (int(databaseStatus['version']) != 3 or databaseStatus['status'] == 'UNINIT'):
+        if (3 <= int(databaseStatus['version']) < DATABASE_VERSION and databaseStatus['status'] != 'UNINIT'):
+            self.logger.debug('Version update from {}', databaseStatus['version'])
+            self._migrateDatabase(databaseStatus['version'])
+            databaseStatus = self.database.getDatabaseStatus()
+        #
+        if (int(databaseStatus['version']) != DATABASE_VERSION or databaseStatus['status'] == 'UNINIT'):
             self.logger.debug('Version update or not initialized')
             doSomething = -1
             #
@@ -90,7 +104,7 @@ class MediathekViewUpdater(object):
             else:
                 StoreMySQLSetup(self.database).setupDatabase()
             #
-            self.database.set_status(pStatus='IDLE', pLastupdate=0, pLastFullUpdate=0, pFilmupdate=0, pVersion='3')
+            self.database.set_status(pStatus='IDLE', pLastupdate=0, pLastFullUpdate=0, pFilmupdate=0, pVersion=str(DATABASE_VERSION))
             databaseStatus = self.database.getDatabaseStatus()
             #
         elif updateConfig == 1 and self.settings.is_update_triggered():
@@ -111,16 +125,24 @@ class MediathekViewUpdater(object):
         elif updateConfig == 9:
             self.logger.debug('mvupdate --full')
             doSomething = -1
+        # create or drop the full-text index when the setting changed
+        self.database.setupFulltext()
         #
         if (doSomething == 0):
             self.logger.debug('nothing to do')
-            return
+            return False
         #
         lastFullUpdate = datetime.fromtimestamp(databaseStatus['lastFullUpdate'])
         #
-        ufd = UpdateFileDownload()
+        # forced updates download and import unconditionally
+        ufd = UpdateFileDownload(self.database.getLastFilmliste() if doSomething == 1 else None)
+        updated = True
+        # an interrupted full update is continued before anything else
+        resume = doSomething == 1 and self.database.getImportCheckpoint() is not None
+        if resume:
+            self.logger.debug('continue interrupted full update')
         #
-        if doSomething == -1 or (not (currentDate.day == lastFullUpdate.day and
+        if doSomething == -1 or resume or (not (currentDate.day == lastFullUpdate.day and
             currentDate.month == lastFullUpdate.month and
             currentDate.year == lastFullUpdate.year) and
             currentDate.hour > 5
@@ -130,11 +152,17 @@ class MediathekViewUpdater(object):
                 self.logger.debug('sqlite update')
                 ufd.downloadSqliteDb()
                 self.database.exit()
+                # the WAL files of the replaced database must not be applied to the new one
+                removeJournal(self.database.dbfile)
                 ufd.updateSqliteDb()
                 ufd.removeDownloads()
                 # check database is alive
                 check = self.database.get_status()
+                if check['mov'] > 0 and int(check['version']) < DATABASE_VERSION:
+                    # the downloaded database comes with an older schema
+                    self._migrateDatabase(check['version'])
                 if check['mov'] > 0:
+                    self.database.setupFulltext()
                     self.database.set_status('IDLE', pLastupdate=int(time.time()), pLastFullUpdate=int(time.time()))
                 else:
                     self.database.set_status('UNINIT')
@@ -143,16 +171,20 @@ class MediathekViewUpdater(object):
             else:
                 # download full filmlist and do a full update
                 self.logger.debug('full update')
-                if (not(mvutils.file_exists(os.path.join(self.settings.getDatapath() , 'Filmliste-akt')))): 
-                    ufd.downloadFullUpdateFile()
-                    downloadFullUpdate = True
+                if self.settings.getDatabaseUpdateStreaming():
+                    # decompress and import while downloading
+                    updated = self._importUpdate(ufd, ufd.openFullUpdateStream(), True)
                 else:
-                    ufd._filename = os.path.join(self.settings.getDatapath() , 'Filmliste-akt')
-                    self.logger.debug('use existing full update file')
-                    downloadFullUpdate = False
-                UpdateFileImport(ufd.getTargetFilename(), self.database).updateFull()
-                if (downloadFullUpdate):
-                    ufd.removeDownloads()
+                    if (not(mvutils.file_exists(os.path.join(self.settings.getDatapath() , 'Filmliste-akt')))):
+                        ufd.downloadFullUpdateFile()
+                        downloadFullUpdate = True
+                    else:
+                        ufd._filename = os.path.join(self.settings.getDatapath() , 'Filmliste-akt')
+                        self.logger.debug('use existing full update file')
+                        downloadFullUpdate = False
+                    updated = self._importUpdate(ufd, ufd.getTargetFilename(), True)
+                    if (downloadFullUpdate):
+                        ufd.removeDownloads()
                 #
                 self.database.set_status('IDLE', pLastupdate=int(time.time()), pLastFullUpdate=int(time.time()))
                 #
@@ -160,9 +192,77 @@ class MediathekViewUpdater(object):
         else:
             # download incremental filmlist and do the update
             self.logger.debug('incremental update')
-            ufd.downloadIncrementalUpdateFile()
-            UpdateFileImport(ufd.getTargetFilename(), self.database).updateIncremental()
-            ufd.removeDownloads()
+            if self.settings.getDatabaseUpdateStreaming():
+                updated = self._importUpdate(ufd, ufd.openIncrementalUpdateStream(), False)
+            else:
+                ufd.downloadIncrementalUpdateFile()
+                updated = self._importUpdate(ufd, ufd.getTargetFilename(), False)
+                ufd.removeDownloads()
             self.database.set_status('IDLE', pLastupdate=int(time.time()))
             self.settings.set_update_triggered('false')
+        return updated
+
+    def _importUpdate(self, ufd, source, full):
+        """
+        Imports a downloaded Filmliste unless the server reported it
+        unchanged or the same list was imported before
+
+        Args:
+            ufd(UpdateFileDownload): the download of the Filmliste
 
+            source(str|UpdateFileStream): the Filmliste file or stream
+
+            full(bool): full update if `True`
+
+        Returns:
+            bool: `True` if the Filmliste was imported
+        """
+        if not ufd.isModified():
+            return False
+        ufi = UpdateFileImport(source, self.database)
+        filmliste = dict(ufd.getFilmliste(), id=ufi.getFilmlisteId())
+        imported = filmliste['id'] is not None and filmliste['id'] == ufd.lastFilmliste.get('id') and filmliste['url'] == ufd.lastFilmliste.get('url')
+        if imported and self.database.getImportCheckpoint() is None:
+            self.logger.info('Filmliste {} already imported', filmliste['id'])
+            if ufi.isStream:
+                source.close()
+            # the validator may have changed with the same content
+            self.database.setLastFilmliste(filmliste)
+            return False
+        if full:
+            ufi.updateFull()
+        else:
+            ufi.updateIncremental()
+        self.database.setLastFilmliste(filmliste)
+        return True
+
+    def warmupCache(self):
+        """
+        Caches the main menu entries and the most used extended
+        searches so that the first browse after an update is a hit
+        """
+        try:
+            self.database.warmupCache(self._getFrequentSearches())
+        # pylint: disable=broad-except
+        except Exception as err:
+            self.logger.warn('Cache warm-up failed: {}', err)
+
+    def _getFrequentSearches(self):
+        filename = os.path.join(self.settings.getDatapath(), 'searchConfig.json')
+        if not mvutils.file_exists(filename):
+            return []
+        try:
+            data = mvutils.loadJsonFile(filename)
+        # pylint: disable=broad-except
+        except Exception as err:
+            self.logger.warn('Failed to load extended searches {}: {}', filename, err)
+            return []
+        data = sorted([entry for entry in data if entry.get('runs', 0) > 0], key=lambda entry: entry.get('runs', 0), reverse=True)
+        return [ExtendedSearchModel.ExtendedSearchModel('').fromDict(entry) for entry in data[:WARMUP_SEARCHES]]
+
+    def _migrateDatabase(self, fromVersion):
+        if self.settings.getDatabaseType() == 0:
+            StoreSQLiteSetup(self.database).migrateDatabase(fromVersion)
+        else:
+            StoreMySQLSetup(self.database).migrateDatabase(fromVersion)
+        self.database.set_status(pVersion=str(DATABASE_VERSION))
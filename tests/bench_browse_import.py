@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the browse latency during an import
+
+Builds a SQLite database of synthetic films and rewrites them with an
+importer connection in a thread. Meanwhile the main thread clicks
+through the plugin like a user: every click opens a new browse
+connection and runs getChannels, getShowsByChannnel and getFilms.
+Prints the latency of the clicks and the duration of the import.
+
+--legacy connects with the former settings (journal_mode=off and
+synchronous=off on every connection) for comparison.
+
+Usage: python tests/bench_browse_import.py [--films 200000] [--legacy]
+
+SPDX-License-Identifier: MIT
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+import resources.lib.appContext as appContext
+import resources.lib.storeSqlite as storeSqlite
+from resources.lib.loggerCommandline import LoggerCommandline
+from resources.lib.settingsInterface import SettingsInterface
+from resources.lib.notifierInterface import NotifierInterface
+from resources.lib.monitorInterface import MonitorInterface
+from resources.lib.storeSqlite import StoreSQLite
+from resources.lib.storeSqliteSetup import StoreSQLiteSetup
+
+CHANNELS = ['ARD', 'ZDF', 'ARTE.DE', '3Sat', 'BR', 'HR', 'MDR', 'NDR', 'SWR', 'WDR']
+
+LEGACY_PRAGMAS = [
+    'pragma synchronous=off',
+    'pragma journal_mode=off'
+]
+
+
+class BenchSettings(SettingsInterface):
+    """ Settings of the benchmark database """
+
+    def __init__(self, datapath):
+        self.datapath = datapath
+
+    def getDatapath(self):
+        return self.datapath
+
+    def getCaching(self):
+        return False
+
+    def getMaxResults(self):
+        return 100
+
+
+def makeFilm(index, version):
+    """ A record as built by the update file import """
+    channel = CHANNELS[index % len(CHANNELS)]
+    show = index % 997
+    showname = 'Show {} {}'.format(chr(ord('A') + show % 26), show)
+    aired = 1600000000 + index * 60
+    return (
+        '{:032x}'.format(index), aired, channel, '{:08x}'.format(show * 7919 + 1), showname, 'Title {}'.format(index),
+        aired, 600 + index % 3000, 'Description {} '.format(index) * 10,
+        '', 'https://example.com/{}/'.format(channel), 'video{}.mp4'.format(index), '', '',
+        showname[0], '{:016x}{:016x}'.format(index, version)
+    )
+
+
+def importFilms(importer, films, batchSize, version, result):
+    """ Writes all films in batches of the update file import """
+    start = time.time()
+    # the connection belongs to the thread of the import
+    database = StoreSQLite(importer=importer)
+    for offset in range(0, films, batchSize):
+        database.import_films([makeFilm(index, version) for index in range(offset, min(films, offset + batchSize))])
+    database.exit()
+    result.append(time.time() - start)
+
+
+def click(channel):
+    """ A click of the user: a new plugin process with its own connection """
+    start = time.time()
+    database = StoreSQLite()
+    database.getChannels()
+    shows = database.getShowsByChannnel(channel)
+    if len(shows) > 0:
+        database.getFilms(channel, shows[0][0])
+    database.exit()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the browse latency during an import')
+    parser.add_argument('--films', type=int, default=200000, help='number of films in the database')
+    parser.add_argument('--batch', type=int, default=10000, help='films per import batch')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between two clicks')
+    parser.add_argument('--legacy', action='store_true', help='connect with the former settings')
+    args = parser.parse_args()
+    datapath = tempfile.mkdtemp(prefix='mvbrowse')
+    try:
+        appContext.init()
+        appContext.initLogger(LoggerCommandline('bench', '0'))
+        appContext.initSettings(BenchSettings(datapath))
+        appContext.initNotifier(NotifierInterface())
+        appContext.initMonitor(MonitorInterface())
+        database = StoreSQLite(importer=True)
+        StoreSQLiteSetup(database).setupDatabase()
+        database.exit()
+        importFilms(True, args.films, args.batch, 0, [])
+        if args.legacy:
+            connection = sqlite3.connect(database.dbfile)
+            connection.execute('pragma journal_mode=delete')
+            connection.close()
+            storeSqlite.IMPORT_PRAGMAS[:] = LEGACY_PRAGMAS
+            storeSqlite.BROWSE_PRAGMAS[:] = LEGACY_PRAGMAS
+        # idle latency
+        idle = sorted(click(CHANNELS[index % len(CHANNELS)]) for index in range(20))
+        result = []
+        # the legacy settings have no separate importer connection
+        writer = threading.Thread(target=importFilms, args=(not args.legacy, args.films, args.batch, 1, result))
+        writer.start()
+        latencies = []
+        while writer.is_alive():
+            latencies.append(click(CHANNELS[len(latencies) % len(CHANNELS)]))
+            time.sleep(args.interval)
+        writer.join()
+        latencies.sort()
+        count = len(latencies)
+        print('{} settings, {} films'.format('legacy' if args.legacy else 'current', args.films))
+        print('idle:   p50 {:.0f} ms'.format(idle[len(idle) // 2] * 1000))
+        print('import: {:.1f} s, {} clicks, p50 {:.0f} ms, p95 {:.0f} ms, max {:.0f} ms'.format(
+            result[0] if result else 0, count,
+            latencies[count // 2] * 1000, latencies[int(count * 0.95)] * 1000, latencies[-1] * 1000
+        ))
+        return 0 if result else 1
+    finally:
+        shutil.rmtree(datapath, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the film list rendering
+
+Renders a page of 5000 films with FilmlistUi outside of Kodi. The
+xbmcgui and xbmcplugin modules are replaced by fake modules which
+only keep the generated items. Run it on a checkout of an older
+revision to compare.
+
+Usage: python tests/bench_filmlist_ui.py [--films 5000] [--repeat 7]
+
+SPDX-License-Identifier: MIT
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+try:
+    # Python 3.x
+    from urllib.parse import urlencode
+except ImportError:
+    # Python 2.x
+    from urllib import urlencode
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+import resources.lib.appContext as appContext
+import resources.lib.mvutils as mvutils
+from resources.lib.loggerCommandline import LoggerCommandline
+from resources.lib.settingsInterface import SettingsInterface
+from resources.lib.notifierInterface import NotifierInterface
+from resources.lib.monitorInterface import MonitorInterface
+
+FAKE_MODULES = {
+    'xbmc': 'def __getattr__(name):\n    return 0\n',
+    'xbmcaddon': 'def __getattr__(name):\n    return 0\n',
+    'xbmcvfs': 'def __getattr__(name):\n    return 0\n',
+    'xbmcgui': '''
+class ListItem(object):
+    def __init__(self, label='', path='', offscreen=False):
+        self.label = label
+        self.path = path
+        self.props = {}
+        self.info = None
+        self.art = None
+        self.menu = None
+
+    def setInfo(self, type, infoLabels):
+        self.info = infoLabels
+
+    def setProperty(self, key, value):
+        self.props[key] = value
+
+    def setArt(self, art):
+        self.art = art
+
+    def addContextMenuItems(self, items):
+        self.menu = items
+''',
+    'xbmcplugin': '''
+SORT_METHOD_UNSORTED, SORT_METHOD_TITLE, SORT_METHOD_DATE, SORT_METHOD_DATEADDED, SORT_METHOD_DURATION = range(5)
+ITEMS = []
+
+def setContent(handle, content):
+    pass
+
+def addSortMethod(handle, method):
+    pass
+
+def addDirectoryItems(handle, items, totalItems):
+    ITEMS[:] = items
+
+def endOfDirectory(handle, cacheToDisc=False):
+    pass
+'''
+}
+
+STRINGS = {
+    30921: 'Play with subtitles',
+    30922: 'Download movie',
+    30924: 'Download TV episode',
+    30968: 'Next page',
+    30990: 'Airdate: {0:s}[CR][CR]'
+}
+
+CHANNELS = ['ARD', 'ZDF', '3Sat', 'ARTE.DE', 'BR', 'HR', 'KiKA', 'MDR', 'NDR', 'ORF', 'PHOENIX', 'RBB', 'SR', 'SRF', 'SWR', 'WDR', 'ZDF-tivi', 'DW']
+
+
+class BenchSettings(SettingsInterface):
+    """ Settings of a page with all films """
+
+    def __init__(self, films):
+        self.films = films
+
+    def getMaxResults(self):
+        return self.films
+
+    def getFilmSortMethod(self):
+        return 0
+
+    def getContentType(self):
+        return 'movies'
+
+
+class BenchPlugin(object):
+    """ The parts of the plugin used by FilmlistUi """
+    addon_handle = 1
+    path = '/usr/share/kodi/addons/plugin.video.mediathekview'
+    base_url = 'plugin://plugin.video.mediathekview/'
+
+    def language(self, msgid):
+        return STRINGS[msgid]
+
+    def get_kodi_version(self):
+        return 18
+
+    def build_url(self, params):
+        return self.base_url + '?' + urlencode(mvutils.dict_to_utf(params))
+
+    def setViewId(self, viewId):
+        pass
+
+    def resolveViewId(self, viewType):
+        return -1
+
+
+def makeFilms(count):
+    """ Rows of the browse queries: idhash, title, showname, channel, ... """
+    rnd = random.Random(1)
+    return [[
+        '{:032x}'.format(rnd.getrandbits(128)), 'Title {}'.format(index), 'Show {}'.format(index % 300),
+        rnd.choice(CHANNELS), 'Description ' * 20, 1800, 1500000000 + index * 3600,
+        'https://example.org/sub/{}.xml'.format(index) if index % 3 else '',
+        'https://example.org/v/{}.mp4'.format(index), 'https://example.org/v/{}_sd.mp4'.format(index),
+        'https://example.org/v/{}_hd.mp4'.format(index)
+    ] for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the film list rendering')
+    parser.add_argument('--films', type=int, default=5000, help='number of films of the list')
+    parser.add_argument('--repeat', type=int, default=7, help='number of renderings, the fastest counts')
+    args = parser.parse_args()
+    fakepath = tempfile.mkdtemp(prefix='mvfilmlist')
+    try:
+        for (name, source) in FAKE_MODULES.items():
+            with open(os.path.join(fakepath, name + '.py'), 'w') as module:
+                module.write(source)
+        sys.path.insert(0, fakepath)
+        appContext.init()
+        appContext.initLogger(LoggerCommandline('bench', '0'))
+        appContext.initSettings(BenchSettings(args.films))
+        appContext.initNotifier(NotifierInterface())
+        appContext.initMonitor(MonitorInterface())
+        # pylint: disable=import-outside-toplevel,import-error
+        import xbmcplugin
+        from resources.lib.ui.filmlistUi import FilmlistUi
+        films = makeFilms(args.films)
+        filmlistUi = FilmlistUi(BenchPlugin())
+        best = None
+        for _ in range(args.repeat):
+            start = time.time()
+            filmlistUi.generate(films)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print('rendered {} films: {:.1f} ms'.format(len(xbmcplugin.ITEMS), best * 1000))
+        return 0 if len(xbmcplugin.ITEMS) == args.films else 1
+    finally:
+        shutil.rmtree(fakepath, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
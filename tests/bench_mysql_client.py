@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the client side of the MySQL import
+
+Measures what the MySQL store costs on the client without a server:
+- building the multi-row upsert of a batch, as the pure Python
+  connector does for executemany
+- writing the batch as a LOAD DATA file, as the bulk import does
+- translating a statement to the parameter style of the connector,
+  cached by the store and with str.replace
+
+The throughput against a server depends on the server and is not
+measured here. Requires mysql-connector-python.
+
+Usage: python tests/bench_mysql_client.py [--films 10000]
+
+SPDX-License-Identifier: MIT
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import timeit
+import argparse
+import binascii
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+import resources.lib.appContext as appContext
+from resources.lib.loggerCommandline import LoggerCommandline
+from resources.lib.settingsInterface import SettingsInterface
+from resources.lib.notifierInterface import NotifierInterface
+from resources.lib.monitorInterface import MonitorInterface
+
+
+def makeRows(count):
+    """ The parameters of the film upsert as prepared by the store """
+    rnd = random.Random(1)
+    return [(
+        binascii.unhexlify('{:032x}'.format(rnd.getrandbits(128))), 1600000000 + index, 'ARD', rnd.getrandbits(31),
+        'Tagesschau {}'.format(index % 300), 'Folge {} vom 12.03.2021 mit "Zitat"'.format(index), 1600000000, 900,
+        'Beschreibung ' * 20, 'https://example.org/sub{}.xml'.format(index), index % 50,
+        'video_{}_1280.mp4'.format(index), '12|540.mp4', '12|1920.mp4', 'T', '{:032x}'.format(index)
+    ) for index in range(count)]
+
+
+def best(function, repeat=3):
+    """ The fastest of `repeat` runs in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the client side of the MySQL import')
+    parser.add_argument('--films', type=int, default=10000, help='films per import batch')
+    args = parser.parse_args()
+    try:
+        # pylint: disable=import-outside-toplevel
+        from mysql.connector.connection import MySQLConnection
+        from mysql.connector.conversion import MySQLConverter
+        from mysql.connector.cursor import MySQLCursor
+        import resources.lib.storeMySql as storeMySql
+    except ImportError as err:
+        print('mysql-connector-python is required: {}'.format(err))
+        return 1
+    appContext.init()
+    appContext.initLogger(LoggerCommandline('bench', '0'))
+    appContext.initSettings(SettingsInterface())
+    appContext.initNotifier(NotifierInterface())
+    appContext.initMonitor(MonitorInterface())
+    store = storeMySql.StoreMySQL()
+    rows = makeRows(args.films)
+    # a cursor of an unconnected connection builds statements without a server
+    connection = MySQLConnection()
+    # pylint: disable=protected-access
+    connection._sql_mode = ''
+    connection.converter = MySQLConverter('utf8mb4', True)
+    cursor = MySQLCursor(connection)
+    elapsed = best(lambda: cursor._batch_insert(store.sql_pStmtUpsert, rows))
+    print('multi-row upsert of {} films:     {:.3f} s'.format(args.films, elapsed))
+
+    def writeTsv():
+        tsvFile = io.StringIO()
+        for values in rows:
+            # the idhash is written as hex string
+            idhash = binascii.hexlify(values[0]).decode('ascii')
+            tsvFile.write(u'\t'.join([idhash] + [storeMySql._tsvValue(value) for value in values[1:]]) + u'\n')
+    elapsed = best(writeTsv)
+    print('LOAD DATA file of {} films:       {:.3f} s'.format(args.films, elapsed))
+    statement = 'SELECT idhash FROM film WHERE ' + ' AND '.join(['x = ?'] * 20)
+    number = 100000
+    replace = min(timeit.repeat(lambda: statement.replace('?', '%s'), number=number, repeat=3))
+    cached = min(timeit.repeat(lambda: store._translate(statement), number=number, repeat=3))
+    print('statement translation: str.replace {:.2f} us, cached {:.2f} us'.format(replace * 1e6 / number, cached * 1e6 / number))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the Filmliste parser
+
+Writes a synthetic Filmliste-akt and reads it with the streaming
+tokenizer of UpdateFileParser and with the former parser, which
+split the text at every "X" marker and decoded each record with
+json.loads. Both must return the same records.
+
+Usage: python tests/bench_update_parser.py [--records 700000] [--repeat 3]
+
+SPDX-License-Identifier: MIT
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from codecs import open as codecsOpen
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from resources.lib.loggerCommandline import LoggerCommandline
+from resources.lib.updateFileParser import UpdateFileParser
+
+HEADER = '{"Filmliste":["30.08.2020, 11:13","30.08.2020, 09:13","3","MSearch [Vers.: 3.1.139]","d93c9794acaf3e482d42c24e513f78a8"],"Filmliste":["Sender","Thema","Titel","Datum","Zeit","Dauer","Größe [MB]","Beschreibung","Url","Website","Url Untertitel","Url RTMP","Url Klein","Url RTMP Klein","Url HD","Url RTMP HD","DatumL","Url History","Geo","neu"]'
+
+
+class LegacyParser(object):
+    """ The parser before the streaming tokenizer """
+
+    def __init__(self, bufferSize, inputFilename):
+        self.bufferSize = bufferSize
+        self.filename = inputFilename
+        self.filehandle = None
+        self.buffer = ''
+        self.cPosition = 0
+
+    def init(self):
+        self.filehandle = codecsOpen(self.filename, 'rb', encoding='utf-8')
+        self.buffer = self.filehandle.read(self.bufferSize)
+
+    def next(self, aWord):
+        while self.cPosition > -1:
+            index = self.buffer.find(aWord, self.cPosition)
+            if index > -1:
+                rtBuffer = self.buffer[self.cPosition:index]
+                self.cPosition = index + len(aWord)
+                return rtBuffer
+            nbuffer = self.filehandle.read(self.bufferSize)
+            if len(nbuffer) == 0:
+                rStr = self.buffer[self.cPosition:]
+                self.cPosition = -1
+                return rStr
+            self.buffer = self.buffer[self.cPosition:] + nbuffer
+            self.cPosition = 0
+        return ''
+
+    def records(self):
+        """ Generator returning each "X" array as the importer decoded it """
+        self.next('"X":')
+        while True:
+            aPart = self.next('"X":').strip()
+            if len(aPart) == 0:
+                return
+            aPart = '{"X":' + aPart
+            yield json.loads(aPart[0:-1] + '}')['X']
+
+    def close(self):
+        self.filehandle.close()
+
+
+def writeFilmliste(filename, records):
+    """ Writes a Filmliste with records similar to the real list """
+    rnd = random.Random(1)
+    with codecsOpen(filename, 'w', encoding='utf-8') as output:
+        output.write(HEADER)
+        for i in range(records):
+            sender = ('ARD' if i % 1000 == 0 else '') if i % 5000 else 'ZDF'
+            thema = 'Thema {}'.format(i // 7) if i % 7 == 0 else ''
+            record = [
+                sender, thema, 'Titel "{}" äöü'.format(i), '30.08.2020', '11:13:00',
+                '00:{:02d}:00'.format(rnd.randint(0, 59)), '120', 'Beschreibung ' * 20 + str(i),
+                'https://media.example.org/videos/{}/file_{}_hd.mp4'.format(i % 977, i),
+                'https://www.example.org/{}'.format(i), '', '', '42|file_{}_sd.mp4'.format(i), '',
+                '42|file_{}_xl.mp4'.format(i), '', str(1598778780 + i), '', 'DE', 'false'
+            ]
+            output.write(',"X":' + json.dumps(record, ensure_ascii=False))
+        output.write('}')
+
+
+def run(createParser, repeat):
+    """ Reads all records and returns (fastest seconds, count, last record) """
+    times = []
+    for _ in range(repeat):
+        parser = createParser()
+        start = time.time()
+        parser.init()
+        count = 0
+        last = None
+        for record in parser.records():
+            count += 1
+            last = record
+        parser.close()
+        times.append(time.time() - start)
+    return (min(times), count, last)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the Filmliste parser')
+    parser.add_argument('--records', type=int, default=700000, help='number of records of the synthetic list')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per parser, the fastest counts')
+    args = parser.parse_args()
+    logger = LoggerCommandline('bench', '0')
+    (handle, filename) = tempfile.mkstemp(prefix='Filmliste-akt-')
+    os.close(handle)
+    try:
+        writeFilmliste(filename, args.records)
+        print('Filmliste: {} records, {} MB'.format(args.records, os.path.getsize(filename) // 1000000))
+        (legacyTime, legacyCount, legacyLast) = run(lambda: LegacyParser(512000, filename), args.repeat)
+        print('former parser + json.loads: {:.2f} s'.format(legacyTime))
+        (newTime, newCount, newLast) = run(lambda: UpdateFileParser(logger, 512000, filename), args.repeat)
+        print('streaming tokenizer:        {:.2f} s'.format(newTime))
+        if (legacyCount, legacyLast) != (newCount, newLast) or newCount != args.records:
+            print('Mismatch: {} / {} records'.format(legacyCount, newCount))
+            return 1
+        return 0
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Import time check of the main menu
+
+Every click in Kodi starts the plugin from scratch, so the imports of
+addon.py are paid on each menu page. Runs them with `python -X importtime`
+against fake xbmc modules and fails if the main menu path pulls in the
+stores, the user interfaces or the downloader, or if it goes over the
+time budget.
+
+Usage: python -m unittest discover -s tests
+       python tests/test_import_time.py
+
+SPDX-License-Identifier: MIT
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# the imports of addon.py
+MAIN_MENU_IMPORTS = [
+    'resources.lib.plugin',
+    'resources.lib.loggerKodi',
+    'resources.lib.settingsKodi',
+    'resources.lib.notifierKodi',
+    'resources.lib.appContext'
+]
+
+# modules only the other modes may import
+FORBIDDEN_MODULES = [
+    'sqlite3',
+    'mysql',
+    'resources.lib.storeSqlite',
+    'resources.lib.storeMySql',
+    'resources.lib.storeQuery',
+    'resources.lib.storeCache',
+    'resources.lib.downloader',
+    'resources.lib.extendedSearch',
+    'resources.lib.ttml2srt'
+]
+
+# cumulative budget of the main menu imports in microseconds
+BUDGET_US = int(os.environ.get('MV_IMPORT_BUDGET_US', '80000'))
+
+# repeated runs, the fastest counts
+RUNS = 3
+
+KODI_MODULES = ['xbmc', 'xbmcaddon', 'xbmcgui', 'xbmcplugin', 'xbmcvfs']
+
+
+def measure(fakepath):
+    """
+    Imports the main menu modules in a fresh interpreter and
+    returns the parsed `-X importtime` output as a list of
+    (name, cumulative microseconds, nesting level)
+
+    Args:
+        fakepath(str): directory of the fake Kodi modules
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([fakepath, ROOT])
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(MAIN_MENU_IMPORTS)],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    (_, stderr) = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(stderr)
+    modules = []
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        level = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(fields[1]), level))
+    return modules
+
+
+class TestImportTime(unittest.TestCase):
+    """ Import time of the main menu path """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fakepath = tempfile.mkdtemp(prefix='mvimport')
+        for name in KODI_MODULES:
+            with open(os.path.join(cls.fakepath, name + '.py'), 'w') as module:
+                module.write('def __getattr__(name):\n    return 0\n')
+        # script.module.myconnpy is not installed outside of Kodi
+        os.makedirs(os.path.join(cls.fakepath, 'mysql', 'connector'))
+        for name in ['mysql', os.path.join('mysql', 'connector')]:
+            with open(os.path.join(cls.fakepath, name, '__init__.py'), 'w') as module:
+                module.write('def __getattr__(name):\n    return 0\n')
+        # the first run compiles the byte code
+        measure(cls.fakepath)
+        cls.runs = [measure(cls.fakepath) for _ in range(RUNS)]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.fakepath, ignore_errors=True)
+
+    def test_forbidden_modules(self):
+        """ The main menu needs none of the stores, interfaces and downloads """
+        names = [name for (name, _, _) in self.runs[0]]
+        for forbidden in FORBIDDEN_MODULES:
+            found = [name for name in names if name == forbidden or name.startswith(forbidden + '.')]
+            self.assertEqual(found, [], 'main menu imports {}'.format(forbidden))
+
+    def test_budget(self):
+        """ The main menu imports stay in the time budget """
+        totals = [sum(cumulative for (_, cumulative, level) in run if level == 0) for run in self.runs]
+        self.assertLessEqual(
+            min(totals), BUDGET_US,
+            'main menu imports take {} us, budget {} us'.format(min(totals), BUDGET_US)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Query plan check of the browse queries
+
+Builds a small database of the current schema version and runs
+EXPLAIN QUERY PLAN on every SELECT the SQLite store issues for the
+browse functions. Fails if one of them scans the film table without
+an index.
+
+Usage: python -m unittest discover -s tests
+
+SPDX-License-Identifier: MIT
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+import resources.lib.appContext as appContext
+from resources.lib.loggerCommandline import LoggerCommandline
+from resources.lib.settingsInterface import SettingsInterface
+from resources.lib.notifierInterface import NotifierInterface
+from resources.lib.monitorInterface import MonitorInterface
+
+CHANNELS = ['ARD', 'ZDF', 'ARTE.DE', '3Sat']
+
+
+class TestSettings(SettingsInterface):
+    """ Settings of the checked query variant """
+
+    def __init__(self, datapath):
+        self.datapath = datapath
+        self.variant = (True, 0, 0, False)
+
+    def getDatapath(self):
+        return self.datapath
+
+    def getNoFutur(self):
+        return self.variant[0]
+
+    def getMinLength(self):
+        return self.variant[1]
+
+    def getRecentMode(self):
+        return self.variant[2]
+
+    def getGroupShow(self):
+        return self.variant[3]
+
+    def getCaching(self):
+        return False
+
+
+class TestQueryPlans(unittest.TestCase):
+    """ No browse query may scan the film table """
+
+    # nofuture, minlength, recentmode, groupshow
+    VARIANTS = [
+        (True, 0, 0, False),
+        (False, 0, 0, False),
+        (True, 10, 1, True),
+        (False, 10, 1, False),
+        (True, 0, 1, True)
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.datapath = tempfile.mkdtemp()
+        cls.settings = TestSettings(cls.datapath)
+        appContext.init()
+        appContext.initLogger(LoggerCommandline('test', '0'))
+        appContext.initSettings(cls.settings)
+        appContext.initNotifier(NotifierInterface())
+        appContext.initMonitor(MonitorInterface())
+        # pylint: disable=import-outside-toplevel
+        from resources.lib.storeSqlite import StoreSQLite
+        from resources.lib.storeSqliteSetup import StoreSQLiteSetup
+        cls.database = StoreSQLite(importer=True)
+        StoreSQLiteSetup(cls.database).setupDatabase()
+        cls.database.import_films([_makeFilm(index) for index in range(2000)])
+        cls.database.exit()
+        cls.storeClass = StoreSQLite
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.datapath, ignore_errors=True)
+
+    def _checkPlans(self, name, query):
+        for variant in self.VARIANTS:
+            self.settings.variant = variant
+            # the conditions are built from the settings by the store
+            database = self.storeClass()
+            connection = database.getConnection()
+            statements = []
+            connection.set_trace_callback(statements.append)
+            try:
+                query(database)
+            finally:
+                connection.set_trace_callback(None)
+            statements = [stmt for stmt in statements if stmt.lstrip().upper().startswith('SELECT')]
+            self.assertTrue(len(statements) > 0, '{} issued no query'.format(name))
+            for stmt in statements:
+                plan = [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + stmt).fetchall()]
+                scans = [step for step in plan if step.startswith('SCAN film') and 'INDEX' not in step]
+                self.assertEqual(scans, [], '{} {} scans the film table: {}\n{}'.format(name, variant, ' | '.join(plan), stmt))
+            database.exit()
+
+    def test_getChannels(self):
+        self._checkPlans('getChannels', lambda db: db.getChannels())
+
+    def test_getChannelsRecent(self):
+        self._checkPlans('getChannelsRecent', lambda db: db.getChannelsRecent())
+
+    def test_getShowsByChannnel(self):
+        self._checkPlans('getShowsByChannnel', lambda db: db.getShowsByChannnel('ARD'))
+
+    def test_getShowsByLetter(self):
+        self._checkPlans('getShowsByLetter', lambda db: db.getShowsByLetter('S'))
+
+    def test_getStartLettersOfShows(self):
+        self._checkPlans('getStartLettersOfShows', lambda db: db.getStartLettersOfShows())
+
+    def test_getLivestreams(self):
+        self._checkPlans('getLivestreams', lambda db: db.getLivestreams())
+
+    def test_getRecentFilms(self):
+        self._checkPlans('getRecentFilms', lambda db: db.getRecentFilms())
+
+    def test_getRecentFilmsOfChannel(self):
+        self._checkPlans('getRecentFilms', lambda db: db.getRecentFilms('ARD'))
+
+    def test_getFilms(self):
+        self._checkPlans('getFilms', lambda db: db.getFilms('ARD', '{:08x}'.format(_showId(1))))
+
+    def test_retrieve_film_info(self):
+        self._checkPlans('retrieve_film_info', lambda db: db.retrieve_film_info('{:032x}'.format(7)))
+
+
+def _showId(show):
+    return show * 7919 + 1
+
+
+def _makeFilm(index):
+    # a record as built by the update file import
+    channel = CHANNELS[index % len(CHANNELS)]
+    show = index % 97
+    showname = 'Livestream' if show == 0 else 'Show {} {}'.format(chr(ord('A') + show % 26), show)
+    aired = 1600000000 + index * 3600
+    return (
+        '{:032x}'.format(index), aired, channel, _showId(show), showname, 'Title {}'.format(index),
+        aired, 600 + index % 3000, 'Description {}'.format(index),
+        '', 'https://example.com/{}/'.format(channel), 'video{}.mp4'.format(index), '', '',
+        showname[0], '{:032x}'.format(index + 1000000)
+    )
+
+
+if __name__ == '__main__':
+    unittest.main()
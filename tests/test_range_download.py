@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the ranged download
+
+Runs RangeDownload against a local http.server which serves a file
+with or without range support and validators, drops connections
+and throttles ranges on request.
+
+Usage: python -m unittest discover -s tests
+
+SPDX-License-Identifier: MIT
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+import resources.lib.appContext as appContext
+from resources.lib.loggerCommandline import LoggerCommandline
+from resources.lib.settingsInterface import SettingsInterface
+from resources.lib.notifierInterface import NotifierInterface
+from resources.lib.monitorInterface import MonitorInterface
+from resources.lib.updateFileDownload import RangeDownload
+
+FILE_SIZE = 3 * 1024 * 1024 + 17
+BLOCK_SIZE = 65536
+
+
+class FileServer(ThreadingHTTPServer):
+    """ Serves `data` under every path """
+    daemon_threads = True
+
+    def __init__(self, data):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), FileHandler)
+        self.data = data
+        self.reset()
+
+    def reset(self):
+        """ A server with range support and an ETag """
+        self.etag = '"v1"'
+        self.ranges = True
+        # connections are closed after this number of bytes
+        self.dropAfter = 0
+        # delay per block of the ranges not starting at 0
+        self.delay = 0
+        self.requests = []
+
+    def getUrl(self):
+        return 'http://127.0.0.1:{}/Filmliste-akt.xz'.format(self.server_address[1])
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """ HEAD and GET with optional Range and If-Range support """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        if self.server.etag is not None and self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self._sendHeaders(200, 0, len(self.server.data))
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers.items()))
+        (start, end, code) = (0, len(server.data), 200)
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match and server.ranges and self.headers.get('If-Range', server.etag) == server.etag:
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(server.data)
+            code = 206
+        self._sendHeaders(code, start, end)
+        sent = 0
+        for position in range(start, end, BLOCK_SIZE):
+            block = server.data[position:min(end, position + BLOCK_SIZE)]
+            if server.dropAfter and sent + len(block) > server.dropAfter:
+                self.wfile.write(block[:server.dropAfter - sent])
+                self.close_connection = True
+                return
+            if start > 0 and server.delay:
+                time.sleep(server.delay)
+            self.wfile.write(block)
+            sent += len(block)
+
+    def _sendHeaders(self, code, start, end):
+        self.send_response(code)
+        self.send_header('Content-Length', str(end - start))
+        if self.server.etag is not None:
+            self.send_header('ETag', self.server.etag)
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if code == 206:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end - 1, len(self.server.data)))
+        self.end_headers()
+
+
+class TestRangeDownload(unittest.TestCase):
+    """ Downloads from the local server """
+
+    @classmethod
+    def setUpClass(cls):
+        appContext.init()
+        appContext.initLogger(LoggerCommandline('test', '0'))
+        appContext.initSettings(SettingsInterface())
+        appContext.initNotifier(NotifierInterface())
+        appContext.initMonitor(MonitorInterface())
+        cls.data = os.urandom(FILE_SIZE)
+        cls.server = FileServer(cls.data)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.reset()
+        self.path = tempfile.mkdtemp(prefix='mvdownload')
+        self.filename = os.path.join(self.path, 'Filmliste-akt.xz')
+        self.hooks = []
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _download(self, segments=1, **kwargs):
+        download = RangeDownload(
+            self.server.getUrl(),
+            self.filename,
+            reporthook=lambda blockcount, blocksize, totalsize: self.hooks.append(blockcount * blocksize),
+            segments=segments,
+            backoff=0.01,
+            **kwargs
+        )
+        # three segments of the small test file
+        download.MIN_SEGMENT_SIZE = BLOCK_SIZE
+        return download
+
+    def _assertDownloaded(self):
+        with open(self.filename, 'rb') as downloaded:
+            self.assertTrue(downloaded.read() == self.data, 'downloaded file differs')
+        self.assertFalse(os.path.exists(self.filename + '.part'))
+        self.assertFalse(os.path.exists(self.filename + '.part.json'))
+
+    def test_segments(self):
+        download = self._download(3)
+        self.assertTrue(download.download())
+        self._assertDownloaded()
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(sorted(request['Range'].split('-')[0] for request in self.server.requests), ['bytes=0', 'bytes=1048581', 'bytes=2097162'])
+        self.assertTrue(all(request['If-Range'] == '"v1"' for request in self.server.requests))
+        self.assertEqual(download.getValidator(), '"v1"')
+
+    def test_hooks_after_first_segment(self):
+        # the first segment is complete long before the others
+        self.server.delay = 0.05
+        start = time.time()
+        self._download(3).download()
+        elapsed = time.time() - start
+        self._assertDownloaded()
+        self.assertGreater(elapsed, 0.5)
+        # the hooks are called about every 0.25 sec
+        self.assertLess(len(self.hooks), elapsed / 0.25 + 10)
+
+    def test_ranges_without_validator(self):
+        self.server.etag = None
+        self.assertTrue(self._download(3).download())
+        self._assertDownloaded()
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertNotIn('Range', self.server.requests[0])
+        self.assertNotIn('If-Range', self.server.requests[0])
+
+    def test_no_ranges(self):
+        self.server.ranges = False
+        self.assertTrue(self._download(3).download())
+        self._assertDownloaded()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retry(self):
+        self.server.dropAfter = 1024 * 1024
+        self.assertTrue(self._download(1).download())
+        self._assertDownloaded()
+        self.assertEqual([request['Range'] for request in self.server.requests], [
+            'bytes=0-3145744', 'bytes=1048576-3145744', 'bytes=2097152-3145744', 'bytes=3145728-3145744'
+        ])
+
+    def test_retry_without_ranges(self):
+        self.server.ranges = False
+        self.server.dropAfter = 1024 * 1024
+        with self.assertRaises(IOError):
+            self._download(1, retries=2).download()
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_resume(self):
+        self.server.dropAfter = 1024 * 1024
+        with self.assertRaises(IOError):
+            self._download(1, retries=0).download()
+        self.assertTrue(os.path.exists(self.filename + '.part.json'))
+        self.server.dropAfter = 0
+        self.assertTrue(self._download(1).download())
+        self._assertDownloaded()
+        self.assertEqual(self.server.requests[-1]['Range'], 'bytes=1048576-3145744')
+
+    def test_resume_changed_file(self):
+        self.server.dropAfter = 1024 * 1024
+        with self.assertRaises(IOError):
+            self._download(1, retries=0).download()
+        self.server.reset()
+        self.server.etag = '"v2"'
+        self.assertTrue(self._download(1).download())
+        self._assertDownloaded()
+        self.assertEqual([request['Range'] for request in self.server.requests], ['bytes=0-3145744'])
+
+    def test_not_modified(self):
+        self.assertFalse(self._download(3, validator='"v1"').download())
+        self.assertEqual(self.server.requests, [])
+        self.assertFalse(os.path.exists(self.filename))
+
+
+if __name__ == '__main__':
+    unittest.main()